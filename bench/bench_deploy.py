@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Benchmark the steps of a deploy against an in-process S3/CloudFront stand-in (see fake_aws.py).
+
+Runs on synthetic trees of different shapes, with no network access needed:
+- tiny: many small files, a hundred per directory.
+- huge: a few large files, uploaded in multiple parts.
+- deep: files spread over a deeply nested directory chain.
+
+For each shape, the files are found (find_local_files), mapped (map_local_to_remote),
+uploaded (upload_files), mapped again against the uploaded version and copied
+(as an incremental deploy does), and a distribution is updated (cloudfront.update).
+
+Usage: bench/bench_deploy.py [--shapes tiny,huge,deep] [--scale F] [--latency MS] [--bandwidth SIZE]
+                             [--request-rate N] [--concurrency N] [--adaptive] [--repeat N] [--json FILE] [--keep DIR]
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import fake_aws  # noqa: E402
+import cli  # noqa: E402
+from static_deployer.common import metrics, types, utils  # noqa: E402
+from static_deployer.providers.cdn import cloudfront  # noqa: E402
+from static_deployer.providers.storage import s3bucket  # noqa: E402
+
+SHAPES = ('tiny', 'huge', 'deep')
+BUCKET_NAME = 'bench-bucket'
+DISTRIBUTION_ID = 'EBENCH'
+ORIGIN_NAME = 'website'
+EXTENSIONS = ['html', 'js', 'css', 'json', 'svg', 'png']
+# Blocks repeated to fill large files, so creating them does not dominate the run.
+BLOCK_SIZE = 1024 * 1024
+
+
+def write_file(path: str, size: int, block: bytes) -> None:
+    with open(path, 'wb') as f:
+        while size > 0:
+            f.write(block[:size])
+            size -= len(block)
+
+
+def make_tree(root_dir: str, shape: str, scale: float, rng: random.Random) -> None:
+    """Create a synthetic tree of the given shape, with `scale` times the default number (or size) of files."""
+    block = rng.getrandbits(BLOCK_SIZE * 8).to_bytes(BLOCK_SIZE, 'little')
+    if shape == 'tiny':
+        num_files = max(1, int(20000 * scale))
+        for index in range(num_files):
+            dir_path = os.path.join(root_dir, f'dir{index // 1000}', f'sub{index // 100 % 10}')
+            os.makedirs(dir_path, exist_ok=True)
+            write_file(os.path.join(dir_path, f'file{index}.{EXTENSIONS[index % len(EXTENSIONS)]}'),
+                       rng.randint(256, 4096), block)
+    elif shape == 'huge':
+        for index in range(4):
+            write_file(os.path.join(root_dir, f'video{index}.mp4'), max(1, int(64 * 1024 * 1024 * scale)), block)
+    elif shape == 'deep':
+        num_files = max(1, int(2000 * scale))
+        depth = 40
+        dir_path = root_dir
+        for index in range(num_files):
+            if index % (num_files // depth or 1) == 0:
+                dir_path = os.path.join(dir_path, f'level{index}')
+                os.makedirs(dir_path, exist_ok=True)
+            write_file(os.path.join(dir_path, f'file{index}.{EXTENSIONS[index % len(EXTENSIONS)]}'),
+                       rng.randint(1024, 64 * 1024), block)
+    else:
+        raise ValueError(f'Unknown shape: {shape}')
+
+
+class Result(object):
+    def __init__(self, shape: str, step: str, items: int, seconds: float, num_bytes: int = 0,
+                 latency: Optional[metrics.Histogram] = None, requests: int = 0):
+        self.shape = shape
+        self.step = step
+        self.items = items
+        self.seconds = seconds
+        self.num_bytes = num_bytes
+        self.latency = latency
+        self.requests = requests
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'shape': self.shape,
+            'step': self.step,
+            'items': self.items,
+            'seconds': self.seconds,
+            'items_per_second': self.items / self.seconds if self.seconds else None,
+            'bytes_per_second': self.num_bytes / self.seconds if self.seconds and self.num_bytes else None,
+            'latency': self.latency.to_dict() if self.latency else None,
+            'requests': self.requests,
+        }
+
+    def format(self) -> str:
+        def milliseconds(q: float) -> str:
+            value = self.latency.quantile(q) if self.latency else None
+            return f'{value * 1000:8.1f}' if value is not None else f'{"-":>8}'
+
+        items_per_second = self.items / self.seconds if self.seconds else 0
+        mib_per_second = f'{self.num_bytes / self.seconds / 1024 / 1024:9.2f}' if self.num_bytes and self.seconds else f'{"-":>9}'
+        return (f'{self.shape:<6} {self.step:<10} {self.items:>8} {self.seconds:9.3f} {items_per_second:11,.0f}'
+                f' {mib_per_second} {milliseconds(0.5)} {milliseconds(0.9)} {milliseconds(0.99)} {self.requests:>9}')
+
+
+HEADER = (f'{"shape":<6} {"step":<10} {"items":>8} {"seconds":>9} {"items/s":>11} {"MiB/s":>9}'
+          f' {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"requests":>9}')
+
+
+def measure(repeat: int, func: Callable[[Any], Any], setup: Callable[[int], Any] = lambda run_index: run_index) -> Tuple[float, Any]:
+    """Run `func(setup(run_index))` `repeat` times, returning (seconds, result) of the run with the median time.
+
+    Only `func` is timed.
+    """
+    runs = []
+    for run_index in range(repeat):
+        argument = setup(run_index)
+        started_at = time.perf_counter()
+        result = func(argument)
+        runs.append((time.perf_counter() - started_at, result))
+    runs.sort(key=lambda run: run[0])
+    return runs[len(runs) // 2]
+
+
+def bench_shape(shape: str, root_dir: str, backend: fake_aws.FakeAws, options: types.UploadOptions,
+                repeat: int) -> List[Result]:
+    results = []
+    backend.reset_counts()
+    total_bytes = 0
+
+    seconds, local_files = measure(repeat, lambda _: cli.find_local_files(root_dir, '**'))
+    results.append(Result(shape, 'find', len(local_files), seconds))
+
+    seconds, file_mappings = measure(repeat, lambda _: cli.map_local_to_remote(root_dir, 'base', sorted(local_files)))
+    results.append(Result(shape, 'map', len(file_mappings), seconds))
+    total_bytes = sum(file_mapping.size for file_mapping in file_mappings)
+
+    def prepare_upload(run_index: int):
+        prefix = f'{shape}/upload{run_index}'
+        mappings = cli.map_local_to_remote(root_dir, prefix, local_files)
+        metrics.reset()
+        backend.reset_counts()
+        return prefix, mappings
+
+    def upload(argument):
+        prefix, mappings = argument
+        success = s3bucket.upload_files(root_dir, BUCKET_NAME, mappings, options)
+        return success, prefix, metrics.current().histograms.get('upload_seconds'), sum(backend.reset_counts().values())
+
+    seconds, (success, base_prefix, latency, requests) = measure(repeat, upload, prepare_upload)
+    if not success:
+        raise RuntimeError('Upload failed')
+    results.append(Result(shape, 'upload', len(file_mappings), seconds, total_bytes, latency, requests))
+
+    # Incremental deploy: unchanged files are hashed, then copied server-side.
+    base_objects = s3bucket.index_objects(BUCKET_NAME, base_prefix)
+    transfer_policy = s3bucket.TransferPolicy(options)
+    seconds, mappings = measure(repeat, lambda _: cli.map_local_to_remote(
+        root_dir, f'{shape}/copy', local_files, base_objects=base_objects, transfer_policy=transfer_policy))
+    results.append(Result(shape, 'map+hash', len(mappings), seconds, total_bytes))
+
+    def prepare_copy(run_index: int):
+        mappings = cli.map_local_to_remote(root_dir, f'{shape}/copy{run_index}', local_files,
+                                           base_objects=base_objects, transfer_policy=transfer_policy)
+        metrics.reset()
+        backend.reset_counts()
+        return mappings
+
+    def copy(mappings):
+        success = s3bucket.upload_files(root_dir, BUCKET_NAME, mappings, options)
+        return success, metrics.current().histograms.get('copy_seconds'), sum(backend.reset_counts().values())
+
+    seconds, (success, latency, requests) = measure(repeat, copy, prepare_copy)
+    if not success:
+        raise RuntimeError('Copy failed')
+    results.append(Result(shape, 'copy', len(file_mappings), seconds, total_bytes, latency, requests))
+
+    def update(run_index: int):
+        success = cloudfront.update(DISTRIBUTION_ID, ORIGIN_NAME, f'/{base_prefix}', paths_to_invalidate=['/*'])
+        return success, sum(backend.reset_counts().values())
+
+    seconds, (success, requests) = measure(repeat, update, lambda run_index: backend.reset_counts())
+    if not success:
+        raise RuntimeError('Distribution update failed')
+    results.append(Result(shape, 'cdn', 1, seconds, requests=requests))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shapes', default=','.join(SHAPES), help=f'comma separated shapes of trees ({", ".join(SHAPES)})')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number (or size, for huge) of files')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated latency of each request, in milliseconds')
+    parser.add_argument('--bandwidth', default=None, help='simulated bandwidth of each connection (examples: 512KB 10MB)')
+    parser.add_argument('--request-rate', type=float, default=None,
+                        help='S3 requests per second above which the stand-in answers 503 SlowDown')
+    parser.add_argument('--deploy-seconds', type=float, default=0.0, help='time a distribution update takes to deploy')
+    parser.add_argument('--concurrency', type=int, default=types.UploadOptions().concurrency, help='files uploaded at the same time')
+    parser.add_argument('--adaptive', action='store_true', help='adapt the concurrency to the throttling of S3')
+    parser.add_argument('--repeat', type=int, default=1, help='run each step this many times and report the median')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the file sizes and contents')
+    parser.add_argument('--json', default=None, help='also write the results to this file, as JSON')
+    parser.add_argument('--keep', default=None, help='create (or reuse) the trees in this directory and keep them')
+    parser.add_argument('--verbose', action='store_true', help='show the logs of the deploy steps')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    backend = fake_aws.FakeAws(
+        latency=args.latency / 1000,
+        bandwidth=utils.size_string_to_bytes(args.bandwidth) if args.bandwidth else None,
+        deploy_seconds=args.deploy_seconds,
+        origin_names=(ORIGIN_NAME,),
+        request_rate=args.request_rate,
+    )
+    backend.install()
+    # The stand-in deploys in a known time, there is no need to start polling slowly.
+    cloudfront.POLL_INITIAL_DELAY = min(cloudfront.POLL_INITIAL_DELAY, max(args.deploy_seconds / 10, 0.01))
+    options = types.UploadOptions(concurrency=args.concurrency, adaptive_concurrency=args.adaptive)
+
+    base_dir = args.keep or tempfile.mkdtemp(prefix='bench-deploy-')
+    results = []
+    try:
+        print(f'latency={args.latency}ms bandwidth={args.bandwidth or "unlimited"}'
+              f' request_rate={args.request_rate or "unlimited"} concurrency={args.concurrency}'
+              f'{" (adaptive)" if args.adaptive else ""} scale={args.scale} repeat={args.repeat}')
+        print(HEADER)
+        for shape in utils.split_list(args.shapes):
+            root_dir = os.path.join(base_dir, f'{shape}-{args.scale}-{args.seed}')
+            if not os.path.isdir(root_dir):
+                os.makedirs(root_dir)
+                make_tree(root_dir, shape, args.scale, random.Random(args.seed))
+            for result in bench_shape(shape, root_dir, backend, options, args.repeat):
+                print(result.format())
+                results.append(result)
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'arguments': vars(args),
+                'python': sys.version.split()[0],
+                'cpus': os.cpu_count(),
+                'results': [result.to_dict() for result in results],
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Measure how long the command line tool takes to start, and check it against a budget.
+
+Each measure is taken in fresh interpreters, as pipelines invoking the tool do:
+- import: importing cli.py, which every command pays.
+- worker: importing the compression module, which every compression worker process pays.
+- help: running `cli.py --help`, interpreter startup included.
+
+Exits with an error if the median of a measure exceeds its budget, or if importing
+them loads a module that only some commands need (e.g. boto3), which no budget
+would catch on a fast machine.
+
+Usage: bench/bench_startup.py [--repeat N] [--import-budget MS] [--worker-budget MS] [--help-budget MS] [--json FILE]
+"""
+from typing import List, Tuple
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+CLI_PATH = os.path.join(SRC_DIR, 'cli.py')
+# Modules only imported when a command uses them.
+LAZY_MODULES = ('boto3', 'botocore', 's3transfer', 'asyncio', 'toml')
+CHILD_CODE = '''
+import sys, time
+sys.path.insert(0, {src_dir!r})
+started_at = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started_at
+print(elapsed, ','.join(name for name in {lazy_modules!r} if name in sys.modules))
+'''
+
+
+def time_import(module: str) -> Tuple[float, List[str]]:
+    """Import a module in a fresh interpreter.
+
+    :return: The time the import took, and the lazily imported modules it loaded.
+    """
+    code = CHILD_CODE.format(src_dir=SRC_DIR, module=module, lazy_modules=LAZY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE, text=True).stdout
+    elapsed, loaded = output.split(' ')
+    return float(elapsed), [name for name in loaded.strip().split(',') if name]
+
+
+def time_help() -> Tuple[float, List[str]]:
+    started_at = time.perf_counter()
+    subprocess.run([sys.executable, CLI_PATH, '--help'], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started_at, []
+
+
+def measure(name: str, func, repeat: int, budget_ms: float, *args) -> Tuple[float, bool]:
+    # The first run also compiles the bytecode of the modules, which is not measured.
+    func(*args)
+    results = [func(*args) for _ in range(repeat)]
+    median_ms = statistics.median(elapsed for elapsed, _ in results) * 1000
+    loaded = sorted({name for _, names in results for name in names})
+    passed = median_ms <= budget_ms and not loaded
+    print(f'{name:>8}: {median_ms:8.1f}ms (budget {budget_ms:.0f}ms, min {min(r[0] for r in results) * 1000:.1f}ms)'
+          f'{" loads " + ", ".join(loaded) if loaded else ""}{"" if passed else "  FAILED"}')
+    return median_ms, passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=9, help='fresh interpreters started for each measure')
+    parser.add_argument('--import-budget', type=float, default=200, help='budget of importing cli.py, in milliseconds')
+    parser.add_argument('--worker-budget', type=float, default=150,
+                        help='budget of importing the compression module, in milliseconds')
+    parser.add_argument('--help-budget', type=float, default=300, help='budget of running cli.py --help, in milliseconds')
+    parser.add_argument('--json', default=None, help='also write the results to this file, as JSON')
+    args = parser.parse_args()
+
+    print(f'python={sys.version.split()[0]} repeat={args.repeat}')
+    results = {
+        'import': measure('import', time_import, args.repeat, args.import_budget, 'cli'),
+        'worker': measure('worker', time_import, args.repeat, args.worker_budget, 'static_deployer.common.compression'),
+        'help': measure('help', time_help, args.repeat, args.help_budget),
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({name: {'median_ms': median_ms, 'passed': passed}
+                       for name, (median_ms, passed) in results.items()}, f, indent=2)
+    if not all(passed for _, passed in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Compare the single-pass scandir walker with the former glob based file search.
+
+Usage: bench/bench_walker.py [--files N] [--patterns PATTERNS] [--exclude-patterns PATTERNS] [--keep DIR]
+"""
+from typing import Set
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from static_deployer.common import walker  # noqa: E402
+
+EXTENSIONS = ['html', 'js', 'css', 'json', 'png', 'svg', 'map', 'woff2']
+
+
+def make_tree(root_dir: str, num_files: int, files_per_dir: int = 100, dirs_per_dir: int = 10) -> None:
+    """Create a synthetic tree of empty files, `files_per_dir` in each directory."""
+    created = 0
+    pending = [root_dir]
+    while created < num_files:
+        dir_path = pending.pop(0)
+        os.makedirs(dir_path, exist_ok=True)
+        for index in range(min(files_per_dir, num_files - created)):
+            extension = EXTENSIONS[(created + index) % len(EXTENSIONS)]
+            open(os.path.join(dir_path, f'file{index}.{extension}'), 'w').close()
+        created += files_per_dir
+        pending.extend(os.path.join(dir_path, f'dir{index}') for index in range(dirs_per_dir))
+
+
+def legacy_find_local_files(root_dir: str, glob_patterns: str) -> Set[str]:
+    """The glob based implementation the walker replaced: one recursive glob and one stat per match, per pattern."""
+    result = []
+    for pattern in glob_patterns.split(','):
+        for path in glob.glob(os.path.join(root_dir, pattern), recursive=True):
+            if not os.path.isdir(path):
+                os.stat(path)
+                result.append(path)
+    return set(result)
+
+
+def walker_find_local_files(root_dir: str, glob_patterns: str, exclude_patterns: str = None) -> Set[str]:
+    matcher = walker.PatternMatcher(glob_patterns.split(','), exclude_patterns.split(',') if exclude_patterns else None)
+    result = set()
+    for entry in walker.walk(root_dir, matcher):
+        entry.stat()
+        result.add(entry.path)
+    return result
+
+
+def measure(name: str, func, *args) -> Set[str]:
+    started_at = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started_at
+    print(f'{name:>8}: {len(result):>8} files in {elapsed:8.3f}s ({len(result) / elapsed if elapsed else 0:,.0f} files/s)')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=500000, help='number of files in the synthetic tree')
+    parser.add_argument('--patterns', default='**/*.html,**/*.js,**/*.css,**/*.json', help='comma separated glob patterns')
+    parser.add_argument('--exclude-patterns', default=None, help='comma separated glob patterns (walker only)')
+    parser.add_argument('--keep', default=None, help='create (or reuse) the tree in this directory and keep it')
+    args = parser.parse_args()
+
+    root_dir = args.keep or tempfile.mkdtemp(prefix='bench-walker-')
+    try:
+        if not os.path.exists(os.path.join(root_dir, 'file0.html')):
+            started_at = time.perf_counter()
+            make_tree(root_dir, args.files)
+            print(f'Created {args.files} files in {time.perf_counter() - started_at:.1f}s under {root_dir}')
+        print(f'patterns=\'{args.patterns}\'')
+        legacy = measure('glob', legacy_find_local_files, root_dir, args.patterns)
+        current = measure('walker', walker_find_local_files, root_dir, args.patterns)
+        if legacy != current:
+            print(f'Results differ: {len(legacy - current)} missing, {len(current - legacy)} extra', file=sys.stderr)
+            sys.exit(1)
+        if args.exclude_patterns:
+            measure('exclude', walker_find_local_files, root_dir, args.patterns, args.exclude_patterns)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark the warm-up of a distribution against a local HTTP stand-in of its edge (see fake_cdn.py).
+
+A synthetic version (pages spread over a directory tree, and assets of various
+sizes) is planned (plan_warmup), then fetched twice (warm_up): once cold, right
+after an invalidation, when every file is expected to be a miss, and once warm,
+when every file is expected to be a hit.
+
+Exits with an error if the reported hits and misses are not the expected ones,
+or if the client exceeds its concurrency or rate limit.
+
+Usage: bench/bench_warmup.py [--pages N] [--assets N] [--max-files N] [--concurrency N] [--max-rate N]
+                             [--latency MS] [--origin-latency MS] [--json FILE]
+"""
+from typing import Dict, List
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import fake_cdn  # noqa: E402
+from static_deployer.common import types  # noqa: E402
+from static_deployer.providers.cdn import warmup  # noqa: E402
+
+
+def build_entries(num_pages: int, num_assets: int) -> List[types.ManifestEntry]:
+    rng = random.Random(42)
+    entries = [types.ManifestEntry(path='index.html', size=8192, etag='0' * 32, content_type='text/html')]
+    for index in range(1, num_pages):
+        directory = '/'.join(f'section{rng.randrange(5)}' for _ in range(rng.randrange(1, 4)))
+        name = 'index.html' if index % 3 == 0 else f'page{index}.html'
+        entries.append(types.ManifestEntry(path=f'{directory}/{name}', size=rng.randrange(2048, 32768),
+                                           etag='0' * 32, content_type='text/html'))
+    for index in range(num_assets):
+        # Mostly small files, and a few large ones (fonts, images, bundles).
+        size = int(rng.paretovariate(1.2) * 4096)
+        entries.append(types.ManifestEntry(path=f'assets/file{index}.{rng.choice(["js", "css", "png", "woff2"])}',
+                                           size=min(size, 8 * 1024 * 1024), etag='0' * 32))
+    # Several pages may have been drawn with the same path.
+    return list({entry.path: entry for entry in entries}.values())
+
+
+def run(cdn: fake_cdn.FakeCdn, paths: List[str], settings: types.WarmupSettings, expected: str) -> Dict:
+    cdn.reset_requests()
+    report = warmup.warm_up(cdn.base_url, paths, settings)
+    times = [request_time for request_time, _, _ in cdn.requests]
+    # The rate is measured between the first and the last request, the first one being free.
+    rate = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+    passed = (getattr(report, expected) == len(paths) and report.errors == 0
+              and cdn.max_concurrent_requests <= settings.concurrency
+              and (not settings.max_rate or rate <= settings.max_rate * 1.1))
+    print(f'{expected:>8}: {report.summary()}, {len(paths) / report.elapsed:.0f} files/s,'
+          f' concurrency {cdn.max_concurrent_requests}, rate {rate:.0f}/s{"" if passed else "  FAILED"}')
+    return {'elapsed_seconds': report.elapsed, 'hits': report.hits, 'misses': report.misses, 'errors': report.errors,
+            'bytes': report.bytes, 'max_concurrent_requests': cdn.max_concurrent_requests, 'rate': rate,
+            'passed': passed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300, help='number of pages of the version')
+    parser.add_argument('--assets', type=int, default=3000, help='number of other files of the version')
+    parser.add_argument('--max-files', type=int, default=1000, help='maximum number of files fetched')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of files fetched at the same time')
+    parser.add_argument('--max-rate', type=float, default=None, help='maximum number of files fetched per second')
+    parser.add_argument('--latency', type=float, default=5, help='latency of each request, in milliseconds')
+    parser.add_argument('--origin-latency', type=float, default=20, help='extra latency of each miss, in milliseconds')
+    parser.add_argument('--json', default=None, help='also write the results to this file, as JSON')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    entries = build_entries(args.pages, args.assets)
+    cdn = fake_cdn.FakeCdn({entry.path: entry.size for entry in entries},
+                           latency=args.latency / 1000, origin_latency=args.origin_latency / 1000)
+    settings = types.WarmupSettings(max_files=args.max_files, concurrency=args.concurrency, max_rate=args.max_rate)
+    paths = warmup.plan_warmup(lambda: entries, settings.max_files)
+    num_pages = sum(1 for entry in entries if warmup.is_page(entry))
+    print(f'files={len(entries)} pages={num_pages} planned={len(paths)} concurrency={settings.concurrency}'
+          f' max_rate={settings.max_rate} first={paths[:3]}')
+
+    cdn.start()
+    try:
+        results = {
+            'cold': run(cdn, paths, settings, 'misses'),
+            'warm': run(cdn, paths, settings, 'hits'),
+        }
+    finally:
+        cdn.stop()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not all(result['passed'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+"""In-process stand-in for the S3 and CloudFront APIs used by static-deployer.
+
+Requests are answered from memory right before botocore would send them, so
+everything else (parameter validation, serialization, signing, checksums,
+retries, response parsing and the s3transfer machinery) runs for real, and
+the numbers measured are those of the client side of a deploy. A per-request
+latency and a per-connection bandwidth can be simulated to mimic a network, and
+a request rate above which S3 answers 503 SlowDown, to mimic a hot prefix.
+
+Usage:
+    backend = FakeAws(latency=0.02)
+    backend.install()  # Every boto3 client created afterwards uses it.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from botocore.awsrequest import AWSResponse
+from email.utils import formatdate
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+import base64
+import bisect
+import boto3
+import datetime
+import hashlib
+import io
+import itertools
+import os
+import threading
+import time
+import zlib
+
+S3_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+CLOUDFRONT_NAMESPACE = 'http://cloudfront.amazonaws.com/doc/2020-05-31/'
+# The data of larger objects is not kept, only their size and ETag.
+MAX_KEPT_OBJECT_SIZE = 1024 * 1024
+
+
+class _RawBody(io.BytesIO):
+    """Stands for the urllib3 response botocore reads the body from."""
+
+    def stream(self, **kwargs):
+        yield self.getvalue()
+
+
+def _response(status_code: int, headers: Optional[Dict[str, str]] = None, body: bytes = b'') -> AWSResponse:
+    return AWSResponse('', status_code, {'Content-Length': str(len(body)), **(headers or {})}, _RawBody(body))
+
+
+def _xml(root: str, namespace: str, content: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{namespace}">{content}</{root}>'.encode('utf-8')
+
+
+def _element(name: str, value: Any) -> str:
+    return f'<{name}>{escape(str(value))}</{name}>'
+
+
+def _error(status_code: int, code: str, message: str, namespace: str = S3_NAMESPACE) -> AWSResponse:
+    content = _element('Code', code) + _element('Message', message)
+    if namespace == CLOUDFRONT_NAMESPACE:
+        return _response(status_code, body=_xml('ErrorResponse', namespace, f'<Error>{content}</Error>'))
+    return _response(status_code, body=f'<Error>{content}</Error>'.encode('utf-8'))
+
+
+def _timestamp(value: float) -> str:
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _read_headers(request) -> Dict[str, str]:
+    """The headers of a request, with lower case names."""
+    return {
+        name.lower(): value.decode('utf-8') if isinstance(value, bytes) else value
+        for name, value in request.headers.items()
+    }
+
+
+def _read_body(request, headers: Dict[str, str]) -> bytes:
+    body = request.body
+    if body is None:
+        return b''
+    if hasattr(body, 'read'):
+        data = body.read()
+    else:
+        data = body
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if 'aws-chunked' in headers.get('content-encoding', ''):
+        data = _decode_aws_chunked(data)
+    return bytes(data)
+
+
+def _decode_aws_chunked(data: bytes) -> bytes:
+    """Strip the framing (and trailing checksum) botocore adds to streamed uploads."""
+    result = []
+    position = 0
+    while True:
+        line_end = data.index(b'\r\n', position)
+        size = int(data[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            break
+        result.append(data[line_end + 2:line_end + 2 + size])
+        position = line_end + 2 + size + 2
+    return b''.join(result)
+
+
+def _checksum(algorithm: str, body: bytes) -> Optional[bytes]:
+    if algorithm == 'crc32':
+        return zlib.crc32(body).to_bytes(4, 'big')
+    if algorithm in ('sha1', 'sha256'):
+        return hashlib.new(algorithm, body).digest()
+    # Other checksums are not verified.
+    return None
+
+
+def _verify_digests(headers: Dict[str, str], body: bytes) -> Optional[AWSResponse]:
+    """Check the Content-MD5 and checksum headers of an upload, like S3 does."""
+    content_md5 = headers.get('content-md5')
+    if content_md5 is not None and base64.b64decode(content_md5) != hashlib.md5(body).digest():
+        return _error(400, 'BadDigest', 'The Content-MD5 you specified did not match what we received.')
+    for name, value in headers.items():
+        if name.startswith('x-amz-checksum-') and name != 'x-amz-checksum-type':
+            algorithm = name[len('x-amz-checksum-'):]
+            expected = _checksum(algorithm, body)
+            if expected is not None and base64.b64decode(value) != expected:
+                return _error(400, 'BadDigest', f'The {algorithm.upper()} you specified did not match the calculated checksum.')
+    return None
+
+
+class _Object(object):
+    __slots__ = ('size', 'etag', 'data', 'modified_at', 'headers')
+
+    def __init__(self, size: int, etag: str, data: Optional[bytes], headers: Dict[str, str]):
+        self.size = size
+        self.etag = etag
+        self.data = data
+        self.modified_at = time.time()
+        self.headers = headers
+
+
+class _Distribution(object):
+    def __init__(self, distribution_id: str, origin_names: List[str], bucket_domain: str):
+        self.distribution_id = distribution_id
+        origins = ''.join(
+            f'<Origin>{_element("Id", name)}{_element("DomainName", bucket_domain)}<OriginPath></OriginPath>'
+            f'<S3OriginConfig><OriginAccessIdentity></OriginAccessIdentity></S3OriginConfig></Origin>'
+            for name in origin_names
+        )
+        self.config = (
+            f'{_element("CallerReference", distribution_id)}'
+            f'<Origins>{_element("Quantity", len(origin_names))}<Items>{origins}</Items></Origins>'
+            f'<DefaultCacheBehavior>{_element("TargetOriginId", origin_names[0])}'
+            f'<ViewerProtocolPolicy>allow-all</ViewerProtocolPolicy></DefaultCacheBehavior>'
+            f'<Comment></Comment><Enabled>true</Enabled>'
+        )
+        self.version = 1
+        self.deployed_at = 0.0
+        # Invalidation id -> (creation time, completion time, paths).
+        self.invalidations: Dict[str, Tuple[float, float, List[str]]] = {}
+
+    @property
+    def etag(self) -> str:
+        return f'E{self.distribution_id}{self.version}'
+
+    def status(self) -> str:
+        return 'Deployed' if time.time() >= self.deployed_at else 'InProgress'
+
+
+class FakeAws(object):
+    """Answers the S3 and CloudFront requests of the boto3 clients, from memory.
+
+    :param latency: Seconds added to each request.
+    :param bandwidth: Bytes per second of each connection, or None for no limit.
+    :param deploy_seconds: How long a distribution update takes to be deployed.
+    :param invalidation_seconds: How long an invalidation takes to complete.
+    :param origin_names: Origins of the distributions, which are created on first use.
+    :param request_rate: S3 requests per second above which S3 answers 503 SlowDown, or None for no limit.
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None,
+                 deploy_seconds: float = 0.0, invalidation_seconds: float = 0.0,
+                 origin_names: Tuple[str, ...] = ('website',), request_rate: Optional[float] = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.deploy_seconds = deploy_seconds
+        self.invalidation_seconds = invalidation_seconds
+        self.origin_names = list(origin_names)
+        self.request_rate = request_rate
+        # Token bucket of the S3 requests, holding at most a second worth of them.
+        self._request_tokens = request_rate or 0.0
+        self._request_tokens_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # (bucket, key) -> object, and the sorted keys of each bucket for listings.
+        self._objects: Dict[Tuple[str, str], _Object] = {}
+        self._sorted_keys: Dict[str, List[str]] = {}
+        # Upload id -> part number -> (size, MD5 digest).
+        self._uploads: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+        self._distributions: Dict[str, _Distribution] = {}
+        self.requests: Dict[str, int] = {}
+
+    def install(self) -> None:
+        """Route the requests of every boto3 client created afterwards to this stand-in."""
+        for name, value in (('AWS_ACCESS_KEY_ID', 'bench'), ('AWS_SECRET_ACCESS_KEY', 'bench'),
+                            ('AWS_DEFAULT_REGION', 'us-east-1')):
+            os.environ.setdefault(name, value)
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        events = boto3.DEFAULT_SESSION.events
+        events.register('before-send.s3', self._handle_s3, unique_id='bench-fake-s3')
+        events.register('before-send.cloudfront', self._handle_cloudfront, unique_id='bench-fake-cloudfront')
+
+    def reset_counts(self) -> Dict[str, int]:
+        with self._lock:
+            requests, self.requests = self.requests, {}
+        return requests
+
+    def object_count(self, bucket_name: str) -> int:
+        return sum(1 for bucket, _ in self._objects if bucket == bucket_name)
+
+    def _simulate_network(self, num_bytes: int) -> None:
+        delay = self.latency + (num_bytes / self.bandwidth if self.bandwidth else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def _is_throttled(self) -> bool:
+        if not self.request_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._request_tokens = min(self.request_rate,
+                                       self._request_tokens + (now - self._request_tokens_at) * self.request_rate)
+            self._request_tokens_at = now
+            if self._request_tokens < 1:
+                self.requests['SlowDown'] = self.requests.get('SlowDown', 0) + 1
+                return True
+            self._request_tokens -= 1
+            return False
+
+    # S3
+
+    def _handle_s3(self, request, event_name: str, **kwargs) -> AWSResponse:
+        operation = event_name.rsplit('.', 1)[-1]
+        self._count(operation)
+        url = urlsplit(request.url)
+        host = url.hostname or ''
+        path = unquote(url.path)
+        if '.s3.' in host and not host.startswith('s3.'):
+            bucket_name, key = host.split('.s3.')[0], path[1:]
+        else:
+            bucket_name, _, key = path[1:].partition('/')
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        headers = _read_headers(request)
+        body = _read_body(request, headers)
+        handler = getattr(self, f'_s3_{operation}', None)
+        if handler is None:
+            return _error(501, 'NotImplemented', f'{operation} is not supported by the stand-in')
+        if self._is_throttled():
+            response = _error(503, 'SlowDown', 'Please reduce your request rate.')
+        else:
+            response = handler(bucket_name, key, query, headers, body)
+        self._simulate_network(len(body) + len(response.raw.getvalue()))
+        return response
+
+    def _store(self, bucket_name: str, key: str, obj: _Object) -> None:
+        with self._lock:
+            if (bucket_name, key) not in self._objects:
+                bisect.insort(self._sorted_keys.setdefault(bucket_name, []), key)
+            self._objects[(bucket_name, key)] = obj
+
+    @staticmethod
+    def _metadata_headers(headers) -> Dict[str, str]:
+        names = ('Content-Type', 'Content-Encoding', 'Cache-Control', 'Content-Disposition')
+        result = {name: headers[name.lower()] for name in names if name.lower() in headers}
+        # The framing of streamed uploads is not part of the object.
+        if result.get('Content-Encoding', '').startswith('aws-chunked'):
+            encoding = result.pop('Content-Encoding').partition(',')[2].strip()
+            if encoding:
+                result['Content-Encoding'] = encoding
+        result.update((name, value) for name, value in headers.items() if name.startswith('x-amz-meta-'))
+        return result
+
+    def _s3_PutObject(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        error = _verify_digests(headers, body)
+        if error is not None:
+            return error
+        etag = hashlib.md5(body).hexdigest()
+        data = body if len(body) <= MAX_KEPT_OBJECT_SIZE else None
+        self._store(bucket_name, key, _Object(len(body), etag, data, self._metadata_headers(headers)))
+        return _response(200, {'ETag': f'"{etag}"'})
+
+    def _s3_CreateMultipartUpload(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        upload_id = f'upload{next(self._ids)}'
+        with self._lock:
+            self._uploads[upload_id] = {}
+        content = _element('Bucket', bucket_name) + _element('Key', key) + _element('UploadId', upload_id)
+        return _response(200, body=_xml('InitiateMultipartUploadResult', S3_NAMESPACE, content))
+
+    def _s3_UploadPart(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        error = _verify_digests(headers, body)
+        if error is not None:
+            return error
+        digest = hashlib.md5(body).digest()
+        with self._lock:
+            parts = self._uploads.get(query.get('uploadId'))
+            if parts is None:
+                return _error(404, 'NoSuchUpload', 'The specified upload does not exist')
+            parts[int(query['partNumber'])] = (len(body), digest)
+        return _response(200, {'ETag': f'"{digest.hex()}"'})
+
+    def _s3_CompleteMultipartUpload(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        with self._lock:
+            parts = self._uploads.pop(query.get('uploadId'), None)
+        if parts is None:
+            return _error(404, 'NoSuchUpload', 'The specified upload does not exist')
+        ordered = [parts[number] for number in sorted(parts)]
+        etag = f'{hashlib.md5(b"".join(digest for _, digest in ordered)).hexdigest()}-{len(ordered)}'
+        self._store(bucket_name, key, _Object(sum(size for size, _ in ordered), etag, None, {}))
+        content = _element('Bucket', bucket_name) + _element('Key', key) + _element('ETag', f'"{etag}"')
+        return _response(200, body=_xml('CompleteMultipartUploadResult', S3_NAMESPACE, content))
+
+    def _s3_AbortMultipartUpload(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        with self._lock:
+            self._uploads.pop(query.get('uploadId'), None)
+        return _response(204)
+
+    def _s3_CopyObject(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        source = unquote(headers['x-amz-copy-source']).lstrip('/')
+        source_bucket, _, source_key = source.partition('/')
+        source_object = self._objects.get((source_bucket, source_key))
+        if source_object is None:
+            return _error(404, 'NoSuchKey', 'The specified key does not exist.')
+        new_headers = self._metadata_headers(headers) if headers.get('x-amz-metadata-directive') == 'REPLACE' \
+            else dict(source_object.headers)
+        copy = _Object(source_object.size, source_object.etag, source_object.data, new_headers)
+        self._store(bucket_name, key, copy)
+        content = _element('LastModified', _timestamp(copy.modified_at)) + _element('ETag', f'"{copy.etag}"')
+        return _response(200, body=_xml('CopyObjectResult', S3_NAMESPACE, content))
+
+    def _object_headers(self, obj: _Object) -> Dict[str, str]:
+        return {
+            **obj.headers,
+            'ETag': f'"{obj.etag}"',
+            'Last-Modified': formatdate(obj.modified_at, usegmt=True),
+        }
+
+    def _s3_HeadObject(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        obj = self._objects.get((bucket_name, key))
+        if obj is None:
+            return _response(404)
+        return AWSResponse('', 200, {**self._object_headers(obj), 'Content-Length': str(obj.size)}, _RawBody(b''))
+
+    def _s3_GetObject(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        obj = self._objects.get((bucket_name, key))
+        if obj is None:
+            return _error(404, 'NoSuchKey', 'The specified key does not exist.')
+        if obj.data is None:
+            return _error(501, 'NotImplemented', f'The data of objects larger than {MAX_KEPT_OBJECT_SIZE} bytes is not kept')
+        return _response(200, self._object_headers(obj), obj.data)
+
+    def _s3_ListObjectsV2(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter')
+        max_keys = int(query.get('max-keys', 1000))
+        start_after = query.get('continuation-token') or query.get('start-after') or ''
+        with self._lock:
+            keys = self._sorted_keys.get(bucket_name, [])
+            index = bisect.bisect_right(keys, max(start_after, prefix)) if start_after else bisect.bisect_left(keys, prefix)
+            contents = []
+            common_prefixes = []
+            last_key = None
+            is_truncated = False
+            while index < len(keys) and keys[index].startswith(prefix):
+                if len(contents) + len(common_prefixes) >= max_keys:
+                    is_truncated = True
+                    break
+                key = keys[index]
+                rest = key[len(prefix):]
+                if delimiter and delimiter in rest:
+                    common_prefix = prefix + rest.split(delimiter, 1)[0] + delimiter
+                    common_prefixes.append(common_prefix)
+                    # Skip the other keys of this common prefix.
+                    index = bisect.bisect_left(keys, common_prefix[:-1] + chr(ord(delimiter[-1]) + 1))
+                    last_key = keys[index - 1]
+                    continue
+                obj = self._objects[(bucket_name, key)]
+                contents.append(
+                    f'<Contents>{_element("Key", key)}{_element("LastModified", _timestamp(obj.modified_at))}'
+                    f'{_element("ETag", chr(34) + obj.etag + chr(34))}{_element("Size", obj.size)}'
+                    f'<StorageClass>STANDARD</StorageClass></Contents>'
+                )
+                last_key = key
+                index += 1
+        content = (
+            _element('Name', bucket_name) + _element('Prefix', prefix) + _element('MaxKeys', max_keys)
+            + _element('KeyCount', len(contents) + len(common_prefixes))
+            + _element('IsTruncated', 'true' if is_truncated else 'false')
+            + ''.join(contents)
+            + ''.join(f'<CommonPrefixes>{_element("Prefix", common_prefix)}</CommonPrefixes>' for common_prefix in common_prefixes)
+            + (_element('NextContinuationToken', last_key) if is_truncated else '')
+        )
+        return _response(200, body=_xml('ListBucketResult', S3_NAMESPACE, content))
+
+    def _s3_DeleteObjects(self, bucket_name, key, query, headers, body) -> AWSResponse:
+        root = ElementTree.fromstring(body)
+        deleted = []
+        with self._lock:
+            for node in root.iter():
+                if node.tag.rpartition('}')[2] == 'Key':
+                    if self._objects.pop((bucket_name, node.text), None) is not None:
+                        self._sorted_keys[bucket_name].remove(node.text)
+                    deleted.append(f'<Deleted>{_element("Key", node.text)}</Deleted>')
+        return _response(200, body=_xml('DeleteResult', S3_NAMESPACE, ''.join(deleted)))
+
+    # CloudFront
+
+    def _handle_cloudfront(self, request, event_name: str, **kwargs) -> AWSResponse:
+        operation = event_name.rsplit('.', 1)[-1]
+        self._count(operation)
+        # Paths look like /2020-05-31/distribution/{Id}[/config|/invalidation[/{InvalidationId}]].
+        parts = unquote(urlsplit(request.url).path).strip('/').split('/')
+        distribution_id = parts[2] if len(parts) > 2 else ''
+        with self._lock:
+            distribution = self._distributions.get(distribution_id)
+            if distribution is None:
+                distribution = self._distributions[distribution_id] = _Distribution(
+                    distribution_id, self.origin_names, 'bucket.s3.amazonaws.com')
+        handler = getattr(self, f'_cloudfront_{operation}', None)
+        if handler is None:
+            return _error(501, 'NotImplemented', f'{operation} is not supported by the stand-in', CLOUDFRONT_NAMESPACE)
+        headers = _read_headers(request)
+        body = _read_body(request, headers)
+        response = handler(distribution, parts[4:], headers, body)
+        self._simulate_network(len(body) + len(response.raw.getvalue()))
+        return response
+
+    def _cloudfront_GetDistributionConfig(self, distribution, parts, headers, body) -> AWSResponse:
+        return _response(200, {'ETag': distribution.etag},
+                         _xml('DistributionConfig', CLOUDFRONT_NAMESPACE, distribution.config))
+
+    def _cloudfront_UpdateDistribution(self, distribution, parts, headers, body) -> AWSResponse:
+        with self._lock:
+            if headers.get('if-match') != distribution.etag:
+                return _error(412, 'PreconditionFailed', 'The If-Match version is missing or not valid', CLOUDFRONT_NAMESPACE)
+            root = ElementTree.fromstring(body)
+            for node in root.iter():
+                node.tag = node.tag.rpartition('}')[2]
+            distribution.config = ''.join(ElementTree.tostring(child, encoding='unicode') for child in root)
+            distribution.version += 1
+            distribution.deployed_at = time.time() + self.deploy_seconds
+        return self._cloudfront_GetDistribution(distribution, parts, headers, b'')
+
+    def _cloudfront_GetDistribution(self, distribution, parts, headers, body) -> AWSResponse:
+        in_progress = sum(1 for _, completed_at, _ in distribution.invalidations.values() if completed_at > time.time())
+        content = (
+            _element('Id', distribution.distribution_id)
+            + _element('ARN', f'arn:aws:cloudfront::000000000000:distribution/{distribution.distribution_id}')
+            + _element('Status', distribution.status())
+            + _element('LastModifiedTime', _timestamp(time.time()))
+            + _element('InProgressInvalidationBatches', in_progress)
+            + _element('DomainName', f'{distribution.distribution_id.lower()}.cloudfront.net')
+            + f'<DistributionConfig>{distribution.config}</DistributionConfig>'
+        )
+        return _response(200, {'ETag': distribution.etag}, _xml('Distribution', CLOUDFRONT_NAMESPACE, content))
+
+    def _invalidation_xml(self, invalidation_id: str, created_at: float, completed_at: float, paths: List[str]) -> str:
+        items = ''.join(_element('Path', path) for path in paths)
+        return (
+            _element('Id', invalidation_id)
+            + _element('Status', 'Completed' if time.time() >= completed_at else 'InProgress')
+            + _element('CreateTime', _timestamp(created_at))
+            + f'<InvalidationBatch><Paths>{_element("Quantity", len(paths))}<Items>{items}</Items></Paths>'
+            + f'{_element("CallerReference", invalidation_id)}</InvalidationBatch>'
+        )
+
+    def _cloudfront_CreateInvalidation(self, distribution, parts, headers, body) -> AWSResponse:
+        root = ElementTree.fromstring(body)
+        paths = [node.text for node in root.iter() if node.tag.rpartition('}')[2] == 'Path']
+        invalidation_id = f'I{next(self._ids)}'
+        created_at = time.time()
+        with self._lock:
+            distribution.invalidations[invalidation_id] = (created_at, created_at + self.invalidation_seconds, paths)
+        content = self._invalidation_xml(invalidation_id, created_at, created_at + self.invalidation_seconds, paths)
+        return _response(201, {'Location': invalidation_id}, _xml('Invalidation', CLOUDFRONT_NAMESPACE, content))
+
+    def _cloudfront_GetInvalidation(self, distribution, parts, headers, body) -> AWSResponse:
+        invalidation_id = parts[-1]
+        invalidation = distribution.invalidations.get(invalidation_id)
+        if invalidation is None:
+            return _error(404, 'NoSuchInvalidation', 'The specified invalidation does not exist', CLOUDFRONT_NAMESPACE)
+        return _response(200, body=_xml('Invalidation', CLOUDFRONT_NAMESPACE, self._invalidation_xml(invalidation_id, *invalidation)))
+
+    def _cloudfront_ListInvalidations(self, distribution, parts, headers, body) -> AWSResponse:
+        summaries = ''.join(
+            f'<InvalidationSummary>{_element("Id", invalidation_id)}{_element("CreateTime", _timestamp(created_at))}'
+            f'{_element("Status", "Completed" if time.time() >= completed_at else "InProgress")}</InvalidationSummary>'
+            for invalidation_id, (created_at, completed_at, _) in reversed(list(distribution.invalidations.items()))
+        )
+        content = (
+            '<Marker></Marker>' + _element('MaxItems', 100) + _element('IsTruncated', 'false')
+            + _element('Quantity', len(distribution.invalidations)) + f'<Items>{summaries}</Items>'
+        )
+        return _response(200, body=_xml('InvalidationList', CLOUDFRONT_NAMESPACE, content))
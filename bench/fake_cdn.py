@@ -0,0 +1,117 @@
+"""Local HTTP stand-in for the edge of a CloudFront distribution, to warm up (see warmup.py).
+
+Files are served from memory, over a real socket, with the X-Cache header of
+CloudFront: the first request for a file (and encoding) is a miss, which takes
+an extra `origin_latency` to fetch from the origin, and the next ones are hits.
+Index documents are also served by their directory (e.g. `/docs/` for
+`docs/index.html`). The requests are recorded, to check the concurrency and rate
+of a client.
+
+Usage:
+    cdn = FakeCdn({'index.html': 1024, 'app.js': 65536}, latency=0.01)
+    cdn.start()  # Serves on cdn.base_url until cdn.stop().
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import threading
+import time
+
+INDEX_DOCUMENT = 'index.html'
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+class FakeCdn(object):
+    def __init__(self, files: Dict[str, int], latency: float = 0.0, origin_latency: float = 0.0):
+        """
+        :param files: Size of each file, by relative path (using '/' as separator).
+        :param latency: Seconds each request takes before being answered.
+        :param origin_latency: Seconds a miss takes on top of `latency`.
+        """
+        self.files = files
+        self.latency = latency
+        self.origin_latency = origin_latency
+        # (time, path, X-Cache) of each request, in the order they were answered.
+        self.requests: List[Tuple[float, str, str]] = []
+        self.max_concurrent_requests = 0
+        self._cached: Set[Tuple[str, str]] = set()
+        self._concurrent_requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> None:
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                cdn._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def invalidate(self) -> None:
+        """Drop every cached file, as a `/*` invalidation does."""
+        with self._lock:
+            self._cached.clear()
+
+    def reset_requests(self) -> None:
+        with self._lock:
+            self.requests = []
+            self.max_concurrent_requests = 0
+
+    def _resolve(self, url: str) -> Optional[str]:
+        path = unquote(urlsplit(url).path).lstrip('/')
+        if path == '' or path.endswith('/'):
+            path += INDEX_DOCUMENT
+        return path if path in self.files else None
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            self._concurrent_requests += 1
+            self.max_concurrent_requests = max(self.max_concurrent_requests, self._concurrent_requests)
+        try:
+            path = self._resolve(handler.path)
+            cache_key = (handler.path, handler.headers.get('Accept-Encoding', ''))
+            with self._lock:
+                is_hit = cache_key in self._cached
+                if path is not None:
+                    self._cached.add(cache_key)
+            time.sleep(self.latency + (0 if is_hit else self.origin_latency))
+            if path is None:
+                x_cache = 'Error from cloudfront'
+                self._send(handler, 404, x_cache, 0)
+            else:
+                x_cache = 'Hit from cloudfront' if is_hit else 'Miss from cloudfront'
+                self._send(handler, 200, x_cache, self.files[path])
+            with self._lock:
+                self.requests.append((time.monotonic(), handler.path, x_cache))
+        finally:
+            with self._lock:
+                self._concurrent_requests -= 1
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, x_cache: str, size: int) -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(size))
+        handler.send_header('X-Cache', x_cache)
+        handler.end_headers()
+        chunk = b'x' * WRITE_CHUNK_SIZE
+        remaining = size
+        while remaining > 0:
+            handler.wfile.write(chunk[:remaining])
+            remaining -= WRITE_CHUNK_SIZE
@@ -1,77 +1,252 @@
 #!/usr/bin/env python3
 
-from stat import *
-from typing import List, Set, Tuple
+# Annotations naming the classes of lazily imported modules must not import them.
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import os
 import sys
-import glob
 import argparse
 import re
 import logging
-from static_deployer.common import log, types, configuration, utils
-from static_deployer.providers.cdn import cloudfront
-from static_deployer.providers.storage import s3bucket
+import time
+import attr
+from static_deployer.common import log, types, configuration, utils, hashcache, invalidation, journal, manifest, metrics, walker
 
+# Imported when first used, so the commands that do not need them (and --help) start faster.
+compression = utils.LazyModule('static_deployer.common.compression')
+cloudfront = utils.LazyModule('static_deployer.providers.cdn.cloudfront')
+warmup = utils.LazyModule('static_deployer.providers.cdn.warmup')
+s3bucket = utils.LazyModule('static_deployer.providers.storage.s3bucket')
 
-def find_local_files(root_dir: str, glob_patterns: str) -> Set[str]:
+# Paths named in a log message, beyond which only their number is.
+MAX_LOGGED_PATHS = 20
+
+
+def iter_local_files(root_dir: str, glob_patterns: str, exclude_patterns: Optional[str] = None) -> Iterator[os.DirEntry]:
+    """Lazily find all files existing in root_dir that match the given set of patterns.
+
+    The directory tree is scanned once, whatever the number of patterns, and files
+    are yielded as soon as they are found, so the caller can start working on them
+    while the search goes on.
+
+    :param root_dir: Absolute path to the root directory where files will be searched.
+    :param glob_patterns: Comma separated string containing glob patterns used to filter files.
+    :param exclude_patterns: Comma separated string containing glob patterns of files to leave out.
+    :return: An iterator over the os.DirEntry's of the files matching the patterns.
+    """
+    log.debug(f'root_dir={root_dir}, patterns=\'{glob_patterns}\', exclude_patterns=\'{exclude_patterns}\'')
+    matcher = walker.PatternMatcher(
+        glob_patterns.split(','),
+        exclude_patterns.split(',') if exclude_patterns else None,
+    )
+    for entry in walker.walk(root_dir, matcher):
+        log.debug(f'    MATCH path={entry.path}')
+        yield entry
+
+
+def find_local_files(root_dir: str, glob_patterns: str, exclude_patterns: Optional[str] = None) -> Set[str]:
     """Find all files existing in root_dir that match the given set of patterns.
 
     :param root_dir: Absolute path to the root directory where files will be searched.
     :param glob_patterns: Comma separated string containing glob patterns used to filter files.
+    :param exclude_patterns: Comma separated string containing glob patterns of files to leave out.
     :return: The list of file paths matching the patterns. Contains only absolute and normalized paths.
     """
-    result = []
-    log.debug(f'root_dir={root_dir}')
-    patterns = glob_patterns.split(',')
-    for pattern in patterns:
-        absolute_pattern = os.path.join(root_dir, pattern)
-        matching_paths = glob.glob(absolute_pattern, recursive=True)  # recursive=True enables recursive **
-        log.debug(f'  pattern=\'{pattern}\', matching_paths={matching_paths}')
-        for path in matching_paths:
-            # TODO: handle OSError for os.stat
-            stat_info = os.stat(path)
-            path_is_dir = S_ISDIR(stat_info.st_mode)
-            log.debug(f'    {"DIR" if path_is_dir else "FILE"} path=\'{path}\'')
-            if not path_is_dir:
-                log.debug(f'    MATCH path={path}')
-                result.append(path)
-        # else:
-        # 	for dirpath, dirnames, filenames in os.walk(path):
-        # 		# Do we need to normalize the dirpath directory here?
-        # 		#dirpath_normalized = os.path.normpath(dirpath)
-        # 		#log.debug(f'      WALK dirpath=\'{dirpath}\', dirnames={dirnames}, filenames={filenames}')
-        # 		# Skip dirnames as we are only interested in filenames.
-        # 		for filename in filenames:
-        # 			absolute_filepath = os.path.join(dirpath, filename)
-        # 			log.debug(f'    MATCH absolute_filepath={absolute_filepath}')
-        # 			result.append(absolute_filepath)
-
-    result_set = set(result)
-    len_result, len_result_set = len(result), len(result_set)
-    if len(result) > len(result_set):
-        logging.warning('Some files are being included more than once! Please, review your patterns!' +
-                        ' len(result)=%d > len(result_set)=%d', len_result, len_result_set)
-        log.debug(f'RESULT len={len(result)}, {result})')
+    result_set = set(entry.path for entry in iter_local_files(root_dir, glob_patterns, exclude_patterns))
     log.debug(f'RESULT_SET len={len(result_set)}, {result_set})')
     return result_set
 
 
-def map_local_to_remote(root_dir: str, remote_prefix: str, local_files: Set[str]) -> List[types.FileMapping]:
-    """Convert local file paths to remote object paths.
+def get_file_digest(local_file: str, relative_local_path: str, stat_info: os.stat_result, part_size: int,
+                    hash_cache: Optional[hashcache.HashCache] = None) -> Optional[types.FileDigest]:
+    try:
+        digest = hash_cache.get(relative_local_path, stat_info, part_size) if hash_cache else None
+        if digest is None:
+            with metrics.phase('hashing'), open(local_file, 'rb') as fileobj:
+                digest = s3bucket.compute_digest(fileobj, part_size)
+            metrics.count('files_hashed')
+            metrics.count('bytes_hashed', stat_info.st_size)
+            if hash_cache:
+                hash_cache.put(relative_local_path, stat_info, digest, part_size)
+        else:
+            metrics.count('hash_cache_hits')
+        return digest
+    except OSError as e:
+        logging.error(e)
+        return None
+
+
+def iter_file_mappings(root_dir: str, remote_prefix: str, local_files: Iterable[Union[str, os.DirEntry]],
+                       base_objects: Optional[Dict[str, types.RemoteObject]] = None,
+                       hash_cache: Optional[hashcache.HashCache] = None,
+                       transfer_policy: Optional[s3bucket.TransferPolicy] = None) -> Iterator[types.FileMapping]:
+    """Lazily convert local file paths to remote object paths.
 
     :param root_dir: Absolute path to the root directory where files will be searched.
     :param remote_prefix: Prefix where remote objects will reside.
-    :param local_files: List of local file paths.
-    :return: A list of FileMapping's.
+    :param local_files: Iterable of local file paths, or of os.DirEntry's whose cached stat is reused.
+    :param base_objects: Objects of the currently live version, indexed by their relative path.
+    :param hash_cache: Cache of previously computed digests, used when comparing files to base_objects.
+    :param transfer_policy: Transfer settings, which determine the ETag of the uploaded files.
+    :return: An iterator over FileMapping's.
     """
-    result = []  # Should we pre-allocate this array?
+    transfer_policy = transfer_policy or s3bucket.TransferPolicy(types.UploadOptions())
     for local_file in local_files:
+        try:
+            stat_info = local_file.stat() if isinstance(local_file, os.DirEntry) else os.stat(local_file)
+        except OSError as e:
+            logging.error(e)
+            continue
+        local_file = os.fspath(local_file)
         relative_local_path = os.path.relpath(local_file, root_dir)
+        relative_remote_path = relative_local_path.replace(os.sep, '/')
         remote_path = os.path.join(remote_prefix, relative_local_path).replace(os.sep, '/')
-        file_mapping = types.FileMapping(local_path=relative_local_path, remote_path=remote_path)
-        result.append(file_mapping)
+        file_mapping = types.FileMapping(local_path=relative_local_path, remote_path=remote_path, size=stat_info.st_size,
+                                         local_stat=(stat_info.st_size, stat_info.st_mtime_ns))
+        base_object = base_objects.get(relative_remote_path) if base_objects else None
+        if base_object is not None:
+            file_mapping.base_object = base_object
+            # Files with a different size have certainly changed, so there is no need to hash them.
+            if stat_info.st_size == base_object.size:
+                settings, _ = transfer_policy.lookup(relative_remote_path)
+                part_size = transfer_policy.part_size(settings, stat_info.st_size)
+                file_mapping.digest = get_file_digest(local_file, relative_local_path, stat_info, part_size, hash_cache)
         log.debug(str(file_mapping))
-    return result
+        yield file_mapping
+
+
+def iter_compressed_digests(file_mappings: Iterable[types.FileMapping],
+                            transfer_policy: s3bucket.TransferPolicy) -> Iterator[types.FileMapping]:
+    """Compute the digest of the compressed files that may be unchanged since the live version."""
+    for file_mapping in file_mappings:
+        base_object = file_mapping.base_object
+        if file_mapping.source_path and base_object is not None and base_object.size == file_mapping.size:
+            settings, _ = transfer_policy.lookup(file_mapping.local_path.replace(os.sep, '/'))
+            part_size = transfer_policy.part_size(settings, file_mapping.size)
+            try:
+                with metrics.phase('hashing'), open(file_mapping.source_path, 'rb') as fileobj:
+                    file_mapping.digest = s3bucket.compute_digest(fileobj, part_size)
+                metrics.count('files_hashed')
+                metrics.count('bytes_hashed', file_mapping.size)
+            except OSError as e:
+                logging.error(e)
+        yield file_mapping
+
+
+def iter_missing_files(root_dir: str, file_mappings: Iterable[types.FileMapping],
+                       remote_objects: Dict[str, types.RemoteObject],
+                       uploaded: Dict[str, Tuple[journal.LocalStat, types.ManifestEntry]],
+                       manifest_writer: manifest.ManifestWriter,
+                       transfer_policy: s3bucket.TransferPolicy,
+                       metadata_policy: s3bucket.MetadataPolicy,
+                       hash_cache: Optional[hashcache.HashCache] = None) -> Iterator[types.FileMapping]:
+    """Leave out the files a previous run of the same deploy already uploaded, adding them to the manifest instead.
+
+    A file is left out if the journal of the previous run recorded it with the same
+    local size and modification time, and its object still has the recorded ETag.
+    Files uploaded by a run whose journal is gone (e.g. it ran on another machine)
+    are hashed and compared to their object, unless they were compressed.
+
+    :param remote_objects: Objects already stored under the prefix of the version, indexed by their relative path.
+    :param uploaded: Entries of the journal of the previous run, see `journal.UploadJournal.load`.
+    """
+    num_skipped = 0
+    for file_mapping in file_mappings:
+        relative_path = file_mapping.local_path.replace(os.sep, '/')
+        remote_object = remote_objects.get(relative_path)
+        entry = None
+        if remote_object is not None:
+            local_stat, recorded_entry = uploaded.get(relative_path, (None, None))
+            if recorded_entry is not None:
+                if local_stat == file_mapping.local_stat and recorded_entry.etag == remote_object.etag:
+                    entry = recorded_entry
+            elif remote_object.size == file_mapping.size:
+                local_file = os.path.join(root_dir, file_mapping.local_path)
+                settings, _ = transfer_policy.lookup(relative_path)
+                part_size = transfer_policy.part_size(settings, file_mapping.size)
+                try:
+                    stat_info = os.stat(local_file)
+                    digest = get_file_digest(local_file, file_mapping.local_path, stat_info, part_size, hash_cache)
+                except OSError as e:
+                    logging.error(e)
+                    digest = None
+                if digest is not None and remote_object.etag in (digest.etag, digest.md5):
+                    entry = types.ManifestEntry(
+                        path=relative_path,
+                        size=remote_object.size,
+                        etag=remote_object.etag,
+                        content_type=metadata_policy.lookup(relative_path).get('ContentType'),
+                    )
+        if entry is None:
+            yield file_mapping
+            continue
+        log.debug(f'Already uploaded: {relative_path}')
+        manifest_writer.add(entry)
+        num_skipped += 1
+        metrics.count('files_resumed')
+    logging.info(f'Skipped {num_skipped} files uploaded by a previous run')
+
+
+def iter_counted(items: Iterable, counts: Dict[str, int], name: str) -> Iterator:
+    """Pass the items of a stream through, counting them in `counts[name]`."""
+    counts[name] = 0
+    for item in items:
+        counts[name] += 1
+        yield item
+
+
+def describe_paths(paths: List[str], limit: int = MAX_LOGGED_PATHS) -> str:
+    """List paths in a log message, only naming the first `limit` ones."""
+    if len(paths) <= limit:
+        return ', '.join(paths)
+    return f'{", ".join(paths[:limit])} and {len(paths) - limit} more'
+
+
+def verify_version(bucket_name: str, prefix: str, entries: Iterable[types.ManifestEntry],
+                   num_local_files: Optional[int] = None) -> bool:
+    """Check that every file of a version is stored with the expected size and ETag.
+
+    :param entries: The files of the version, as written to its manifest.
+    :param num_local_files: Number of local files the version was made from, each of which must have an entry.
+    :return: True if all the objects match, else False
+    """
+    expected = {entry.path: entry for entry in entries}
+    num_entries = len(expected)
+    if num_local_files is not None and num_entries != num_local_files:
+        logging.error(f'Found {num_local_files} local files, but {num_entries} of them were uploaded')
+        return False
+    started_at = time.monotonic()
+    result = s3bucket.diff_objects(bucket_name, prefix, expected)
+    if result is None:
+        return False
+    missing, different, unexpected = result
+    metrics.count('files_verified', num_entries - len(missing) - len(different))
+    if unexpected:
+        # They were left by an interrupted run, and are not part of the files being deployed.
+        logging.warning(f'{len(unexpected)} objects in \'s3://{bucket_name}/{prefix}\' are not part of the version:'
+                        f' {describe_paths(sorted(unexpected))}')
+    if missing or different:
+        if missing:
+            logging.error(f'{len(missing)} of {num_entries} files are missing from \'s3://{bucket_name}/{prefix}\':'
+                          f' {describe_paths(missing)}')
+        if different:
+            logging.error(f'{len(different)} of {num_entries} files differ in \'s3://{bucket_name}/{prefix}\':'
+                          f' {describe_paths(sorted(different))}')
+        metrics.count('files_mismatched', len(missing) + len(different))
+        return False
+    logging.info(f'Verified the {num_entries} files of \'s3://{bucket_name}/{prefix}\' in {time.monotonic() - started_at:.2f}s')
+    return True
+
+
+def map_local_to_remote(root_dir: str, remote_prefix: str, local_files: Iterable[Union[str, os.DirEntry]],
+                        base_objects: Optional[Dict[str, types.RemoteObject]] = None,
+                        hash_cache: Optional[hashcache.HashCache] = None,
+                        transfer_policy: Optional[s3bucket.TransferPolicy] = None) -> List[types.FileMapping]:
+    """Convert local file paths to remote object paths.
+
+    :return: A list of FileMapping's. See `iter_file_mappings` for the parameters.
+    """
+    return list(iter_file_mappings(root_dir, remote_prefix, local_files, base_objects, hash_cache, transfer_policy))
 
 
 def build_remote_prefix(bucket_prefix: str, version: str) -> str:
@@ -81,85 +256,571 @@ def build_remote_prefix(bucket_prefix: str, version: str) -> str:
         return version
 
 
-def run_deploy(spec: types.DeploySpec, options: types.UploadOptions, dry_run: bool = False) -> bool:
+def find_versions_prefix(bucket_prefix: str) -> Optional[Tuple[str, str]]:
+    """Split a bucket prefix around its version, to find all the versions stored in a bucket.
+
+    :return: The part of the prefix before the version, under which all the versions are stored,
+        and the rest of the '/' delimited segment holding the version, or None if the bucket
+        prefix does not depend on the version.
+    """
+    if not bucket_prefix:
+        return '', ''
+    match = re.search(r'{{\s*version\s*}}', bucket_prefix)
+    if not match:
+        return None
+    return bucket_prefix[:match.start()], bucket_prefix[match.end():].split('/')[0]
+
+
+def find_live_version(cdn: types.CdnDetails) -> Optional[str]:
+    """Find the prefix of the version a CDN origin currently serves.
+
+    :return: The prefix, or None if it is unknown or the origin points to the bucket root.
+    """
+    live_prefix = cloudfront.get_origin_path(cdn.distribution_id, cdn.origin_name)
+    if live_prefix is None:
+        logging.warning(f'Could not determine the live version of distribution {cdn.distribution_id},'
+                        f' all files will be uploaded and invalidated')
+        return None
+    if not live_prefix:
+        logging.warning(f'The origin {cdn.origin_name} of distribution {cdn.distribution_id} points to the bucket root,'
+                        f' all files will be uploaded and invalidated')
+        return None
+    return live_prefix
+
+
+def index_version(bucket_name: str, prefix: str) -> Dict[str, types.RemoteObject]:
+    """Index the objects of a version by their relative path, from its manifest if it has one."""
+    # Reading the manifest is a single request, listing the objects takes one per 1000 objects.
+    objects = s3bucket.index_manifest(bucket_name, prefix)
+    source = 'manifest'
+    if objects is None:
+        objects = s3bucket.index_objects(bucket_name, prefix)
+        source = 'listing'
+    logging.info(f'Found {len(objects)} objects in the live version ({prefix}) from its {source}')
+    return objects
+
+
+def plan_invalidations(cdns: List[types.CdnDetails], live_prefixes: Dict[Tuple[str, str], Optional[str]],
+                       live_versions: Dict[str, Dict[str, types.RemoteObject]],
+                       get_entries: Callable[[], Iterable[types.ManifestEntry]]) -> Dict[Tuple[str, str], Optional[List[str]]]:
+    """Plan the paths each CDN must invalidate to serve a new version, from its difference with the live version.
+
+    CDNs serving the same live version, with the same limits, share a plan.
+
+    :param live_prefixes: The prefix of the version each (distribution id, origin name) serves, if known.
+    :param live_versions: The objects of the live versions, indexed by their relative path.
+    :param get_entries: Returns the manifest entries of the new version, called once per plan.
+    :return: The paths to invalidate for each (distribution id, origin name), missing if all paths must be.
+    """
+    paths_to_invalidate: Dict[Tuple[str, str], Optional[List[str]]] = {}
+    plans: Dict[Tuple, List[str]] = {}
+    for cdn in cdns:
+        live_prefix = live_prefixes.get((cdn.distribution_id, cdn.origin_name))
+        if cdn.invalidate_all or not live_prefix or live_prefix not in live_versions:
+            continue
+        plan_key = (live_prefix, attr.astuple(cdn.invalidation_limits))
+        if plan_key not in plans:
+            changed, all_paths = invalidation.diff_versions(live_versions[live_prefix], get_entries())
+            plans[plan_key] = invalidation.plan_invalidation(changed, all_paths, cdn.invalidation_limits)
+            metrics.count('files_changed', len(changed))
+        paths_to_invalidate[(cdn.distribution_id, cdn.origin_name)] = plans[plan_key]
+    return paths_to_invalidate
+
+
+def run_deploy(spec: types.DeploySpec, options: types.UploadOptions, dry_run: bool = False, resume: bool = False) -> bool:
+    """Upload a new version and point the CDNs to it.
+
+    The time spent in each step, and the details of the transfers, are recorded
+    in `metrics.current()`, from which a report can be written once it returns.
+
+    :param resume: If the version already exists, finish uploading it instead of failing.
+    """
+    metrics.reset()
+    metrics.instrument_boto3()
+    cloudfront.reset_config_cache()
+    try:
+        return _run_deploy(spec, options, dry_run, resume)
+    finally:
+        metrics.log_summary()
+
+
+def _run_deploy(spec: types.DeploySpec, options: types.UploadOptions, dry_run: bool = False, resume: bool = False) -> bool:
     logging.info(f'Deploy spec={spec.to_dict()}, options={options.to_dict()}')
     remote_prefix = build_remote_prefix(spec.storage.prefix, spec.version)
 
-    remote_prefix_exists = s3bucket.directory_exists(spec.storage.name, remote_prefix)
-    # Prevent the deploy if the remote path already exists.
-    if remote_prefix_exists:
-        logging.error(f'The specified version ({spec.version}) already exists in the target storage ({vars(spec.storage)})')
+    with metrics.phase('existence_check'):
+        remote_prefix_exists = s3bucket.directory_exists(spec.storage.name, remote_prefix)
+    # Prevent the deploy if the remote path already exists, unless it is the one of an interrupted deploy being resumed.
+    if remote_prefix_exists and not resume:
+        logging.error(f'The specified version ({spec.version}) already exists in the target storage ({vars(spec.storage)}),'
+                      f' use --resume to finish an interrupted deploy of this version')
         return False
 
-    local_files = find_local_files(spec.content.root_dir, spec.content.patterns)
-    file_mappings = map_local_to_remote(
+    # The live versions are needed both to copy unchanged files and to only invalidate the changed ones.
+    # Distributions usually serve the same version, so each one is indexed once.
+    live_prefixes: Dict[Tuple[str, str], Optional[str]] = {}
+    with metrics.phase('live_version'):
+        if options.incremental or not all(cdn.invalidate_all for cdn in spec.cdns):
+            for cdn in spec.cdns:
+                live_prefixes[(cdn.distribution_id, cdn.origin_name)] = find_live_version(cdn)
+        live_versions = {
+            live_prefix: index_version(spec.storage.name, live_prefix)
+            for live_prefix in dict.fromkeys(live_prefixes.values()) if live_prefix
+        }
+    cache_dir = spec.content.cache_dir or hashcache.default_cache_dir()
+    base_objects = None
+    hash_cache = None
+    if options.incremental:
+        # Unchanged files are copied from the version served by the first distribution.
+        base_objects = next(iter(live_versions.values()), None)
+    is_resumed = remote_prefix_exists
+    if options.incremental or is_resumed:
+        hash_cache = hashcache.HashCache(cache_dir, spec.content.root_dir)
+        with metrics.phase('hash_cache'):
+            hash_cache.load()
+
+    # Completed uploads are journaled, so the deploy can be resumed if it is interrupted.
+    upload_journal = None
+    uploaded = {}
+    remote_objects = {}
+    if not dry_run:
+        upload_journal = journal.UploadJournal(cache_dir, spec.storage.name, remote_prefix, spec.content.root_dir,
+                                               options)
+        if is_resumed:
+            logging.info(f'Resuming the deploy of version {spec.version}')
+            with metrics.phase('resume'):
+                uploaded = upload_journal.load()
+                remote_objects = s3bucket.index_objects(spec.storage.name, remote_prefix)
+            logging.info(f'Found {len(remote_objects)} objects already uploaded, {len(uploaded)} of them journaled')
+        upload_journal.open(resume=is_resumed)
+
+    # Files are discovered, mapped, compressed and uploaded as a stream, so the first
+    # uploads start right away and memory usage does not depend on the number of files.
+    transfer_policy = s3bucket.TransferPolicy(options)
+    # Each stage only counts the time spent on its own work, not the time its input takes to come.
+    local_files = metrics.timed('discovery', iter_local_files(spec.content.root_dir, spec.content.patterns,
+                                                              spec.content.exclude_patterns))
+    # Every file found must end up in the version, which the verification checks.
+    counts: Dict[str, int] = {}
+    local_files = iter_counted(local_files, counts, 'local_files')
+    file_mappings = metrics.timed('mapping', iter_file_mappings(
         spec.content.root_dir,
         remote_prefix,
         local_files,
-    )
+        base_objects=base_objects,
+        hash_cache=hash_cache,
+        transfer_policy=transfer_policy,
+    ))
+    manifest_writer = manifest.ManifestWriter({'version': spec.version, 'prefix': remote_prefix})
+    if remote_objects:
+        file_mappings = metrics.timed('resume', iter_missing_files(
+            spec.content.root_dir, file_mappings, remote_objects, uploaded, manifest_writer,
+            transfer_policy, s3bucket.MetadataPolicy(options), hash_cache))
+    compressor = None
+    if options.compression:
+        compressor = compression.Compressor(spec.content.root_dir, options.compression, cache_dir)
+        file_mappings = metrics.timed('compression', compressor.run(file_mappings))
+        if base_objects is not None:
+            file_mappings = iter_compressed_digests(file_mappings, transfer_policy)
 
-    success = s3bucket.upload_files(spec.content.root_dir, spec.storage.name, file_mappings, options, dry_run=dry_run)
+    with metrics.phase('upload'):
+        try:
+            success = s3bucket.upload_files(spec.content.root_dir, spec.storage.name, file_mappings, options,
+                                            dry_run=dry_run, manifest_writer=manifest_writer,
+                                            upload_journal=upload_journal)
+        finally:
+            # Also keep what was uploaded when the deploy is interrupted (e.g. with Ctrl+C).
+            if upload_journal:
+                upload_journal.close()
+    with metrics.phase('hash_cache'):
+        if hash_cache:
+            hash_cache.save()
+        if compressor:
+            compressor.evict()
     if not success:
         return False
 
-    return cloudfront.update(
-        spec.cdn.distribution_id,
-        spec.cdn.origin_name,
-        remote_prefix,
-        dry_run=dry_run,
-    )
+    with metrics.phase('invalidation_plan'):
+        paths_to_invalidate = plan_invalidations(spec.cdns, live_prefixes, live_versions, manifest_writer.entries)
+    # The entries can no longer be read once the manifest is uploaded.
+    warmup_paths = []
+    if spec.warmup:
+        with metrics.phase('warmup'):
+            warmup_paths = warmup.plan_warmup(manifest_writer.entries, spec.warmup.max_files)
+
+    # The CDNs are only switched once every file was checked to be stored as expected. This also
+    # catches the files of a resumed version that were overwritten or deleted since the interrupted run.
+    if not dry_run:
+        with metrics.phase('verification'):
+            if not verify_version(spec.storage.name, remote_prefix, manifest_writer.entries(), counts['local_files']):
+                return False
+
+    # The manifest is only written once all files were uploaded, so it also marks the version as complete.
+    with metrics.phase('manifest'):
+        success = s3bucket.upload_manifest(spec.storage.name, remote_prefix, manifest_writer, dry_run=dry_run)
+    if not success:
+        return False
+
+    with metrics.phase('cdn_update'):
+        success = cloudfront.update_all(
+            spec.cdns,
+            remote_prefix,
+            dry_run=dry_run,
+            paths_to_invalidate=paths_to_invalidate,
+        )
+    # Until the CDNs serve the new version, a resumed run still has to switch them.
+    if success and upload_journal:
+        upload_journal.remove()
+
+    # Edges only serve the new version for sure once the update completed, so the others are not warmed up,
+    # as they could cache the previous version again.
+    if success and spec.warmup:
+        distribution_ids = list(dict.fromkeys(cdn.distribution_id for cdn in spec.cdns))
+        base_urls = dict(zip(distribution_ids, spec.warmup.base_urls or [None] * len(distribution_ids)))
+        waited_ids = {cdn.distribution_id for cdn in spec.cdns if cdn.wait}
+        if len(waited_ids) < len(distribution_ids):
+            logging.warning('Not warming up the distributions that were not waited for')
+        base_urls = {distribution_id: url for distribution_id, url in base_urls.items() if distribution_id in waited_ids}
+        with metrics.phase('warmup'):
+            if not warmup.warm_up_distributions(base_urls, warmup_paths, spec.warmup, dry_run=dry_run):
+                logging.warning(f'Version {spec.version} is live, but some files could not be warmed up')
+    return success
 
 
 def run_rollback(spec: types.RollbackSpec, dry_run: bool = False) -> bool:
+    """Point the CDNs back to a previously deployed version.
+
+    Origins already serving the version are left alone. The others are switched,
+    and only the files that differ between the version each one serves and the
+    target version are invalidated, as far as the manifests of both tell.
+    """
     logging.info(f'Rollback spec={spec.to_dict()}')
+    metrics.reset()
+    metrics.instrument_boto3()
+    cloudfront.reset_config_cache()
+    try:
+        return _run_rollback(spec, dry_run)
+    finally:
+        metrics.log_summary()
+
+
+def _run_rollback(spec: types.RollbackSpec, dry_run: bool = False) -> bool:
+    started_at = time.monotonic()
     remote_prefix = build_remote_prefix(spec.storage.prefix, spec.version)
 
-    remote_prefix_exists = s3bucket.directory_exists(spec.storage.name, remote_prefix)
+    live_prefixes: Dict[Tuple[str, str], Optional[str]] = {}
+    with metrics.phase('live_version'):
+        for cdn in spec.cdns:
+            live_prefix = cloudfront.get_origin_path(cdn.distribution_id, cdn.origin_name)
+            live_prefixes[(cdn.distribution_id, cdn.origin_name)] = live_prefix.strip('/') if live_prefix else live_prefix
+    cdns = []
+    for cdn in spec.cdns:
+        if live_prefixes[(cdn.distribution_id, cdn.origin_name)] == remote_prefix.strip('/'):
+            logging.info(f'Distribution {cdn.distribution_id} (origin {cdn.origin_name}) already serves version {spec.version}')
+        else:
+            cdns.append(cdn)
+    if not cdns:
+        logging.info(f'Nothing to do, version {spec.version} is already live')
+        return True
+
+    # A version with a manifest is complete, so reading it is also the existence check.
+    with metrics.phase('existence_check'):
+        target_objects = s3bucket.index_manifest(spec.storage.name, remote_prefix)
+        remote_prefix_exists = target_objects is not None or s3bucket.directory_exists(spec.storage.name, remote_prefix)
     # Prevent the rollback if the remote path does not exist.
     if not remote_prefix_exists:
         logging.error(f'The specified version ({spec.version}) does not exist in the target storage ({vars(spec.storage)})')
         return False
 
-    return cloudfront.update(
-        spec.cdn.distribution_id,
-        spec.cdn.origin_name,
-        remote_prefix,
-        dry_run=dry_run,
-    )
+    # Versions are only compared through their manifests: listing them would delay the rollback,
+    # while invalidating all paths costs the same single request.
+    paths_to_invalidate: Dict[Tuple[str, str], Optional[List[str]]] = {}
+    if target_objects is not None:
+        with metrics.phase('invalidation_plan'):
+            live_versions = {}
+            for live_prefix in dict.fromkeys(live_prefixes[(cdn.distribution_id, cdn.origin_name)] for cdn in cdns):
+                live_objects = s3bucket.index_manifest(spec.storage.name, live_prefix) if live_prefix else None
+                if live_objects is not None:
+                    live_versions[live_prefix] = live_objects
+            target_entries = [
+                types.ManifestEntry(path=path, size=remote_object.size, etag=remote_object.etag)
+                for path, remote_object in target_objects.items()
+            ]
+            paths_to_invalidate = plan_invalidations(cdns, live_prefixes, live_versions, lambda: target_entries)
+
+    with metrics.phase('cdn_update'):
+        success = cloudfront.update_all(
+            cdns,
+            remote_prefix,
+            dry_run=dry_run,
+            paths_to_invalidate=paths_to_invalidate,
+        )
+    if not success:
+        return False
+    elapsed = time.monotonic() - started_at
+    if all(cdn.wait for cdn in cdns):
+        logging.info(f'Version {spec.version} is served by all the distributions, {elapsed:.1f}s after the rollback started')
+        metrics.gauge('time_to_serve_seconds', elapsed)
+    else:
+        logging.info(f'Rollback to version {spec.version} submitted in {elapsed:.1f}s, the distributions are still switching to it')
+    return True
+
+
+def run_prune(spec: types.PruneSpec, options: types.PruneOptions, dry_run: bool = False) -> bool:
+    """Delete the old versions, keeping the most recent ones and the ones the CDNs serve."""
+    logging.info(f'Prune spec={spec.to_dict()}, options={options.to_dict()}')
+    metrics.reset()
+    metrics.instrument_boto3()
+    cloudfront.reset_config_cache()
+    try:
+        return _run_prune(spec, options, dry_run)
+    finally:
+        metrics.log_summary()
+
+
+def _run_prune(spec: types.PruneSpec, options: types.PruneOptions, dry_run: bool = False) -> bool:
+    versions_prefix = find_versions_prefix(spec.storage.prefix)
+    if versions_prefix is None:
+        logging.error(f'The bucket prefix ({spec.storage.prefix}) must contain {{{{version}}}} to tell the versions apart')
+        return False
+    parent_prefix, suffix = versions_prefix
+    # At the bucket root, every top-level prefix (including those static-deployer knows nothing about) is taken as a version.
+    if not parent_prefix.strip('/') and not options.force:
+        logging.error(f'The versions of bucket prefix ({spec.storage.prefix}) are stored at the bucket root, where any other'
+                      f' top-level prefix would be taken as a version and deleted. Use --force to prune them anyway')
+        return False
+
+    # Nothing is deleted unless the versions every origin serves are known.
+    live_prefixes = set()
+    with metrics.phase('live_version'):
+        for cdn in spec.cdns:
+            live_prefix = cloudfront.get_origin_path(cdn.distribution_id, cdn.origin_name)
+            if live_prefix is None:
+                logging.error(f'Could not determine the live version of distribution {cdn.distribution_id}, nothing was deleted')
+                return False
+            if not live_prefix:
+                logging.error(f'The origin {cdn.origin_name} of distribution {cdn.distribution_id} points to the bucket root,'
+                              f' nothing was deleted')
+                return False
+            live_prefixes.add(live_prefix.strip('/'))
+
+    with metrics.phase('version_listing'):
+        names = s3bucket.list_versions(spec.storage.name, parent_prefix)
+        if names is None:
+            return False
+        versions = [name[:len(name) - len(suffix)] for name in names if name.endswith(suffix) and len(name) > len(suffix)]
+        prefixes = {version: build_remote_prefix(spec.storage.prefix, version) for version in versions}
+        timestamps = s3bucket.get_version_timestamps(spec.storage.name, list(prefixes.values()), options.concurrency)
+        if timestamps is None:
+            return False
+
+    # The most recent versions come first. Versions without any object have nothing to delete.
+    versions = sorted((version for version in versions if timestamps[prefixes[version]] is not None),
+                      key=lambda version: timestamps[prefixes[version]], reverse=True)
+    versions_to_delete = []
+    for index, version in enumerate(versions):
+        prefix = prefixes[version]
+        # Origin paths are compared without their leading and trailing slashes, whatever the bucket prefix has.
+        if prefix.strip('/') in live_prefixes:
+            logging.info(f'Keeping version {version} ({prefix}), it is live')
+        elif index < options.keep:
+            log.debug(f'Keeping version {version} ({prefix}), it is one of the {options.keep} most recent')
+        else:
+            versions_to_delete.append(version)
+    logging.info(f'Found {len(versions)} versions, {"would delete" if dry_run else "deleting"} {len(versions_to_delete)}'
+                 f' of them: {versions_to_delete}')
+    metrics.count('versions_deleted', len(versions_to_delete))
+    if not versions_to_delete:
+        return True
+
+    # The oldest versions are deleted first, so an interrupted prune leaves the most recent ones.
+    keys = s3bucket.iter_version_keys(spec.storage.name, [prefixes[version] for version in reversed(versions_to_delete)])
+    with metrics.phase('deletion'):
+        return s3bucket.delete_objects(spec.storage.name, keys, concurrency=options.concurrency,
+                                       max_rate=options.max_delete_rate, dry_run=dry_run)
+
+
+def build_cdn_targets(config: configuration.ConfigOptions) -> Optional[List[types.CdnDetails]]:
+    """Pair the (comma separated) distribution ids and origin names of the configuration.
+
+    A single origin name applies to all the distributions.
+
+    :return: The distribution/origin pairs, or None if the lists do not match.
+    """
+    distribution_ids = utils.split_list(config.cdn.distribution_id)
+    origin_names = utils.split_list(config.cdn.origin_name)
+    if len(origin_names) == 1:
+        origin_names = origin_names * len(distribution_ids)
+    if not distribution_ids or len(origin_names) != len(distribution_ids):
+        logging.error(f'Expected one origin name, or one per distribution, got distribution_id={config.cdn.distribution_id}'
+                      f' and origin_name={config.cdn.origin_name}')
+        return None
+    result = []
+    for distribution_id, origin_name in zip(distribution_ids, origin_names):
+        cloudfront_dist = types.CdnDetails(distribution_id=distribution_id, origin_name=origin_name)
+        if config.cdn.wait is not None:
+            cloudfront_dist.wait = config.cdn.wait
+        if config.cdn.invalidate_all:
+            cloudfront_dist.invalidate_all = True
+        if config.cdn.max_invalidation_paths:
+            cloudfront_dist.invalidation_limits.max_paths = config.cdn.max_invalidation_paths
+        if config.cdn.max_invalidation_wildcards is not None:
+            cloudfront_dist.invalidation_limits.max_wildcards = config.cdn.max_invalidation_wildcards
+        if config.cdn.invalidation_batch_size:
+            cloudfront_dist.invalidation_limits.batch_size = config.cdn.invalidation_batch_size
+        result.append(cloudfront_dist)
+    return result
 
 
 def deploy(config: configuration.ConfigOptions) -> bool:
     root_dir = os.path.abspath(config.content.root_dir)
     patterns = config.content.patterns
+    exclude_patterns = config.content.exclude_patterns
     bucket_name = config.storage.name
     bucket_prefix = config.storage.prefix
-    distribution_id = config.cdn.distribution_id
-    origin_name = config.cdn.origin_name
+    cache_dir = config.cache_dir
     version = config.version
     dry_run = config.dry_run
+    resume = config.resume
 
-    content = types.ContentDetails(root_dir=root_dir, patterns=patterns)
+    content = types.ContentDetails(root_dir=root_dir, patterns=patterns, exclude_patterns=exclude_patterns, cache_dir=cache_dir)
     bucket = types.StorageDetails(name=bucket_name, prefix=bucket_prefix)
-    cloudfront_dist = types.CdnDetails(distribution_id=distribution_id, origin_name=origin_name)
-    spec = types.DeploySpec(content=content, storage=bucket, cdn=cloudfront_dist, version=version)
+    cdns = build_cdn_targets(config)
+    if cdns is None:
+        return False
+    spec = types.DeploySpec(content=content, storage=bucket, cdns=cdns, version=version)
+    if config.cdn.warmup:
+        spec.warmup = types.WarmupSettings()
+        if config.cdn.warmup_base_url:
+            spec.warmup.base_urls = utils.split_list(config.cdn.warmup_base_url)
+            num_distributions = len({cdn.distribution_id for cdn in cdns})
+            if len(spec.warmup.base_urls) != num_distributions:
+                logging.error(f'Expected one warm-up base URL per distribution, got warmup_base_url={config.cdn.warmup_base_url}'
+                              f' for {num_distributions} distributions')
+                return False
+        if config.cdn.warmup_max_files:
+            spec.warmup.max_files = config.cdn.warmup_max_files
+        if config.cdn.warmup_concurrency:
+            spec.warmup.concurrency = config.cdn.warmup_concurrency
+        if config.cdn.warmup_max_rate:
+            spec.warmup.max_rate = config.cdn.warmup_max_rate
     options = types.UploadOptions()
     if config.storage.cache_maxage is not None:
         options.cache_maxage = utils.interval_string_to_seconds(config.storage.cache_maxage)
-    return run_deploy(spec, options, dry_run=dry_run)
+    if config.storage.incremental:
+        options.incremental = True
+    if config.storage.concurrency:
+        options.concurrency = config.storage.concurrency
+    if config.storage.small_file_threshold:
+        options.small_file_threshold = utils.size_string_to_bytes(config.storage.small_file_threshold)
+    if config.storage.multipart_threshold:
+        options.transfer.multipart_threshold = utils.size_string_to_bytes(config.storage.multipart_threshold)
+    if config.storage.multipart_chunksize:
+        options.transfer.multipart_chunksize = utils.size_string_to_bytes(config.storage.multipart_chunksize)
+    if config.storage.part_concurrency:
+        options.transfer.max_concurrency = config.storage.part_concurrency
+    if config.storage.max_bandwidth:
+        options.max_bandwidth = utils.size_string_to_bytes(config.storage.max_bandwidth)
+    if config.storage.adaptive_concurrency:
+        options.adaptive_concurrency = True
+    if config.storage.max_concurrency:
+        options.max_concurrency = config.storage.max_concurrency
+    if config.storage.max_request_rate:
+        options.max_request_rate = config.storage.max_request_rate
+    if config.storage.compression:
+        if not compression.check_encoding(config.storage.compression):
+            return False
+        options.compression = types.CompressionSettings(encoding=config.storage.compression)
+        if config.storage.compression_level is not None:
+            options.compression.level = config.storage.compression_level
+        if config.storage.compression_types:
+            options.compression.content_types = utils.split_list(config.storage.compression_types)
+    if config.storage.checksum_algorithm:
+        checksum_algorithm = config.storage.checksum_algorithm.upper()
+        if not s3bucket.check_checksum_algorithm(checksum_algorithm):
+            return False
+        options.checksum_algorithm = checksum_algorithm
+    for rule in config.storage.transfer_rules:
+        options.transfer_rules.append(types.TransferRule(
+            pattern=rule.pattern,
+            multipart_threshold=utils.size_string_to_bytes(rule.multipart_threshold) if rule.multipart_threshold else None,
+            multipart_chunksize=utils.size_string_to_bytes(rule.multipart_chunksize) if rule.multipart_chunksize else None,
+            max_concurrency=rule.part_concurrency,
+        ))
+    for rule in config.storage.metadata_rules:
+        options.metadata_rules.append(types.MetadataRule(
+            pattern=rule.pattern,
+            cache_control=rule.cache_control,
+            content_type=rule.content_type,
+            content_disposition=rule.content_disposition,
+            metadata=rule.metadata,
+        ))
+    success = run_deploy(spec, options, dry_run=dry_run, resume=bool(resume))
+    if config.metrics_file:
+        info = {'command': 'deploy', 'version': version, 'dry_run': bool(dry_run), 'success': success}
+        metrics.write_report(config.metrics_file, config.metrics_format or 'json', info)
+    return success
 
 
 def rollback(config: configuration.ConfigOptions) -> bool:
     bucket_name = config.storage.name
     bucket_prefix = config.storage.prefix
-    distribution_id = config.cdn.distribution_id
-    origin_name = config.cdn.origin_name
     version = config.version
     dry_run = config.dry_run
 
     bucket = types.StorageDetails(name=bucket_name, prefix=bucket_prefix)
-    cloudfront_dist = types.CdnDetails(distribution_id=distribution_id, origin_name=origin_name)
-    spec = types.RollbackSpec(storage=bucket, cdn=cloudfront_dist, version=version)
-    return run_rollback(spec, dry_run=dry_run)
+    cdns = build_cdn_targets(config)
+    if cdns is None:
+        return False
+    spec = types.RollbackSpec(storage=bucket, cdns=cdns, version=version)
+    success = run_rollback(spec, dry_run=dry_run)
+    if config.metrics_file:
+        info = {'command': 'rollback', 'version': version, 'dry_run': bool(dry_run), 'success': success}
+        metrics.write_report(config.metrics_file, config.metrics_format or 'json', info)
+    return success
+
+
+def prune(config: configuration.ConfigOptions) -> bool:
+    bucket = types.StorageDetails(name=config.storage.name, prefix=config.storage.prefix or '')
+    cdns = build_cdn_targets(config)
+    if cdns is None:
+        return False
+    spec = types.PruneSpec(storage=bucket, cdns=cdns)
+    options = types.PruneOptions()
+    if config.storage.keep_versions is not None:
+        options.keep = config.storage.keep_versions
+    if config.storage.delete_concurrency:
+        options.concurrency = config.storage.delete_concurrency
+    if config.storage.max_delete_rate:
+        options.max_delete_rate = config.storage.max_delete_rate
+    if config.force:
+        options.force = True
+    return run_prune(spec, options, dry_run=config.dry_run)
+
+
+def status(config: configuration.ConfigOptions) -> bool:
+    success = True
+    for distribution_id in utils.split_list(config.cdn.distribution_id):
+        distribution_status = cloudfront.get_status(distribution_id)
+        if distribution_status is None:
+            success = False
+            continue
+        print(f'Distribution: {distribution_status["distribution_id"]} ({distribution_status["domain_name"]})')
+        print(f'Status: {distribution_status["status"]}')
+        for origin_name, origin_path in distribution_status['origins'].items():
+            print(f'Origin {origin_name}: {origin_path or "(bucket root)"}')
+        pending_invalidations = distribution_status['pending_invalidations']
+        print(f'Invalidations in progress: {", ".join(pending_invalidations) if pending_invalidations else "none"}')
+    return success
+
+
+def wait(config: configuration.ConfigOptions) -> bool:
+    distribution_ids = utils.split_list(config.cdn.distribution_id)
+    invalidation_ids = utils.split_list(config.cdn.invalidation_ids) or None
+    if invalidation_ids and len(distribution_ids) > 1:
+        logging.error('Invalidation ids can only be given along with a single distribution id')
+        return False
+    return cloudfront.wait(distribution_ids, invalidation_ids)
 
 
 def parse_args() -> Tuple[str, configuration.ConfigOptions]:
@@ -177,6 +838,8 @@ def parse_args() -> Tuple[str, configuration.ConfigOptions]:
     if args.config_file:
         is_config_loaded = True
         config.load_from_io(args.config_file)
+    else:
+        config.load_from_dict({})
 
     subparsers = parser.add_subparsers(dest='subcommand', required=True, help='sub-command')
 
@@ -185,12 +848,20 @@ def parse_args() -> Tuple[str, configuration.ConfigOptions]:
                             help='do not actually perform the deploy',
                             required=False,
                             action='store_true')
+    cmd_deploy.add_argument('--resume',
+                            help='finish an interrupted deploy of the same version, uploading only the missing files',
+                            required=False,
+                            action='store_true')
     cmd_deploy.add_argument('--root-dir',
                             help='local directory holding files to deploy',
                             required=True)
     cmd_deploy.add_argument('--patterns',
-                            help='comma separated glob patterns, used to filter files contained by root-dir',
+                            help='comma separated glob patterns, used to filter files contained by root-dir.'
+                                 ' `*` does not match "/" (use `**`), unlike in the metadata and transfer rules of the config file',
                             required=True)
+    cmd_deploy.add_argument('--exclude-patterns',
+                            help='comma separated glob patterns of files to leave out, even if they match --patterns',
+                            required=False)
     cmd_deploy.add_argument('--bucket-name',
                             help='bucket name where the contents should be placed',
                             required=True)
@@ -198,15 +869,101 @@ def parse_args() -> Tuple[str, configuration.ConfigOptions]:
                             help='the prefix inside the bucket where the contents should be placed',
                             required=False)
     cmd_deploy.add_argument('--distribution-id',
-                            help='the cloudfront distribution id',
+                            help='the cloudfront distribution id, or a comma separated list of ids',
                             required=True)
     cmd_deploy.add_argument('--origin-name',
-                            help='the cloudfront origin name',
+                            help='the cloudfront origin name, or a comma separated list with one name per distribution',
                             required=True)
+    cmd_deploy.add_argument('--no-wait',
+                            help='return as soon as the distribution update and invalidations are accepted',
+                            required=False,
+                            action='store_true')
+    cmd_deploy.add_argument('--invalidate-all',
+                            help='invalidate every path (/*) instead of only the files that changed since the live version',
+                            required=False,
+                            action='store_true')
+    cmd_deploy.add_argument('--warmup',
+                            help='fetch the pages, then the largest files, through the distributions once they serve the version',
+                            required=False,
+                            action='store_true')
+    cmd_deploy.add_argument('--warmup-base-url',
+                            help='URL of the site, or a comma separated list with one URL per distribution'
+                                 ' (default: https:// and the CloudFront domain of each distribution)',
+                            required=False)
+    cmd_deploy.add_argument('--warmup-max-files',
+                            help='maximum number of files fetched from each distribution (default: 1000)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--warmup-concurrency',
+                            help='number of files fetched at the same time (default: 8)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--warmup-max-rate',
+                            help='maximum number of files fetched per second',
+                            required=False,
+                            type=float)
     cmd_deploy.add_argument('--cache-maxage',
                             help='cache the stored object for a specific amount of time (examples: 1y 2w 3d 4h 5m 30s)',
                             required=False,
                             default='')
+    cmd_deploy.add_argument('--concurrency',
+                            help='number of files uploaded at the same time (default: 32)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--small-file-threshold',
+                            help='files smaller than this are sent with a single request (default: 1MB)',
+                            required=False)
+    cmd_deploy.add_argument('--multipart-threshold',
+                            help='files of this size or larger are uploaded in multiple parts (default: 8MB)',
+                            required=False)
+    cmd_deploy.add_argument('--multipart-chunksize',
+                            help='size of each part of a multipart upload (default: 8MB)',
+                            required=False)
+    cmd_deploy.add_argument('--part-concurrency',
+                            help='number of parts of a single file uploaded at the same time (default: 10)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--max-bandwidth',
+                            help='maximum upload bandwidth per second, shared by all files (examples: 512KB 10MB)',
+                            required=False)
+    cmd_deploy.add_argument('--adaptive-concurrency',
+                            help='start with --concurrency, then grow it while S3 keeps up and shrink it when S3 throttles',
+                            required=False,
+                            action='store_true')
+    cmd_deploy.add_argument('--max-concurrency',
+                            help='highest concurrency --adaptive-concurrency may grow to (default: 4 times --concurrency)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--max-request-rate',
+                            help='maximum number of S3 requests per second, shared by all files',
+                            required=False,
+                            type=float)
+    cmd_deploy.add_argument('--compression',
+                            help='compress text files before uploading them, with gzip or br (brotli)',
+                            required=False,
+                            choices=['gzip', 'br'])
+    cmd_deploy.add_argument('--compression-level',
+                            help='compression level (default: 9 for gzip, 11 for br)',
+                            required=False,
+                            type=int)
+    cmd_deploy.add_argument('--checksum-algorithm',
+                            help='checksum S3 verifies for each uploaded file, in addition to the MD5 (CRC32C requires awscrt)',
+                            required=False,
+                            choices=['CRC32', 'CRC32C', 'SHA1', 'SHA256'])
+    cmd_deploy.add_argument('--incremental',
+                            help='copy unchanged files from the live version instead of uploading them again',
+                            required=False,
+                            action='store_true')
+    cmd_deploy.add_argument('--cache-dir',
+                            help='directory where file hashes are cached between runs (default: ~/.cache/static-deployer)',
+                            required=False)
+    cmd_deploy.add_argument('--metrics-file',
+                            help='write the time spent in each step and the transfer statistics to this file',
+                            required=False)
+    cmd_deploy.add_argument('--metrics-format',
+                            help='format of the metrics file: json or openmetrics (default: json)',
+                            required=False,
+                            choices=['json', 'openmetrics'])
     cmd_deploy.add_argument('--version',
                             help='version to be deployed',
                             required=True)
@@ -223,21 +980,81 @@ def parse_args() -> Tuple[str, configuration.ConfigOptions]:
                               help='the prefix inside the bucket where the contents reside',
                               required=False)
     cmd_rollback.add_argument('--distribution-id',
-                              help='the cloudfront distribution id',
+                              help='the cloudfront distribution id, or a comma separated list of ids',
                               required=True)
     cmd_rollback.add_argument('--origin-name',
-                              help='the cloudfront origin name',
+                              help='the cloudfront origin name, or a comma separated list with one name per distribution',
                               required=True)
+    cmd_rollback.add_argument('--no-wait',
+                              help='return as soon as the distribution update and invalidation are accepted',
+                              required=False,
+                              action='store_true')
+    cmd_rollback.add_argument('--metrics-file',
+                              help='write the time spent in each step and the transfer statistics to this file',
+                              required=False)
+    cmd_rollback.add_argument('--metrics-format',
+                              help='format of the metrics file: json or openmetrics (default: json)',
+                              required=False,
+                              choices=['json', 'openmetrics'])
     cmd_rollback.add_argument('--version',
                               help='version to rollback to',
                               required=True)
 
+    cmd_prune = subparsers.add_parser('prune')
+    cmd_prune.add_argument('--dry-run',
+                           help='only log the versions and the number of objects that would be deleted',
+                           required=False,
+                           action='store_true')
+    cmd_prune.add_argument('--force',
+                           help='prune even if the versions are stored at the bucket root, where every top-level prefix is taken as one',
+                           required=False,
+                           action='store_true')
+    cmd_prune.add_argument('--bucket-name',
+                           help='bucket name where the contents reside',
+                           required=True)
+    cmd_prune.add_argument('--bucket-prefix',
+                           help='the prefix inside the bucket where the contents reside, containing {{version}}',
+                           required=False)
+    cmd_prune.add_argument('--distribution-id',
+                           help='the cloudfront distribution id, or a comma separated list of ids, whose live versions are kept',
+                           required=True)
+    cmd_prune.add_argument('--origin-name',
+                           help='the cloudfront origin name, or a comma separated list with one name per distribution',
+                           required=True)
+    cmd_prune.add_argument('--keep',
+                           help='number of most recent versions to keep, besides the live ones (default: 10)',
+                           required=False,
+                           dest='keep_versions',
+                           type=int)
+    cmd_prune.add_argument('--delete-concurrency',
+                           help='number of batches of up to 1000 objects deleted at the same time (default: 8)',
+                           required=False,
+                           type=int)
+    cmd_prune.add_argument('--max-delete-rate',
+                           help='maximum number of objects deleted per second',
+                           required=False,
+                           type=int)
+
+    cmd_status = subparsers.add_parser('status')
+    cmd_status.add_argument('--distribution-id',
+                            help='the cloudfront distribution id, or a comma separated list of ids',
+                            required=True)
+
+    cmd_wait = subparsers.add_parser('wait')
+    cmd_wait.add_argument('--distribution-id',
+                          help='the cloudfront distribution id, or a comma separated list of ids',
+                          required=True)
+    cmd_wait.add_argument('--invalidation-ids',
+                          help='comma separated ids of the invalidations to wait for (default: all in progress)',
+                          required=False)
+
     # If a configuration file was loaded
     if is_config_loaded:
         loaded_args = config_adapter.to_args()
         log.debug(f'loaded_args={loaded_args}')
         # For each sub-parser
-        for sub_name, sub_parser in (('deploy', cmd_deploy), ('rollback', cmd_rollback)):
+        for sub_name, sub_parser in (('deploy', cmd_deploy), ('rollback', cmd_rollback), ('prune', cmd_prune),
+                                     ('status', cmd_status), ('wait', cmd_wait)):
             # Use values from configuration file by default
             sub_parser.set_defaults(**loaded_args)
 
@@ -263,6 +1080,12 @@ def main():
         success = deploy(config_options)
     elif subcommand == 'rollback':
         success = rollback(config_options)
+    elif subcommand == 'prune':
+        success = prune(config_options)
+    elif subcommand == 'status':
+        success = status(config_options)
+    elif subcommand == 'wait':
+        success = wait(config_options)
 
     if not success:
         logging.error('Exiting with error exit code due to previous errors')
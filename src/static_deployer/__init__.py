@@ -1,3 +1,22 @@
-from .common import log, types, configuration
-from .providers.cdn import cloudfront
-from .providers.storage import s3bucket
+import importlib
+
+# Submodules re-exported by the package. They are imported on first use, so
+# importing any part of the package (e.g. in the compression worker processes)
+# does not load boto3.
+_SUBMODULES = {
+    'log': '.common.log',
+    'types': '.common.types',
+    'configuration': '.common.configuration',
+    'cloudfront': '.providers.cdn.cloudfront',
+    's3bucket': '.providers.storage.s3bucket',
+}
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(_SUBMODULES[name], __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBMODULES))
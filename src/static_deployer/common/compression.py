@@ -0,0 +1,217 @@
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from . import log, types
+import gzip
+import hashlib
+import io
+import logging
+import mimetypes
+import multiprocessing
+import os
+import time
+
+# Content types worth compressing. Images (other than SVG), videos, archives and
+# WOFF/WOFF2 fonts are already compressed.
+DEFAULT_CONTENT_TYPES = (
+    'text/*',
+    'application/javascript',
+    'application/json',
+    'application/ld+json',
+    'application/manifest+json',
+    'application/rss+xml',
+    'application/atom+xml',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/wasm',
+    'application/vnd.ms-fontobject',
+    'font/otf',
+    'font/ttf',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+)
+DEFAULT_LEVELS = {
+    'gzip': 9,
+    'br': 11,
+}
+# Cached outputs not used for this long are deleted.
+DEFAULT_MAX_CACHE_AGE = 60 * 60 * 24 * 30
+# Extension of the marker stored instead of the output when compression did not pay off.
+SKIPPED_SUFFIX = '.skipped'
+
+
+def check_encoding(encoding: str) -> bool:
+    """Tell whether an encoding is supported, logging why it is not."""
+    if encoding not in DEFAULT_LEVELS:
+        logging.error(f'Unsupported compression: {encoding} (expected one of {", ".join(DEFAULT_LEVELS)})')
+        return False
+    if encoding == 'br':
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            logging.error('Brotli compression requires the brotli package: pip3 install brotli')
+            return False
+    return True
+
+
+def is_compressible(file_name: str, content_types: Iterable[str]) -> bool:
+    content_type, content_encoding = mimetypes.guess_type(file_name)
+    if content_type is None or content_encoding is not None:
+        return False
+    for pattern in content_types:
+        if pattern == content_type or (pattern.endswith('/*') and content_type.startswith(pattern[:-1])):
+            return True
+    return False
+
+
+def _compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data, quality=level)
+    # A fixed mtime makes the output, and so its ETag, only depend on the input.
+    # (gzip.compress only takes an mtime since Python 3.8.)
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=level, mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return output.getvalue()
+
+
+def compress_file(source_path: str, cache_dir: str, encoding: str, level: int, max_ratio: float) -> Tuple[Optional[str], int]:
+    """Compress a file, or reuse the output of a previous run for the same content.
+
+    Runs in a worker process, so it must only use picklable arguments and results.
+
+    :return: The path and size of the compressed file, or (None, 0) if compression does not pay off.
+    """
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    key = hashlib.md5(data).hexdigest()
+    output_path = os.path.join(cache_dir, key[:2], f'{key}-{level}.{encoding}')
+    for path in (output_path, output_path + SKIPPED_SUFFIX):
+        try:
+            # Keep the entry from being evicted.
+            os.utime(path)
+            if path == output_path:
+                return output_path, os.stat(output_path).st_size
+            return None, 0
+        except FileNotFoundError:
+            pass
+    compressed = _compress(data, encoding, level)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if len(compressed) > len(data) * max_ratio:
+        open(output_path + SKIPPED_SUFFIX, 'wb').close()
+        return None, 0
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(temp_path, output_path)
+    return output_path, len(compressed)
+
+
+class Compressor(object):
+    """Pipeline stage compressing the files of a stream of FileMapping's on a pool of processes.
+
+    Files that are worth compressing are sent to the pool, the others go through
+    untouched. Compressed files are uploaded from the cache directory, with the
+    Content-Encoding of the chosen encoding. S3 cannot negotiate the encoding with
+    each client, so a deploy uses a single one.
+    """
+
+    def __init__(self, root_dir: str, settings: types.CompressionSettings, cache_dir: str,
+                 max_workers: Optional[int] = None):
+        self.root_dir = root_dir
+        self.settings = settings
+        self.cache_dir = os.path.join(cache_dir, 'compressed')
+        self.level = settings.level if settings.level is not None else DEFAULT_LEVELS[settings.encoding]
+        self.content_types = settings.content_types or DEFAULT_CONTENT_TYPES
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.num_compressed = 0
+        self.num_skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _wants(self, file_mapping: types.FileMapping) -> bool:
+        return (file_mapping.size or 0) >= self.settings.min_size \
+               and is_compressible(file_mapping.local_path, self.content_types)
+
+    def _finish(self, file_mapping: types.FileMapping, future: Future) -> types.FileMapping:
+        try:
+            output_path, output_size = future.result()
+        except Exception as e:
+            # Whatever went wrong in the worker (e.g. a brotli error, or the pool broke), the file can still be uploaded.
+            logging.warning(f'Could not compress \'{file_mapping.local_path}\', it will be uploaded as is: {e!r}')
+            return file_mapping
+        if output_path is None:
+            self.num_skipped += 1
+            return file_mapping
+        self.num_compressed += 1
+        self.bytes_in += file_mapping.size or 0
+        self.bytes_out += output_size
+        file_mapping.source_path = output_path
+        file_mapping.content_encoding = self.settings.encoding
+        file_mapping.size = output_size
+        # The digest of the original file does not tell whether the compressed one changed.
+        file_mapping.digest = None
+        return file_mapping
+
+    def run(self, file_mappings: Iterable[types.FileMapping]) -> Iterator[types.FileMapping]:
+        """Compress the files of a stream as they come, yielding each one as soon as it is ready.
+
+        At most a few tasks per process are pending at any time, so memory usage
+        does not depend on the number of files.
+        """
+        started_at = time.monotonic()
+        max_pending = self.max_workers * 4
+        pending: Dict[Future, types.FileMapping] = {}
+        is_broken = False
+        # Upload threads are already running, and forking a process with threads is unsafe.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as executor:
+            for file_mapping in file_mappings:
+                if not self._wants(file_mapping):
+                    yield file_mapping
+                    continue
+                if is_broken:
+                    yield file_mapping
+                    continue
+                source_path = os.path.join(self.root_dir, file_mapping.local_path)
+                try:
+                    future = executor.submit(compress_file, source_path, self.cache_dir, self.settings.encoding,
+                                             self.level, self.settings.max_ratio)
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. killed for using too much memory), the pool takes no more tasks.
+                    logging.warning(f'The compression workers stopped, the remaining files will be uploaded as is: {e}')
+                    is_broken = True
+                    yield file_mapping
+                    continue
+                pending[future] = file_mapping
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._finish(pending.pop(future), future)
+            for future in list(pending):
+                yield self._finish(pending.pop(future), future)
+        elapsed = time.monotonic() - started_at
+        ratio = self.bytes_out / self.bytes_in if self.bytes_in else 1
+        logging.info(f'Compressed {self.num_compressed} files with {self.settings.encoding} (level {self.level}):'
+                     f' {self.bytes_in} -> {self.bytes_out} bytes ({ratio:.0%}),'
+                     f' {self.num_skipped} left uncompressed, in {elapsed:.2f}s')
+
+    def evict(self, max_age: int = DEFAULT_MAX_CACHE_AGE) -> None:
+        """Delete the cached outputs that were not used for `max_age` seconds."""
+        oldest_allowed = time.time() - max_age
+        num_evicted = 0
+        try:
+            for subdir in os.scandir(self.cache_dir):
+                if not subdir.is_dir():
+                    continue
+                for entry in os.scandir(subdir.path):
+                    if entry.stat().st_mtime < oldest_allowed:
+                        os.remove(entry.path)
+                        num_evicted += 1
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning(f'Could not evict old compressed files from {self.cache_dir}: {e}')
+        log.debug(f'Evicted {num_evicted} compressed files from {self.cache_dir}')
@@ -1,7 +1,6 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 from . import log
 import logging
-import toml
 import attr
 from io import IOBase
 
@@ -12,46 +11,168 @@ class ConfigOptions(object):
     class ContentConfig:
         root_dir: str
         patterns: str
+        exclude_patterns: str = None
+
+    @attr.s(auto_attribs=True)
+    class TransferRuleConfig:
+        # fnmatch-style, so `*` also matches '/', unlike in the glob patterns of the content.
+        pattern: str
+        multipart_threshold: Optional[str] = None
+        multipart_chunksize: Optional[str] = None
+        part_concurrency: Optional[int] = None
+
+    @attr.s(auto_attribs=True)
+    class MetadataRuleConfig:
+        # fnmatch-style, so `*` also matches '/', unlike in the glob patterns of the content.
+        pattern: str
+        cache_control: Optional[str] = None
+        content_type: Optional[str] = None
+        content_disposition: Optional[str] = None
+        metadata: Dict[str, str] = attr.Factory(dict)
 
     @attr.s(auto_attribs=True)
     class StorageConfig:
         name: str
         prefix: str
         cache_maxage: str
+        incremental: bool
+        concurrency: int
+        small_file_threshold: str = None
+        multipart_threshold: str = None
+        multipart_chunksize: str = None
+        part_concurrency: int = None
+        max_bandwidth: str = None
+        adaptive_concurrency: bool = None
+        max_concurrency: int = None
+        max_request_rate: float = None
+        compression: str = None
+        compression_level: int = None
+        compression_types: str = None
+        checksum_algorithm: str = None
+        transfer_rules: List['ConfigOptions.TransferRuleConfig'] = attr.Factory(list)
+        metadata_rules: List['ConfigOptions.MetadataRuleConfig'] = attr.Factory(list)
+        keep_versions: int = None
+        delete_concurrency: int = None
+        max_delete_rate: int = None
+
+    @attr.s(auto_attribs=True)
+    class DistributionConfig:
+        distribution_id: str
+        origin_name: str
 
     @attr.s(auto_attribs=True)
     class CdnConfig:
+        # Comma separated lists, so a single deploy can update several distributions.
         distribution_id: str
         origin_name: str
+        wait: bool = None
+        invalidation_ids: str = None
+        invalidate_all: bool = None
+        max_invalidation_paths: int = None
+        max_invalidation_wildcards: int = None
+        invalidation_batch_size: int = None
+        warmup: bool = None
+        warmup_base_url: str = None
+        warmup_max_files: int = None
+        warmup_concurrency: int = None
+        warmup_max_rate: float = None
+        distributions: List['ConfigOptions.DistributionConfig'] = attr.Factory(list)
 
     content: ContentConfig
     storage: StorageConfig
     cdn: CdnConfig
+    cache_dir: str
+    metrics_file: str
+    metrics_format: str
     version: str
     dry_run: bool
+    resume: bool
+    force: bool
 
     def to_dict(self) -> Dict[str, Any]:
         return attr.asdict(self)
 
     def load_from_dict(self, data: dict) -> None:
+        # Missing sections are left empty, so they can still be filled from the command-line arguments.
+        content_data = data.get("content") or {}
+        storage_data = data.get("storage") or {}
+        cdn_data = data.get("cdn") or {}
         self.content = ConfigOptions.ContentConfig(
-            root_dir=data["content"].get("root_dir"),
-            patterns=data["content"].get("patterns"),
-        ) if data.get("content") else None
+            root_dir=content_data.get("root_dir"),
+            patterns=content_data.get("patterns"),
+            exclude_patterns=content_data.get("exclude_patterns"),
+        )
         self.storage = ConfigOptions.StorageConfig(
-            name=data["storage"].get("name"),
-            prefix=data["storage"].get("prefix"),
-            cache_maxage=data["storage"].get("cache_maxage"),
-        ) if data.get("storage") else None
+            name=storage_data.get("name"),
+            prefix=storage_data.get("prefix"),
+            cache_maxage=storage_data.get("cache_maxage"),
+            incremental=storage_data.get("incremental"),
+            concurrency=storage_data.get("concurrency"),
+            small_file_threshold=storage_data.get("small_file_threshold"),
+            multipart_threshold=storage_data.get("multipart_threshold"),
+            multipart_chunksize=storage_data.get("multipart_chunksize"),
+            part_concurrency=storage_data.get("part_concurrency"),
+            max_bandwidth=storage_data.get("max_bandwidth"),
+            adaptive_concurrency=storage_data.get("adaptive_concurrency"),
+            max_concurrency=storage_data.get("max_concurrency"),
+            max_request_rate=storage_data.get("max_request_rate"),
+            compression=storage_data.get("compression"),
+            compression_level=storage_data.get("compression_level"),
+            compression_types=storage_data.get("compression_types"),
+            checksum_algorithm=storage_data.get("checksum_algorithm"),
+            keep_versions=storage_data.get("keep_versions"),
+            delete_concurrency=storage_data.get("delete_concurrency"),
+            max_delete_rate=storage_data.get("max_delete_rate"),
+            transfer_rules=[
+                ConfigOptions.TransferRuleConfig(
+                    pattern=rule["pattern"],
+                    multipart_threshold=rule.get("multipart_threshold"),
+                    multipart_chunksize=rule.get("multipart_chunksize"),
+                    part_concurrency=rule.get("part_concurrency"),
+                ) for rule in storage_data.get("transfer_rules", [])
+            ],
+            metadata_rules=[
+                ConfigOptions.MetadataRuleConfig(
+                    pattern=rule["pattern"],
+                    cache_control=rule.get("cache_control"),
+                    content_type=rule.get("content_type"),
+                    content_disposition=rule.get("content_disposition"),
+                    metadata={str(key): str(value) for key, value in rule.get("metadata", {}).items()},
+                ) for rule in storage_data.get("metadata_rules", [])
+            ],
+        )
         self.cdn = ConfigOptions.CdnConfig(
-            distribution_id=data["cdn"].get("distribution_id"),
-            origin_name=data["cdn"].get("origin_name"),
-        ) if data.get("cdn") else None
+            distribution_id=cdn_data.get("distribution_id"),
+            origin_name=cdn_data.get("origin_name"),
+            wait=cdn_data.get("wait"),
+            invalidate_all=cdn_data.get("invalidate_all"),
+            max_invalidation_paths=cdn_data.get("max_invalidation_paths"),
+            max_invalidation_wildcards=cdn_data.get("max_invalidation_wildcards"),
+            invalidation_batch_size=cdn_data.get("invalidation_batch_size"),
+            warmup=cdn_data.get("warmup"),
+            warmup_base_url=cdn_data.get("warmup_base_url"),
+            warmup_max_files=cdn_data.get("warmup_max_files"),
+            warmup_concurrency=cdn_data.get("warmup_concurrency"),
+            warmup_max_rate=cdn_data.get("warmup_max_rate"),
+            distributions=[
+                ConfigOptions.DistributionConfig(
+                    distribution_id=distribution["distribution_id"],
+                    origin_name=distribution.get("origin_name", cdn_data.get("origin_name")),
+                ) for distribution in cdn_data.get("distributions", [])
+            ],
+        )
+        self.cache_dir = data.get("cache_dir")
+        self.metrics_file = data.get("metrics_file")
+        self.metrics_format = data.get("metrics_format")
         self.version = data.get("version")
         self.dry_run = data.get("dry_run")
+        self.resume = data.get("resume")
+        self.force = data.get("force")
         log.debug(f'config={str(self)}')
 
     def load_from_toml(self, data: str) -> bool:
+        # Only commands given a config file need the parser.
+        import toml
         try:
             parsed = toml.loads(data)
             self.load_from_dict(parsed)
@@ -86,22 +207,53 @@ class ConfigOptionsAdapter(object):
         return {
             'root_dir': self.config.content.root_dir,
             'patterns': self.config.content.patterns,
+            'exclude_patterns': self.config.content.exclude_patterns,
             'bucket_name': self.config.storage.name,
             'bucket_prefix': self.config.storage.prefix,
             'cache_maxage': self.config.storage.cache_maxage,
-            'distribution_id': self.config.cdn.distribution_id,
-            'origin_name': self.config.cdn.origin_name,
+            'incremental': self.config.storage.incremental,
+            'concurrency': self.config.storage.concurrency,
+            'small_file_threshold': self.config.storage.small_file_threshold,
+            'multipart_threshold': self.config.storage.multipart_threshold,
+            'multipart_chunksize': self.config.storage.multipart_chunksize,
+            'part_concurrency': self.config.storage.part_concurrency,
+            'max_bandwidth': self.config.storage.max_bandwidth,
+            'adaptive_concurrency': self.config.storage.adaptive_concurrency,
+            'max_concurrency': self.config.storage.max_concurrency,
+            'max_request_rate': self.config.storage.max_request_rate,
+            'compression': self.config.storage.compression,
+            'compression_level': self.config.storage.compression_level,
+            'checksum_algorithm': self.config.storage.checksum_algorithm,
+            'keep_versions': self.config.storage.keep_versions,
+            'delete_concurrency': self.config.storage.delete_concurrency,
+            'max_delete_rate': self.config.storage.max_delete_rate,
+            **self._distribution_args(),
+            'no_wait': not self.config.cdn.wait if self.config.cdn.wait is not None else None,
+            'invalidate_all': self.config.cdn.invalidate_all,
+            'warmup': self.config.cdn.warmup,
+            'warmup_base_url': self.config.cdn.warmup_base_url,
+            'warmup_max_files': self.config.cdn.warmup_max_files,
+            'warmup_concurrency': self.config.cdn.warmup_concurrency,
+            'warmup_max_rate': self.config.cdn.warmup_max_rate,
+            'cache_dir': self.config.cache_dir,
+            'metrics_file': self.config.metrics_file,
+            'metrics_format': self.config.metrics_format,
             'version': self.config.version,
             'dry_run': self.config.dry_run,
+            'resume': self.config.resume,
+            'force': self.config.force,
         }
 
     def merge_args(self, data: dict) -> None:
         value = data.get('root_dir')
         if value:
             self.config.content.root_dir = value
-        value = data['patterns']
+        value = data.get('patterns')
         if value:
             self.config.content.patterns = value
+        value = data.get('exclude_patterns')
+        if value:
+            self.config.content.exclude_patterns = value
         value = data.get('bucket_name')
         if value:
             self.config.storage.name = value
@@ -111,20 +263,119 @@ class ConfigOptionsAdapter(object):
         value = data.get('cache_maxage')
         if value:
             self.config.storage.cache_maxage = value
+        value = data.get('incremental')
+        if value:
+            self.config.storage.incremental = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('concurrency')
+        if value:
+            self.config.storage.concurrency = int(value)
+        value = data.get('small_file_threshold')
+        if value:
+            self.config.storage.small_file_threshold = value
+        value = data.get('multipart_threshold')
+        if value:
+            self.config.storage.multipart_threshold = value
+        value = data.get('multipart_chunksize')
+        if value:
+            self.config.storage.multipart_chunksize = value
+        value = data.get('part_concurrency')
+        if value:
+            self.config.storage.part_concurrency = int(value)
+        value = data.get('max_bandwidth')
+        if value:
+            self.config.storage.max_bandwidth = value
+        value = data.get('adaptive_concurrency')
+        if value:
+            self.config.storage.adaptive_concurrency = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('max_concurrency')
+        if value:
+            self.config.storage.max_concurrency = int(value)
+        value = data.get('max_request_rate')
+        if value:
+            self.config.storage.max_request_rate = float(value)
+        value = data.get('compression')
+        if value:
+            self.config.storage.compression = value
+        value = data.get('compression_level')
+        if value is not None:
+            self.config.storage.compression_level = int(value)
+        value = data.get('checksum_algorithm')
+        if value:
+            self.config.storage.checksum_algorithm = value
+        value = data.get('keep_versions')
+        if value is not None:
+            self.config.storage.keep_versions = int(value)
+        value = data.get('delete_concurrency')
+        if value:
+            self.config.storage.delete_concurrency = int(value)
+        value = data.get('max_delete_rate')
+        if value:
+            self.config.storage.max_delete_rate = int(value)
         value = data.get('distribution_id')
         if value:
             self.config.cdn.distribution_id = value
         value = data.get('origin_name')
         if value:
             self.config.cdn.origin_name = value
+        value = data.get('no_wait')
+        if value:
+            self.config.cdn.wait = not (value if type(value) == bool else self._str_to_bool(value))
+        value = data.get('invalidation_ids')
+        if value:
+            self.config.cdn.invalidation_ids = value
+        value = data.get('invalidate_all')
+        if value:
+            self.config.cdn.invalidate_all = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('warmup')
+        if value:
+            self.config.cdn.warmup = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('warmup_base_url')
+        if value:
+            self.config.cdn.warmup_base_url = value
+        value = data.get('warmup_max_files')
+        if value:
+            self.config.cdn.warmup_max_files = int(value)
+        value = data.get('warmup_concurrency')
+        if value:
+            self.config.cdn.warmup_concurrency = int(value)
+        value = data.get('warmup_max_rate')
+        if value:
+            self.config.cdn.warmup_max_rate = float(value)
+        value = data.get('cache_dir')
+        if value:
+            self.config.cache_dir = value
+        value = data.get('metrics_file')
+        if value:
+            self.config.metrics_file = value
+        value = data.get('metrics_format')
+        if value:
+            self.config.metrics_format = value
         value = data.get('version')
         if value:
             self.config.version = value
-        value = data['dry_run']
+        value = data.get('dry_run')
         if value:
             self.config.dry_run = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('resume')
+        if value:
+            self.config.resume = value if type(value) == bool else self._str_to_bool(value)
+        value = data.get('force')
+        if value:
+            self.config.force = value if type(value) == bool else self._str_to_bool(value)
         log.debug(f'config={str(self.config)}')
 
+    def _distribution_args(self) -> Dict[str, Any]:
+        cdn = self.config.cdn
+        if not cdn.distributions:
+            return {'distribution_id': cdn.distribution_id, 'origin_name': cdn.origin_name}
+        # The `[[cdn.distributions]]` entries come after the distribution of the `[cdn]` section, if any.
+        pairs = [(cdn.distribution_id, cdn.origin_name)] if cdn.distribution_id else []
+        pairs.extend((distribution.distribution_id, distribution.origin_name) for distribution in cdn.distributions)
+        return {
+            'distribution_id': ','.join(distribution_id for distribution_id, _ in pairs),
+            'origin_name': ','.join(origin_name or '' for _, origin_name in pairs),
+        }
+
     @staticmethod
     def _str_to_bool(data: str) -> bool:
         return data.lower() in ['true', '1', 't', 'y', 'yes']
\ No newline at end of file
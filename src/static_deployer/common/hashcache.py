@@ -0,0 +1,126 @@
+from typing import Dict, List, Optional
+from . import log, types
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+CACHE_FORMAT_VERSION = 2
+# Entries not used for this long are dropped when the cache is saved.
+DEFAULT_MAX_ENTRY_AGE = 60 * 60 * 24 * 30
+# Cache files (one per root directory) not used for this long are deleted.
+DEFAULT_MAX_FILE_AGE = 60 * 60 * 24 * 30
+# At most this many cache files are kept, the least recently used are deleted first.
+DEFAULT_MAX_FILES = 32
+
+
+def default_cache_dir() -> str:
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'static-deployer')
+
+
+class HashCache(object):
+    """Persistent cache of file digests for a single root directory.
+
+    Entries are keyed by the relative path of the file and are only valid while
+    its size, modification time and inode stay the same, so an unchanged file
+    is never read twice across runs. Since the ETag of a multipart upload depends
+    on the part size, it is also part of the key.
+    """
+
+    def __init__(self, cache_dir: str, root_dir: str,
+                 max_entry_age: int = DEFAULT_MAX_ENTRY_AGE,
+                 max_file_age: int = DEFAULT_MAX_FILE_AGE,
+                 max_files: int = DEFAULT_MAX_FILES):
+        self.cache_dir = cache_dir
+        self.root_dir = root_dir
+        self.max_entry_age = max_entry_age
+        self.max_file_age = max_file_age
+        self.max_files = max_files
+        root_id = hashlib.sha1(os.path.abspath(root_dir).encode('utf-8')).hexdigest()[:16]
+        self.file_name = os.path.join(cache_dir, f'hashes-{root_id}.json')
+        # path -> [size, mtime_ns, inode, part_size, md5, etag, last_used]
+        self._entries: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self._now = int(time.time())
+        self._hits = 0
+        self._misses = 0
+
+    def load(self) -> None:
+        try:
+            with open(self.file_name, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'Ignoring unreadable hash cache {self.file_name}: {e}')
+            return
+        if data.get('version') != CACHE_FORMAT_VERSION or data.get('root_dir') != self.root_dir:
+            log.debug(f'Ignoring incompatible hash cache {self.file_name}')
+            return
+        self._entries = data.get('entries', {})
+        log.debug(f'Loaded {len(self._entries)} entries from {self.file_name}')
+
+    def get(self, path: str, stat_result: os.stat_result, part_size: int = 0) -> Optional[types.FileDigest]:
+        """Get the digest of a file, if it did not change since it was stored.
+
+        :param part_size: Part size used to compute the ETag, or 0 if the file is uploaded in a single part.
+        """
+        key = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, part_size]
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0:4] != key:
+                self._misses += 1
+                return None
+            entry[6] = self._now
+            self._hits += 1
+            return types.FileDigest(md5=entry[4], etag=entry[5])
+
+    def put(self, path: str, stat_result: os.stat_result, digest: types.FileDigest, part_size: int = 0) -> None:
+        with self._lock:
+            self._entries[path] = [
+                stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, part_size,
+                digest.md5, digest.etag, self._now,
+            ]
+
+    def save(self) -> None:
+        """Write the cache back to disk, dropping stale entries and evicting old cache files."""
+        with self._lock:
+            oldest_allowed = self._now - self.max_entry_age
+            entries = {path: entry for path, entry in self._entries.items() if entry[6] >= oldest_allowed}
+        data = {
+            'version': CACHE_FORMAT_VERSION,
+            'root_dir': self.root_dir,
+            'entries': entries,
+        }
+        temp_file_name = f'{self.file_name}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_file_name, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            # Atomically replace the previous cache, so concurrent runs never see a partial file.
+            os.replace(temp_file_name, self.file_name)
+        except OSError as e:
+            logging.warning(f'Could not save hash cache {self.file_name}: {e}')
+            return
+        logging.info(f'Hash cache: {self._hits} hits, {self._misses} misses, {len(entries)} entries saved')
+        self._evict_files()
+
+    def _evict_files(self) -> None:
+        try:
+            cache_files = [
+                entry for entry in os.scandir(self.cache_dir)
+                if entry.name.startswith('hashes-') and entry.name.endswith('.json')
+            ]
+            cache_files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+            oldest_allowed = self._now - self.max_file_age
+            for index, entry in enumerate(cache_files):
+                if entry.path == self.file_name:
+                    continue
+                if index >= self.max_files or entry.stat().st_mtime < oldest_allowed:
+                    log.debug(f'Evicting hash cache {entry.path}')
+                    os.remove(entry.path)
+        except OSError as e:
+            logging.warning(f'Could not evict old hash caches from {self.cache_dir}: {e}')
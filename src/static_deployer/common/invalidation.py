@@ -0,0 +1,213 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+from . import log, types
+import heapq
+import logging
+
+INDEX_DOCUMENT = 'index.html'
+
+
+def diff_versions(base_objects: Dict[str, types.RemoteObject],
+                  entries: Iterable[types.ManifestEntry]) -> Tuple[Set[str], Set[str]]:
+    """Compare the live version with a new one.
+
+    Files are compared by ETag, so files added, removed or modified are all
+    considered changed. Files copied from the live version to a new ETag (large
+    files uploaded in multiple parts) are also seen as changed, which only costs
+    a few extra paths.
+
+    :param base_objects: The objects of the live version, indexed by their relative path.
+    :param entries: The manifest entries of the new version.
+    :return: The relative paths (using '/' as separator) that changed, and the paths of all files in either version.
+    """
+    changed = set()
+    new_paths = set()
+    for entry in entries:
+        new_paths.add(entry.path)
+        base_object = base_objects.get(entry.path)
+        if base_object is None or base_object.etag != entry.etag:
+            changed.add(entry.path)
+    # Removed files.
+    changed.update(path for path in base_objects if path not in new_paths)
+    return changed, new_paths.union(base_objects)
+
+
+class _Node(object):
+    __slots__ = ('name', 'parent', 'children', 'paths', 'num_files', 'num_changed',
+                 'num_paths', 'num_wildcards', 'num_evicted', 'collapsed', 'stamp')
+
+    def __init__(self, name: str, parent: Optional['_Node']):
+        self.name = name
+        self.parent = parent
+        self.children: Dict[str, _Node] = {}
+        # Exact paths to invalidate for the files directly inside this directory.
+        self.paths: List[str] = []
+        # Totals for the whole subtree.
+        self.num_files = 0
+        self.num_changed = 0
+        # Current plan for the subtree: number of paths, how many are wildcards and
+        # how many unchanged files they evict.
+        self.num_paths = 0
+        self.num_wildcards = 0
+        self.num_evicted = 0
+        self.collapsed = False
+        self.stamp = 0
+
+    def url_prefix(self) -> str:
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/' + ''.join(f'{quote(name)}/' for name in reversed(names))
+
+    def is_covered(self) -> bool:
+        node = self.parent
+        while node is not None:
+            if node.collapsed:
+                return True
+            node = node.parent
+        return False
+
+
+def _build_tree(changed: Set[str], all_paths: Iterable[str]) -> _Node:
+    root = _Node('', None)
+    for path in all_paths:
+        *dir_names, file_name = path.split('/')
+        nodes = [root]
+        for name in dir_names:
+            node = nodes[-1].children.get(name)
+            if node is None:
+                node = nodes[-1].children[name] = _Node(name, nodes[-1])
+            nodes.append(node)
+        is_changed = path in changed
+        for node in nodes:
+            node.num_files += 1
+            node.num_changed += is_changed
+        if is_changed:
+            directory = nodes[-1]
+            directory.paths.append(directory.url_prefix() + quote(file_name))
+            # Requests for the directory itself are served (and cached) under their own path.
+            if file_name == INDEX_DOCUMENT:
+                directory.paths.append(directory.url_prefix())
+    return root
+
+
+def _count_paths(node: _Node) -> None:
+    # Iterative post-order traversal, trees can be deeper than the recursion limit allows.
+    stack = [(node, False)]
+    while stack:
+        current, visited = stack.pop()
+        if visited:
+            current.num_paths = len(current.paths) + sum(child.num_paths for child in current.children.values())
+        else:
+            stack.append((current, True))
+            stack.extend((child, False) for child in current.children.values())
+
+
+def _iter_nodes(node: _Node) -> Iterable[_Node]:
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(current.children.values())
+
+
+def _collect_paths(root: _Node) -> List[str]:
+    result = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.collapsed:
+            result.append(node.url_prefix() + '*')
+            continue
+        result.extend(node.paths)
+        stack.extend(node.children.values())
+    return sorted(result)
+
+
+def plan_invalidation(changed: Set[str], all_paths: Iterable[str],
+                      limits: Optional[types.InvalidationLimits] = None) -> List[str]:
+    """Compute the paths to invalidate so that all the changed files are evicted from the CDN.
+
+    Changed files are invalidated one by one as long as the plan fits in the
+    CloudFront limits. Directories whose files all changed are collapsed into a
+    single wildcard path, which evicts nothing more. Then, while the plan does not
+    fit, the directory whose wildcard saves the most paths for the fewest
+    unchanged files evicted is collapsed. `/*` is used when the plan would evict
+    too large a share of the files anyway.
+
+    :param changed: The relative paths (using '/' as separator) that changed.
+    :param all_paths: The relative paths of all files in either version, each listed once.
+    :param limits: The CloudFront limits the plan must fit in.
+    :return: The paths to invalidate, possibly empty.
+    """
+    limits = limits or types.InvalidationLimits()
+    if not changed:
+        return []
+    root = _build_tree(changed, all_paths)
+    _count_paths(root)
+    total_paths = root.num_paths
+    if root.num_changed >= root.num_files * limits.full_invalidation_ratio:
+        log.debug(f'{root.num_changed} of {root.num_files} files changed, invalidating everything')
+        return ['/*']
+
+    def push(node: _Node) -> None:
+        saved = node.num_paths - 1
+        if saved <= 0:
+            return
+        evicted = node.num_files - node.num_changed - node.num_evicted
+        node.stamp += 1
+        # Fewest evicted files per saved path first, then the largest savings.
+        heapq.heappush(heap, (evicted / saved, -saved, id(node), node.stamp, node))
+
+    heap = []
+    for node in _iter_nodes(root):
+        push(node)
+    num_wildcards = 0
+    while heap:
+        ratio, _, _, stamp, node = heapq.heappop(heap)
+        if stamp != node.stamp or node.collapsed or node.is_covered():
+            continue
+        saved = node.num_paths - 1
+        evicted = node.num_files - node.num_changed - node.num_evicted
+        # Wildcards are scarce, so a free one must at least replace a few paths.
+        is_free = evicted == 0 and saved > 1
+        over_limit = total_paths - num_wildcards > limits.max_paths
+        if not (is_free or over_limit):
+            if ratio == 0:
+                continue
+            break
+        new_num_wildcards = num_wildcards - node.num_wildcards + 1
+        if new_num_wildcards > limits.max_wildcards and new_num_wildcards >= num_wildcards and node is not root:
+            # Out of wildcards, this node could only be collapsed together with others.
+            continue
+        wildcards_delta = 1 - node.num_wildcards
+        node.collapsed = True
+        node.num_paths = 1
+        node.num_wildcards = 1
+        node.num_evicted += evicted
+        total_paths -= saved
+        num_wildcards = new_num_wildcards
+        ancestor = node.parent
+        while ancestor is not None:
+            ancestor.num_paths -= saved
+            ancestor.num_wildcards += wildcards_delta
+            ancestor.num_evicted += evicted
+            push(ancestor)
+            ancestor = ancestor.parent
+
+    if root.collapsed:
+        return ['/*']
+    num_evicted = root.num_evicted
+    if root.num_changed + num_evicted >= root.num_files * limits.full_invalidation_ratio:
+        log.debug(f'The plan would evict {root.num_changed + num_evicted} of {root.num_files} files, invalidating everything')
+        return ['/*']
+    result = _collect_paths(root)
+    logging.info(f'Invalidation plan: {len(result)} paths ({num_wildcards} wildcards) for {root.num_changed} changed files'
+                 f' out of {root.num_files}, evicting {num_evicted} unchanged files')
+    return result
+
+
+def split_batches(paths: List[str], batch_size: int) -> List[List[str]]:
+    return [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
@@ -0,0 +1,199 @@
+from typing import Dict, IO, Optional, Tuple
+from . import log, types
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+JOURNAL_FORMAT_VERSION = 1
+# Entries are written to disk in batches of this many entries...
+DEFAULT_BATCH_SIZE = 256
+# ...or at least this often (in seconds), whichever comes first.
+DEFAULT_BATCH_INTERVAL = 1.0
+# Journals of deploys that were never resumed are deleted after this long.
+DEFAULT_MAX_FILE_AGE = 60 * 60 * 24 * 30
+
+# The size and modification time (in ns) of a local file.
+LocalStat = Tuple[int, int]
+# Upload options that shape the stored objects, so their entries are only reused with the same values.
+OBJECT_OPTIONS = ('cache_maxage', 'transfer', 'transfer_rules', 'metadata_rules', 'compression', 'checksum_algorithm')
+
+
+def options_id(options: Optional[types.UploadOptions]) -> Optional[str]:
+    """Identify the options an object was uploaded with (e.g. its headers, compression or part size)."""
+    if options is None:
+        return None
+    values = {name: value for name, value in options.to_dict().items() if name in OBJECT_OPTIONS}
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class UploadJournal(object):
+    """Append-only journal of the files of a version that were uploaded, so an interrupted deploy can be resumed.
+
+    Each line holds the manifest entry of an uploaded file, along with the size and
+    modification time the local file had, which tell whether it changed since. The
+    journal is discarded when the root directory or the upload options differ. Lines
+    are buffered and written in batches, each followed by an fsync, so the journal
+    costs a few syscalls per batch rather than per file. A crash loses at most the
+    last batch, whose files are then uploaded again.
+    """
+
+    def __init__(self, cache_dir: str, bucket_name: str, prefix: str, root_dir: str,
+                 options: Optional[types.UploadOptions] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_interval: float = DEFAULT_BATCH_INTERVAL):
+        self.cache_dir = os.path.join(cache_dir, 'journals')
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.root_dir = root_dir
+        self.options_id = options_id(options)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        version_id = hashlib.sha1(f'{bucket_name}/{prefix}'.encode('utf-8')).hexdigest()[:16]
+        self.file_name = os.path.join(self.cache_dir, f'uploads-{version_id}.jsonl')
+        self._file: Optional[IO[str]] = None
+        self._buffer = []
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _header(self) -> Dict:
+        return {
+            'format': JOURNAL_FORMAT_VERSION,
+            'bucket': self.bucket_name,
+            'prefix': self.prefix,
+            'root_dir': self.root_dir,
+            'options': self.options_id,
+        }
+
+    @staticmethod
+    def _read_header(f: IO[str]) -> Dict:
+        try:
+            return json.loads(f.readline() or '{}')
+        except ValueError:
+            return {}
+
+    def _is_compatible(self) -> bool:
+        try:
+            with open(self.file_name, 'r') as f:
+                return self._read_header(f) == self._header()
+        except OSError:
+            return False
+
+    def load(self) -> Dict[str, Tuple[LocalStat, types.ManifestEntry]]:
+        """Read the files a previous run recorded.
+
+        Truncated lines (a run died while writing them) are ignored.
+
+        :return: A dict mapping relative paths (using '/' as separator) to the stat of the local file and its entry.
+        """
+        result = {}
+        try:
+            with open(self.file_name, 'r') as f:
+                if self._read_header(f) != self._header():
+                    log.debug(f'Ignoring incompatible upload journal {self.file_name}')
+                    return {}
+                for line in f:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    entry = types.ManifestEntry(
+                        path=data['path'],
+                        size=data['size'],
+                        etag=data['etag'],
+                        content_type=data.get('content_type'),
+                        content_encoding=data.get('content_encoding'),
+                    )
+                    result[entry.path] = ((data['local_size'], data['local_mtime_ns']), entry)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'Ignoring unreadable upload journal {self.file_name}: {e}')
+            return {}
+        log.debug(f'Loaded {len(result)} entries from {self.file_name}')
+        return result
+
+    def open(self, resume: bool = False) -> bool:
+        """Start recording uploads.
+
+        :param resume: Append to the journal of a previous run (if any) instead of starting a new one.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if resume and self._is_compatible():
+                self._file = open(self.file_name, 'a')
+                # Terminate a line the previous run may have left truncated.
+                self._file.write('\n')
+            else:
+                self._file = open(self.file_name, 'w')
+                self._file.write(json.dumps(self._header(), separators=(',', ':')) + '\n')
+            self._sync()
+        except OSError as e:
+            logging.warning(f'Could not open upload journal {self.file_name}, the deploy will not be resumable: {e}')
+            self._file = None
+            return False
+        self._evict_files()
+        return True
+
+    def record(self, local_stat: Optional[LocalStat], entry: types.ManifestEntry) -> None:
+        if self._file is None or local_stat is None:
+            return
+        line = json.dumps({
+            'path': entry.path,
+            'size': entry.size,
+            'etag': entry.etag,
+            'content_type': entry.content_type,
+            'content_encoding': entry.content_encoding,
+            'local_size': local_stat[0],
+            'local_mtime_ns': local_stat[1],
+        }, separators=(',', ':'))
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._flushed_at >= self.batch_interval:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer or self._file is None:
+            return
+        try:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._sync()
+        except OSError as e:
+            logging.warning(f'Could not write to upload journal {self.file_name}, the deploy will not be resumable: {e}')
+            self._file.close()
+            self._file = None
+        self._buffer = []
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self) -> None:
+        """Delete the journal, once the deploy it belongs to completed."""
+        self.close()
+        try:
+            os.remove(self.file_name)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f'Could not remove upload journal {self.file_name}: {e}')
+
+    def _evict_files(self, max_age: int = DEFAULT_MAX_FILE_AGE) -> None:
+        oldest_allowed = time.time() - max_age
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.path != self.file_name and entry.stat().st_mtime < oldest_allowed:
+                    log.debug(f'Evicting upload journal {entry.path}')
+                    os.remove(entry.path)
+        except OSError as e:
+            logging.warning(f'Could not evict old upload journals from {self.cache_dir}: {e}')
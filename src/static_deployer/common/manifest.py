@@ -0,0 +1,84 @@
+from typing import Any, Dict, IO, Iterator, Optional
+from . import types
+import gzip
+import json
+import tempfile
+import time
+
+# Manifests are stored next to the versions rather than in them, where the CDNs would serve them:
+# the manifest of `site/v2` is `site/.static-deployer/v2.jsonl.gz`.
+MANIFEST_DIR = '.static-deployer'
+MANIFEST_EXTENSION = '.jsonl.gz'
+# Name of the manifest object that older releases stored under the prefix of each version.
+MANIFEST_NAME = '.static-deployer-manifest.jsonl.gz'
+MANIFEST_FORMAT_VERSION = 1
+
+
+class ManifestWriter(object):
+    """Write a manifest as gzipped JSON lines: a header line, then one line per file.
+
+    The data is spooled to a temporary file, so memory usage does not depend on
+    the number of files.
+    """
+
+    def __init__(self, header: Optional[Dict[str, Any]] = None):
+        self._file = tempfile.TemporaryFile()
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode='wb', mtime=0)
+        self.count = 0
+        self._write({
+            'format': MANIFEST_FORMAT_VERSION,
+            'created_at': int(time.time()),
+            **(header or {}),
+        })
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        self._gzip.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        self._gzip.write(b'\n')
+
+    def add(self, entry: types.ManifestEntry) -> None:
+        self._write({
+            'path': entry.path,
+            'size': entry.size,
+            'etag': entry.etag,
+            'content_type': entry.content_type,
+            'content_encoding': entry.content_encoding,
+        })
+        self.count += 1
+
+    def close(self) -> IO[bytes]:
+        """Finish the manifest.
+
+        :return: The compressed manifest, positioned at its start.
+        """
+        self._gzip.close()
+        self._file.seek(0)
+        return self._file
+
+    def entries(self) -> Iterator[types.ManifestEntry]:
+        """Finish the manifest and read back its entries, without keeping them in memory."""
+        fileobj = self.close()
+        try:
+            yield from read_manifest(fileobj)
+        finally:
+            fileobj.seek(0)
+
+
+def read_manifest(fileobj: IO[bytes]) -> Iterator[types.ManifestEntry]:
+    """Lazily read the entries of a manifest written by ManifestWriter.
+
+    :param fileobj: The compressed manifest, e.g. the streaming body of an S3 object.
+    :raise ValueError: If the data is not a manifest in a supported format.
+    """
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gzip_file:
+        header = json.loads(gzip_file.readline() or b'{}')
+        if header.get('format') != MANIFEST_FORMAT_VERSION:
+            raise ValueError(f'Unsupported manifest format: {header.get("format")}')
+        for line in gzip_file:
+            data = json.loads(line)
+            yield types.ManifestEntry(
+                path=data['path'],
+                size=data['size'],
+                etag=data['etag'],
+                content_type=data.get('content_type'),
+                content_encoding=data.get('content_encoding'),
+            )
@@ -0,0 +1,275 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from contextlib import contextmanager
+from . import log
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+
+# Upper bounds (in seconds) of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+REPORT_FORMATS = ('json', 'openmetrics')
+# Prefix of the metric names in the OpenMetrics report.
+METRIC_PREFIX = 'static_deployer_'
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets, like the Prometheus/OpenMetrics ones."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The last count is for the values larger than every bucket (+Inf).
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile, interpolating linearly inside the bucket it falls in (like Prometheus does)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulated + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - cumulated) / count, self.max)
+            cumulated += count
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + (math.inf,), self.counts)},
+        }
+
+
+class _PhaseState(threading.local):
+    def __init__(self):
+        # Phases the current thread is in, the innermost last.
+        self.stack: List[str] = []
+        self.switched_at = 0.0
+
+
+class Recorder(object):
+    """Thread-safe store of the metrics of a run.
+
+    Phases measure the wall-clock time a thread spends on each step of a deploy.
+    Phases may be nested, and the time is only counted for the innermost one, so
+    interleaved steps (e.g. the stages of a streaming pipeline) are told apart and
+    the times of all the phases add up to the duration of the run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = _PhaseState()
+        self.started_at = time.time()
+        self._started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.phase_calls: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def _add_time(self, name: str, seconds: float, calls: int) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.phase_calls[name] = self.phase_calls.get(name, 0) + calls
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        state = self._local
+        now = time.perf_counter()
+        if state.stack:
+            self._add_time(state.stack[-1], now - state.switched_at, 0)
+        state.stack.append(name)
+        state.switched_at = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._add_time(name, now - state.switched_at, 1)
+            state.stack.pop()
+            state.switched_at = now
+
+    def timed(self, name: str, iterable: Iterable) -> Iterator:
+        """Count the time spent producing the items of an iterable as a phase."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    def to_dict(self, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **(info or {}),
+                'started_at': self.started_at,
+                'elapsed_seconds': self.elapsed(),
+                'phases': {
+                    name: {'seconds': seconds, 'calls': self.phase_calls[name]}
+                    for name, seconds in self.phases.items()
+                },
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def to_openmetrics(self, info: Optional[Dict[str, Any]] = None) -> str:
+        def escape(value: Any) -> str:
+            return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+        def number(value: float) -> str:
+            return '+Inf' if value == math.inf else repr(float(value)) if isinstance(value, float) else str(value)
+
+        lines = []
+        if info:
+            labels = ','.join(f'{key}="{escape(value)}"' for key, value in info.items())
+            lines += [f'# TYPE {METRIC_PREFIX}run info', f'{METRIC_PREFIX}run_info{{{labels}}} 1']
+        lines += [
+            f'# TYPE {METRIC_PREFIX}run_started_at_seconds gauge',
+            f'{METRIC_PREFIX}run_started_at_seconds {number(self.started_at)}',
+            f'# TYPE {METRIC_PREFIX}run_elapsed_seconds gauge',
+            f'{METRIC_PREFIX}run_elapsed_seconds {number(self.elapsed())}',
+        ]
+        with self._lock:
+            lines += [f'# TYPE {METRIC_PREFIX}phase_seconds counter', f'# UNIT {METRIC_PREFIX}phase_seconds seconds']
+            lines += [f'{METRIC_PREFIX}phase_seconds_total{{phase="{name}"}} {number(seconds)}'
+                      for name, seconds in self.phases.items()]
+            lines += [f'# TYPE {METRIC_PREFIX}phase_calls counter']
+            lines += [f'{METRIC_PREFIX}phase_calls_total{{phase="{name}"}} {number(calls)}'
+                      for name, calls in self.phase_calls.items()]
+            for name, value in sorted(self.counters.items()):
+                lines += [f'# TYPE {METRIC_PREFIX}{name} counter', f'{METRIC_PREFIX}{name}_total {number(value)}']
+            for name, value in sorted(self.gauges.items()):
+                lines += [f'# TYPE {METRIC_PREFIX}{name} gauge', f'{METRIC_PREFIX}{name} {number(value)}']
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f'# TYPE {METRIC_PREFIX}{name} histogram')
+                cumulated = 0
+                for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                    cumulated += count
+                    lines.append(f'{METRIC_PREFIX}{name}_bucket{{le="{number(float(bound))}"}} {cumulated}')
+                lines += [f'{METRIC_PREFIX}{name}_count {histogram.count}',
+                          f'{METRIC_PREFIX}{name}_sum {number(histogram.sum)}']
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+_recorder = Recorder()
+
+
+def reset() -> Recorder:
+    """Start recording the metrics of a new run."""
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def current() -> Recorder:
+    return _recorder
+
+
+def phase(name: str):
+    return _recorder.phase(name)
+
+
+def timed(name: str, iterable: Iterable) -> Iterator:
+    return _recorder.timed(name, iterable)
+
+
+def count(name: str, amount: float = 1) -> None:
+    _recorder.count(name, amount)
+
+
+def gauge(name: str, value: float) -> None:
+    _recorder.gauge(name, value)
+
+
+def observe(name: str, value: float) -> None:
+    _recorder.observe(name, value)
+
+
+def _on_after_call(http_response, parsed, model, event_name: str, **kwargs) -> None:
+    # Event names look like 'after-call.s3.PutObject'.
+    service = event_name.split('.')[1].replace('-', '_')
+    metadata = parsed.get('ResponseMetadata', {}) if isinstance(parsed, dict) else {}
+    count(f'{service}_requests')
+    retries = metadata.get('RetryAttempts', 0)
+    if retries:
+        count(f'{service}_retries', retries)
+    if http_response is not None and http_response.status_code >= 400:
+        count(f'{service}_errors')
+
+
+def instrument_boto3() -> None:
+    """Count the requests, retries and errors of all the boto3 clients created afterwards."""
+    import boto3
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register('after-call', _on_after_call, unique_id='static-deployer-metrics')
+
+
+def write_report(file_name: str, report_format: str = 'json', info: Optional[Dict[str, Any]] = None) -> bool:
+    """Write the metrics of the current run to a file.
+
+    :param report_format: Either 'json' or 'openmetrics' (the Prometheus text format).
+    :param info: Details about the run (e.g. the command and version), added to the report.
+    """
+    if report_format not in REPORT_FORMATS:
+        logging.error(f'Unsupported metrics format: {report_format} (expected one of {", ".join(REPORT_FORMATS)})')
+        return False
+    if report_format == 'json':
+        data = json.dumps(_recorder.to_dict(info), indent=2) + '\n'
+    else:
+        data = _recorder.to_openmetrics(info)
+    try:
+        with open(file_name, 'w') as f:
+            f.write(data)
+    except OSError as e:
+        logging.error(f'Could not write the metrics to {file_name}: {e}')
+        return False
+    log.debug(f'Wrote the metrics to {file_name}')
+    return True
+
+
+def log_summary() -> None:
+    """Log the time spent in each phase."""
+    recorder = _recorder
+    elapsed = recorder.elapsed()
+    phases = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in sorted(recorder.phases.items(), key=lambda item: -item[1]))
+    logging.info(f'Finished in {elapsed:.2f}s: {phases}')
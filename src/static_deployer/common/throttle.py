@@ -0,0 +1,187 @@
+from typing import Optional
+from collections import deque
+from io import IOBase
+from . import log, metrics
+import logging
+import threading
+import time
+
+
+class ConcurrencyBudget(object):
+    """Counting semaphore whose holders may take several slots at once.
+
+    Waiters are served in FIFO order, so a request for many slots (e.g. a
+    multipart upload using several threads) is not starved by a stream of
+    requests for a single slot.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self._available = total
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, slots: int = 1) -> int:
+        """Block until `slots` slots are available and take them.
+
+        :return: The number of slots taken, which is capped to the total.
+        """
+        with self._cond:
+            ticket = object()
+            self._waiters.append(ticket)
+            # The total may shrink while waiting (see `resize`), so the request is capped to the current one.
+            while self._waiters[0] is not ticket or self._available < max(1, min(slots, self.total)):
+                self._cond.wait()
+            slots = max(1, min(slots, self.total))
+            self._waiters.popleft()
+            self._available -= slots
+            # The next waiter might fit in the remaining slots.
+            self._cond.notify_all()
+        return slots
+
+    def release(self, slots: int = 1) -> None:
+        with self._cond:
+            self._available += slots
+            self._cond.notify_all()
+
+    def resize(self, total: int) -> None:
+        """Change the number of slots.
+
+        Holders keep the slots they took. After a shrink, slots are only handed out
+        again once enough of them were released to fit in the new total. Waiters are
+        woken, since those asking for more slots than the new total now get fewer.
+        """
+        with self._cond:
+            self._available += total - self.total
+            self.total = total
+            self._cond.notify_all()
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket, used to cap a rate (e.g. bytes or requests per second) shared by many threads."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float) -> None:
+        """Block until `amount` tokens could be taken from the bucket.
+
+        Amounts larger than the capacity are allowed, they just leave the bucket in debt.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveLimiter(object):
+    """AIMD controller of the size of a ConcurrencyBudget, driven by the outcome of each request.
+
+    The limit grows by one slot each time as many requests as the limit succeeded
+    (about once per round trip), as long as the latency of small requests stays
+    below `latency_tolerance` times the lowest one seen, i.e. before requests start
+    queueing. It is multiplied by `decrease_factor` when a request is throttled, at
+    most once per `cooldown` seconds, since the requests in flight at that moment
+    were sent at the same rate and are likely throttled too.
+    """
+
+    def __init__(self, budget: ConcurrencyBudget, minimum: int = 1, maximum: Optional[int] = None,
+                 decrease_factor: float = 0.75, latency_tolerance: float = 2.0, cooldown: float = 1.0):
+        self.budget = budget
+        self.minimum = minimum
+        self.maximum = maximum or budget.total
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.limit = budget.total
+        self.lowest_limit = self.limit
+        self.highest_limit = self.limit
+        self.num_increases = 0
+        self.num_decreases = 0
+        self._successes = 0
+        self._min_latency: Optional[float] = None
+        self._avg_latency: Optional[float] = None
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    def _set_limit(self, limit: int) -> None:
+        self.limit = limit
+        self.lowest_limit = min(self.lowest_limit, limit)
+        self.highest_limit = max(self.highest_limit, limit)
+        self.budget.resize(limit)
+        metrics.gauge('concurrency_limit', limit)
+
+    def on_success(self, latency: Optional[float] = None) -> None:
+        """Record a successful request.
+
+        :param latency: Duration of the request, only given for requests whose duration does not depend on their size.
+        """
+        with self._lock:
+            if latency is not None:
+                self._min_latency = latency if self._min_latency is None else min(self._min_latency, latency)
+                # Exponentially weighted moving average, following the trend of the last few dozen requests.
+                self._avg_latency = latency if self._avg_latency is None else self._avg_latency * 0.95 + latency * 0.05
+            self._successes += 1
+            if self._successes < self.limit or self.limit >= self.maximum:
+                return
+            self._successes = 0
+            if self._avg_latency is not None and self._avg_latency > self._min_latency * self.latency_tolerance:
+                log.debug(f'Keeping the concurrency at {self.limit}, the latency went from {self._min_latency * 1000:.0f}ms'
+                          f' to {self._avg_latency * 1000:.0f}ms')
+                return
+            self.num_increases += 1
+            self._set_limit(self.limit + 1)
+            metrics.count('concurrency_increases')
+            log.debug(f'Increased the concurrency to {self.limit}')
+
+    def on_throttle(self) -> None:
+        """Record a request rejected because the requests are sent too fast (e.g. S3 503 SlowDown)."""
+        metrics.count('throttled_requests')
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at < self.cooldown:
+                return
+            self._decreased_at = now
+            self._successes = 0
+            limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            if limit == self.limit:
+                return
+            logging.info(f'Requests are being throttled, decreasing the concurrency from {self.limit} to {limit}')
+            self.num_decreases += 1
+            self._set_limit(limit)
+            metrics.count('concurrency_decreases')
+
+    def summary(self) -> str:
+        return (f'concurrency ended at {self.limit} (between {self.lowest_limit} and {self.highest_limit},'
+                f' {self.num_increases} increases, {self.num_decreases} decreases)')
+
+
+class ThrottledReader(object):
+    """File object wrapper that takes one token from a bucket for each byte read."""
+
+    def __init__(self, fileobj: IOBase, bucket: TokenBucket):
+        self._fileobj = fileobj
+        self._bucket = bucket
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        if data:
+            self._bucket.consume(len(data))
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._fileobj.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._fileobj.tell()
+
+    def close(self) -> None:
+        self._fileobj.close()
@@ -1,18 +1,53 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import attr
 import logging
 
 
+@attr.s(auto_attribs=True)
+class RemoteObject(object):
+    key: str
+    size: int
+    etag: str
+
+
+@attr.s(auto_attribs=True)
+class ManifestEntry(object):
+    # Path relative to the version prefix, using '/' as separator.
+    path: str
+    size: int
+    etag: str
+    content_type: Optional[str] = None
+    content_encoding: Optional[str] = None
+
+
+@attr.s(auto_attribs=True)
+class FileDigest(object):
+    md5: str
+    # The ETag S3 assigns when the file is uploaded, which differs from `md5` for multipart uploads.
+    etag: str
+
+
 @attr.s(auto_attribs=True)
 class FileMapping(object):
     local_path: str
     remote_path: str
+    size: Optional[int] = None
+    # The object holding this same file in the currently live version, if any.
+    base_object: Optional[RemoteObject] = None
+    digest: Optional[FileDigest] = None
+    # File to upload instead of the original one (e.g. its compressed version), and its encoding.
+    source_path: Optional[str] = None
+    content_encoding: Optional[str] = None
+    # Size and modification time (in ns) of the local file, which tell whether it changed since a previous run.
+    local_stat: Optional[Tuple[int, int]] = None
 
 
 @attr.s(auto_attribs=True)
 class ContentDetails(object):
     root_dir: str
     patterns: str
+    exclude_patterns: Optional[str] = None
+    cache_dir: Optional[str] = None
 
 
 @attr.s(auto_attribs=True)
@@ -28,18 +63,49 @@ class StorageDetails(object):
             self.prefix = self.prefix[1:]
 
 
+@attr.s(auto_attribs=True)
+class InvalidationLimits(object):
+    # CloudFront allows up to 3000 file paths and 15 wildcard paths in progress at the same time.
+    max_paths: int = 3000
+    max_wildcards: int = 15
+    # Number of paths sent in each invalidation request.
+    batch_size: int = 1000
+    # Everything is invalidated (`/*`) when at least this share of the files would be evicted anyway.
+    full_invalidation_ratio: float = 0.5
+
+
 @attr.s(auto_attribs=True)
 class CdnDetails(object):
     distribution_id: str
     origin_name: str
+    # Wait until the new origin path is deployed and the invalidations complete.
+    wait: bool = True
+    # Invalidate everything (`/*`) instead of the files that changed since the live version.
+    invalidate_all: bool = False
+    invalidation_limits: InvalidationLimits = attr.Factory(InvalidationLimits)
+
+
+@attr.s(auto_attribs=True)
+class WarmupSettings(object):
+    # URL of the site served by each distribution (e.g. https://www.example.com), by default its CloudFront domain.
+    base_urls: List[str] = attr.Factory(list)
+    # Maximum number of files fetched from each distribution, pages first.
+    max_files: int = 1000
+    # Number of requests sent at the same time.
+    concurrency: int = 8
+    # Maximum number of requests sent per second.
+    max_rate: Optional[float] = None
 
 
 @attr.s(auto_attribs=True)
 class DeploySpec(object):
     content: ContentDetails
     storage: StorageDetails
-    cdn: CdnDetails
+    # The distributions (and origins) to point to the version, all updated at the same time.
+    cdns: List[CdnDetails]
     version: str
+    # Fetch the most requested files through the distributions once they serve the version.
+    warmup: Optional[WarmupSettings] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return attr.asdict(self)
@@ -48,16 +114,109 @@ class DeploySpec(object):
 @attr.s(auto_attribs=True)
 class RollbackSpec(object):
     storage: StorageDetails
-    cdn: CdnDetails
+    # The distributions (and origins) to point to the version, all updated at the same time.
+    cdns: List[CdnDetails]
     version: str
 
     def to_dict(self) -> Dict[str, Any]:
         return attr.asdict(self)
 
 
+@attr.s(auto_attribs=True)
+class TransferSettings(object):
+    # Files of this size (in bytes) or larger are uploaded in multiple parts. Same default as boto3.
+    multipart_threshold: int = 8 * 1024 * 1024
+    multipart_chunksize: int = 8 * 1024 * 1024
+    # Number of threads uploading the parts of a single file.
+    max_concurrency: int = 10
+
+
+@attr.s(auto_attribs=True)
+class TransferRule(object):
+    # fnmatch-style pattern, matched against the path relative to the root directory.
+    pattern: str
+    multipart_threshold: Optional[int] = None
+    multipart_chunksize: Optional[int] = None
+    max_concurrency: Optional[int] = None
+
+
+@attr.s(auto_attribs=True)
+class MetadataRule(object):
+    # fnmatch-style pattern, matched against the path relative to the root directory.
+    pattern: str
+    # Each header that is not set keeps its default value.
+    cache_control: Optional[str] = None
+    content_type: Optional[str] = None
+    content_disposition: Optional[str] = None
+    # User-defined metadata, sent as `x-amz-meta-*` headers.
+    metadata: Dict[str, str] = attr.Factory(dict)
+
+
+@attr.s(auto_attribs=True)
+class CompressionSettings(object):
+    # Either 'gzip' or 'br'.
+    encoding: str = 'gzip'
+    # Compression level, defaults to the highest one for each encoding.
+    level: Optional[int] = None
+    # Content types to compress (e.g. 'text/*', 'application/json'). Defaults to the common text formats.
+    content_types: List[str] = attr.Factory(list)
+    # Smaller files gain little from compression.
+    min_size: int = 1024
+    # Files are uploaded uncompressed unless compression reduces them to this share of their size.
+    max_ratio: float = 0.9
+
+
 @attr.s(auto_attribs=True)
 class UploadOptions:
     cache_maxage: Optional[int] = None
+    incremental: bool = False
+    # Number of files transferred at the same time. Uploads are I/O bound, so this
+    # is not related to the number of CPUs.
+    concurrency: int = 32
+    # Files smaller than this (in bytes) are sent with a single PutObject request.
+    small_file_threshold: int = 1024 * 1024
+    transfer: TransferSettings = attr.Factory(TransferSettings)
+    # The first rule matching a file overrides the settings in `transfer`.
+    transfer_rules: List[TransferRule] = attr.Factory(list)
+    # Grow the concurrency while S3 keeps up, and shrink it when S3 throttles the requests.
+    adaptive_concurrency: bool = False
+    # Highest concurrency the adaptive concurrency may grow to, 4 times `concurrency` by default.
+    max_concurrency: Optional[int] = None
+    # Maximum number of bytes per second, shared by all transfers.
+    max_bandwidth: Optional[int] = None
+    # Maximum number of requests per second, shared by all transfers.
+    max_request_rate: Optional[float] = None
+    # The first rule matching a file overrides its headers.
+    metadata_rules: List[MetadataRule] = attr.Factory(list)
+    # Compress text files before uploading them.
+    compression: Optional[CompressionSettings] = None
+    # Checksum S3 verifies for each uploaded file (CRC32, CRC32C, SHA1 or SHA256), in addition to the MD5.
+    checksum_algorithm: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return attr.asdict(self)
+
+
+@attr.s(auto_attribs=True)
+class PruneSpec(object):
+    storage: StorageDetails
+    # The distributions (and origins) whose live versions are never deleted.
+    cdns: List[CdnDetails]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return attr.asdict(self)
+
+
+@attr.s(auto_attribs=True)
+class PruneOptions:
+    # Number of most recent versions kept, besides the ones the distributions serve.
+    keep: int = 10
+    # Number of DeleteObjects requests (of up to 1000 objects each) sent at the same time.
+    concurrency: int = 8
+    # Maximum number of objects deleted per second.
+    max_delete_rate: Optional[int] = None
+    # Prune versions stored at the bucket root, where every top-level prefix is taken as a version.
+    force: bool = False
 
     def to_dict(self) -> Dict[str, Any]:
         return attr.asdict(self)
@@ -1,3 +1,5 @@
+from typing import Any, List
+import importlib
 import re
 
 def interval_string_to_seconds(input: str) -> int:
@@ -39,4 +41,49 @@ def interval_string_to_seconds(input: str) -> int:
         index = SUFFIX_MAP[suffix]
         multiple = SUFFIX_MULTIPLES[index]
         total += amount * multiple
-    return total
\ No newline at end of file
+    return total
+
+def size_string_to_bytes(input: str) -> int:
+    SUFFIX_MULTIPLES = {
+        'b': 1,
+        'k': 1024,
+        'kb': 1024,
+        'kib': 1024,
+        'm': 1024 ** 2,
+        'mb': 1024 ** 2,
+        'mib': 1024 ** 2,
+        'g': 1024 ** 3,
+        'gb': 1024 ** 3,
+        'gib': 1024 ** 3,
+    }
+    if isinstance(input, int):
+        return input
+    match = re.fullmatch(r'\s*(\d+)\s*([a-zA-Z]*)\s*', input)
+    if not match:
+        raise ValueError(f'Invalid size string specified: {input}')
+    amount = int(match.group(1))
+    suffix = match.group(2).lower() or 'b'
+    if not suffix in SUFFIX_MULTIPLES:
+        raise ValueError(f'Invalid size string specified: {input}')
+    return amount * SUFFIX_MULTIPLES[suffix]
+
+def split_list(input: str) -> List[str]:
+    """Split a comma separated list, ignoring blanks around and between the items."""
+    if not input:
+        return []
+    return [item.strip() for item in input.split(',') if item.strip()]
+
+
+class LazyModule(object):
+    """Stand-in for a module that is only imported once one of its attributes is used.
+
+    Commands that do not use a module then do not pay for importing it (and
+    its dependencies, e.g. boto3). Importing is thread-safe, and once done only
+    costs a lookup in `sys.modules`.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(importlib.import_module(self._name), attribute)
@@ -0,0 +1,202 @@
+from typing import Iterable, Iterator, List, Optional, Pattern, Set, Tuple
+from . import log
+import logging
+import os
+import re
+
+_MAGIC_CHARS = re.compile(r'[*?[]')
+
+
+def _translate_segment(segment: str) -> str:
+    """Translate a glob path segment into a regex that never matches '/'."""
+    result = []
+    i, n = 0, len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == '*':
+            # Consecutive stars are equivalent to a single one inside a segment.
+            while i < n and segment[i] == '*':
+                i += 1
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            j = i
+            if j < n and segment[j] == '!':
+                j += 1
+            if j < n and segment[j] == ']':
+                j += 1
+            while j < n and segment[j] != ']':
+                j += 1
+            if j >= n:
+                result.append('\\[')
+            else:
+                stuff = segment[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] == '^':
+                    stuff = '\\' + stuff
+                result.append(f'(?!/)[{stuff}]')
+        else:
+            result.append(re.escape(c))
+    return ''.join(result)
+
+
+def _split_pattern(pattern: str) -> List[str]:
+    pattern = pattern.strip()
+    while pattern.startswith('./'):
+        pattern = pattern[2:]
+    return [segment for segment in pattern.strip('/').split('/') if segment and segment != '.']
+
+
+class _CompiledPattern(object):
+    def __init__(self, pattern: str, hide_dotfiles: bool):
+        self.pattern = pattern
+        self.hide_dotfiles = hide_dotfiles
+        self.segments = _split_pattern(pattern)
+        self.segment_regexes = [
+            None if segment == '**' else re.compile(self._segment_regex(segment, hide_dotfiles) + r'\Z')
+            for segment in self.segments
+        ]
+        self.regex = self._pattern_regex(hide_dotfiles)
+
+    @staticmethod
+    def _segment_regex(segment: str, hide_dotfiles: bool) -> str:
+        regex = _translate_segment(segment)
+        # Like glob, wildcards do not match names starting with a dot unless the pattern does.
+        if hide_dotfiles and _MAGIC_CHARS.search(segment) and not segment.startswith('.'):
+            regex = r'(?!\.)' + regex
+        return regex
+
+    def _pattern_regex(self, hide_dotfiles: bool) -> str:
+        any_name = r'(?!\.)[^/]+' if hide_dotfiles else r'[^/]+'
+        parts = []
+        last = len(self.segments) - 1
+        for index, segment in enumerate(self.segments):
+            if segment == '**':
+                # `**` matches zero or more directories, or any file when it is the last segment.
+                parts.append(f'(?:{any_name}/)*{any_name}' if index == last else f'(?:{any_name}/)*')
+            else:
+                parts.append(self._segment_regex(segment, hide_dotfiles) + ('' if index == last else '/'))
+        return ''.join(parts)
+
+    def advance(self, positions: Set[int], name: str) -> Set[int]:
+        """Compute which segments may come next once a directory named `name` is entered."""
+        result = set()
+        for position in self._expand(positions):
+            if position >= len(self.segments):
+                continue
+            regex = self.segment_regexes[position]
+            if regex is None:
+                if not (self.hide_dotfiles and name.startswith('.')):
+                    result.add(position)
+            elif regex.match(name):
+                result.add(position + 1)
+        return result
+
+    def _expand(self, positions: Set[int]) -> Set[int]:
+        # `**` may also match zero directories, so the segment after it is reachable too.
+        result = set(positions)
+        for position in positions:
+            while position < len(self.segments) and self.segments[position] == '**':
+                position += 1
+                result.add(position)
+        return result
+
+    def can_match_below(self, positions: Set[int]) -> bool:
+        """Tell whether a file inside a directory reached with `positions` could match."""
+        return any(position < len(self.segments) for position in self._expand(positions))
+
+
+class PatternMatcher(object):
+    """Glob include/exclude patterns compiled into a single matcher.
+
+    Patterns use the same syntax as `glob.glob(..., recursive=True)` and are
+    matched against paths relative to the root directory, using '/' as separator.
+    Include patterns follow glob's handling of hidden files (wildcards do not
+    match names starting with a dot), exclude patterns do not.
+    """
+
+    def __init__(self, include_patterns: Iterable[str], exclude_patterns: Optional[Iterable[str]] = None):
+        self._includes = [_CompiledPattern(p, hide_dotfiles=True) for p in include_patterns if _split_pattern(p)]
+        self._excludes = [_CompiledPattern(p, hide_dotfiles=False) for p in exclude_patterns or [] if _split_pattern(p)]
+        self._include_regex = self._combine(self._includes)
+        self._exclude_regex = self._combine(self._excludes)
+        # Directories matching these are skipped entirely, e.g. `node_modules/**`.
+        self._exclude_dir_regex = self._combine([
+            _CompiledPattern('/'.join(compiled.segments[:-1]), hide_dotfiles=False)
+            for compiled in self._excludes
+            if len(compiled.segments) > 1 and compiled.segments[-1] == '**'
+        ])
+
+    @staticmethod
+    def _combine(compiled_patterns: List[_CompiledPattern]) -> Optional[Pattern]:
+        if not compiled_patterns:
+            return None
+        return re.compile('(?:' + '|'.join(compiled.regex for compiled in compiled_patterns) + r')\Z')
+
+    def initial_state(self) -> Tuple[Set[int], ...]:
+        return tuple({0} for _ in self._includes)
+
+    def enter_directory(self, state: Tuple[Set[int], ...], relative_path: str, name: str) -> Optional[Tuple[Set[int], ...]]:
+        """Compute the state of a subdirectory.
+
+        :return: The new state, or None if no file inside that directory can match, so it can be skipped.
+        """
+        if self._exclude_dir_regex is not None and self._exclude_dir_regex.match(relative_path):
+            return None
+        new_state = tuple(compiled.advance(positions, name) for compiled, positions in zip(self._includes, state))
+        if not any(compiled.can_match_below(positions) for compiled, positions in zip(self._includes, new_state)):
+            return None
+        return new_state
+
+    def matches(self, relative_path: str) -> bool:
+        if self._include_regex is None or not self._include_regex.match(relative_path):
+            return False
+        return self._exclude_regex is None or not self._exclude_regex.match(relative_path)
+
+
+def walk(root_dir: str, matcher: PatternMatcher) -> Iterator[os.DirEntry]:
+    """Find the files inside root_dir matching the given patterns, in a single pass.
+
+    Directories in which no file can match are not entered at all. Like glob,
+    symbolic links to directories are followed, so a directory linked from several
+    places is scanned under each of its paths, except when the link points to one
+    of its own ancestors, which would loop forever.
+
+    :param root_dir: Absolute path to the root directory where files will be searched.
+    :param matcher: Compiled include/exclude patterns.
+    :return: An iterator over the matching files. Their cached `stat()` can be reused by the caller.
+    """
+    # Stack of (absolute path, relative path, matcher state, ancestors) of the directories left to scan, the
+    # ancestors being the (st_dev, st_ino) of the directories above it.
+    stack = [(root_dir, '', matcher.initial_state(), frozenset())]
+    while stack:
+        dir_path, relative_dir, state, ancestors = stack.pop()
+        try:
+            dir_stat = os.stat(dir_path)
+            dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+            if dir_key in ancestors:
+                log.debug(f'Skipping directory \'{dir_path}\', a symbolic link to one of its ancestors')
+                continue
+            ancestors = ancestors | {dir_key}
+            subdirs = []
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    relative_path = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        subdir_state = matcher.enter_directory(state, relative_path, entry.name)
+                        if subdir_state is not None:
+                            subdirs.append((entry.path, relative_path, subdir_state, ancestors))
+                    elif entry.is_file() and matcher.matches(relative_path):
+                        yield entry
+            # Reversed, so the subdirectories are scanned in the order they were listed.
+            stack.extend(reversed(subdirs))
+        except OSError as e:
+            logging.warning(f'Could not scan directory \'{dir_path}\': {e}')
@@ -1,104 +1,481 @@
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from botocore.exceptions import BotoCoreError, ClientError
+from ...common import invalidation, log, metrics, types
+import asyncio
 import boto3
+import copy
 import datetime
+import functools
 import logging
+import random
+import threading
+import time
 
+# Status polling starts fast, since small changes may complete in seconds, and
+# slows down as the wait gets longer, to save API calls.
+POLL_INITIAL_DELAY = 2.0
+POLL_MAX_DELAY = 30.0
+POLL_BACKOFF = 1.5
+# Same as the longest the boto3 waiters wait (`Delay * MaxAttempts`).
+POLL_TIMEOUT = 60 * 60
+# How many of the most recent invalidations are checked when looking for those in progress.
+MAX_LISTED_INVALIDATIONS = 100
+# A distribution update that lost a race with another change (PreconditionFailed) is
+# attempted this many times in all, waiting UPDATE_RETRY_DELAY seconds before the first
+# retry and twice as long before each next one.
+MAX_UPDATE_ATTEMPTS = 5
+UPDATE_RETRY_DELAY = 1.0
 
-def invalidate_paths(distribution_id: str, paths_to_invalidate: List[str], dry_run: bool = False) -> bool:
-    client = boto3.client('cloudfront')
+
+async def _run(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call (e.g. a boto3 request) without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def _poll(description: str, get_status: Callable[[], Awaitable[Optional[str]]], done_status: str,
+                timeout: float = POLL_TIMEOUT) -> bool:
+    """Poll a status until it reaches `done_status`, with exponential backoff between attempts.
+
+    :return: True if the status was reached, False on timeout or if the status could not be fetched.
+    """
+    started_at = time.monotonic()
+    delay = POLL_INITIAL_DELAY
+    while True:
+        status = await get_status()
+        if status is None:
+            return False
+        elapsed = time.monotonic() - started_at
+        if status == done_status:
+            logging.info(f'{description} completed after {elapsed:.0f}s')
+            return True
+        if elapsed >= timeout:
+            logging.error(f'{description} did not complete after {elapsed:.0f}s (status={status})')
+            return False
+        log.debug(f'{description} is {status}, checking again in {delay:.0f}s')
+        await asyncio.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+
+def get_distribution_status(distribution_id: str, client=None) -> Optional[str]:
+    """:return: 'Deployed' once a distribution change reached all edge locations, 'InProgress' before, or None on error."""
+    client = client or boto3.client('cloudfront')
+    try:
+        response = client.get_distribution(Id=distribution_id)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return response.get('Distribution', {}).get('Status')
+
+
+def get_domain_name(distribution_id: str, client=None) -> Optional[str]:
+    """:return: The CloudFront domain of a distribution (e.g. d111111abcdef8.cloudfront.net), or None on error."""
+    client = client or boto3.client('cloudfront')
+    try:
+        response = client.get_distribution(Id=distribution_id)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return response.get('Distribution', {}).get('DomainName')
+
+
+def get_invalidation_status(distribution_id: str, invalidation_id: str, client=None) -> Optional[str]:
+    """:return: 'Completed' once an invalidation is done, 'InProgress' before, or None on error."""
+    client = client or boto3.client('cloudfront')
+    try:
+        response = client.get_invalidation(DistributionId=distribution_id, Id=invalidation_id)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return response.get('Invalidation', {}).get('Status')
+
+
+def list_pending_invalidations(distribution_id: str, client=None) -> Optional[List[str]]:
+    """:return: The ids of the invalidations still in progress, or None on error."""
+    client = client or boto3.client('cloudfront')
+    result = []
+    try:
+        paginator = client.get_paginator('list_invalidations')
+        # Invalidations are listed most recent first, and the old ones are all completed.
+        for page in paginator.paginate(DistributionId=distribution_id, PaginationConfig={'MaxItems': MAX_LISTED_INVALIDATIONS}):
+            items = page.get('InvalidationList', {}).get('Items', [])
+            result.extend(item['Id'] for item in items if item.get('Status') != 'Completed')
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return result
+
+
+def submit_invalidation(distribution_id: str, paths_to_invalidate: List[str], dry_run: bool = False,
+                        batch_size: Optional[int] = None, client=None) -> Optional[List[str]]:
+    """Submit invalidation requests, without waiting for them to complete.
+
+    The paths are sent in batches of at most `batch_size` paths.
+
+    :return: The ids of the invalidations, or None if one of them could not be submitted.
+    """
+    batch_size = batch_size or types.InvalidationLimits().batch_size
+    if not paths_to_invalidate:
+        logging.info(f'Nothing to invalidate in distribution ({distribution_id})')
+        return []
+    client = client or boto3.client('cloudfront')
     timestamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
 
-    if not dry_run:
-        response = client.create_invalidation(
-            DistributionId=distribution_id,
-            InvalidationBatch={
-                'Paths': {
-                    'Quantity': len(paths_to_invalidate),
-                    'Items': paths_to_invalidate,
-                },
-                # A value that you specify to uniquely identify an invalidation request.
-                # CloudFront uses the value to prevent you from accidentally resubmitting
-                # an identical request.
-                'CallerReference': timestamp,
-            }
-        )
+    batches = invalidation.split_batches(paths_to_invalidate, batch_size)
+    invalidation_ids = []
+    for index, batch in enumerate(batches):
+        logging.info(f'Invalidating {len(batch)} paths (batch {index + 1} of {len(batches)}): {batch[:5]}'
+                     + ('...' if len(batch) > 5 else ''))
+        if dry_run:
+            invalidation_ids.append(f'fake-invalidation-id-{index}')
+            continue
+        try:
+            response = client.create_invalidation(
+                DistributionId=distribution_id,
+                InvalidationBatch={
+                    'Paths': {
+                        'Quantity': len(batch),
+                        'Items': batch,
+                    },
+                    # A value that you specify to uniquely identify an invalidation request.
+                    # CloudFront uses the value to prevent you from accidentally resubmitting
+                    # an identical request.
+                    'CallerReference': f'{timestamp}-{index}',
+                }
+            )
+        except (ClientError, BotoCoreError) as e:
+            logging.error(e)
+            return None
+        invalidation_ids.append(response.get('Invalidation', {}).get('Id', ''))
+    logging.info(f'Submitted invalidations ({", ".join(invalidation_ids)}) to distribution ({distribution_id})')
+    return invalidation_ids
 
-        invalidation_id = response.get('Invalidation', {}).get('Id', '')
-    else:
-        invalidation_id = 'fake-invalidation-id'
-
-    logging.info(f'Waiting for invalidation ({invalidation_id}) to complete...')
-    if not dry_run:
-        waiter = client.get_waiter('invalidation_completed')
-        # This can take up to `Delay * MaxAttempts` seconds.
-        waiter.wait(
-            DistributionId=distribution_id,
-            Id=invalidation_id,
-            # WaiterConfig={
-            # 	'Delay': 30, # Wait N seconds between attempts.
-            # 	'MaxAttempts': 60 # Try at most N times.
-            # },
-        )
-    logging.info(f'Invalidation ({invalidation_id}) completed')
 
-    return True
+async def wait_invalidations(distribution_id: str, invalidation_ids: List[str], dry_run: bool = False,
+                             client=None) -> bool:
+    """Wait until all the given invalidations complete, polling them concurrently."""
+    if dry_run or not invalidation_ids:
+        return True
+    client = client or boto3.client('cloudfront')
+    results = await asyncio.gather(*[
+        _poll(f'Invalidation ({invalidation_id})',
+              functools.partial(_run, get_invalidation_status, distribution_id, invalidation_id, client=client),
+              'Completed')
+        for invalidation_id in invalidation_ids
+    ])
+    return all(results)
 
 
-def update_distribution(distribution_id: str, origin_name: str, new_origin_path: str, dry_run: bool = False) -> bool:
+async def wait_deployed(distribution_id: str, dry_run: bool = False, client=None) -> bool:
+    """Wait until the last change of a distribution reached all edge locations."""
+    if dry_run:
+        return True
+    client = client or boto3.client('cloudfront')
+    return await _poll(f'Distribution ({distribution_id}) update',
+                       functools.partial(_run, get_distribution_status, distribution_id, client=client),
+                       'Deployed')
+
+
+def invalidate_paths(distribution_id: str, paths_to_invalidate: List[str], dry_run: bool = False,
+                     batch_size: Optional[int] = None) -> bool:
+    """Invalidate paths in a distribution and wait until all invalidations complete."""
     client = boto3.client('cloudfront')
-    if not dry_run:
-        # About the `get_distribution` method:
+    invalidation_ids = submit_invalidation(distribution_id, paths_to_invalidate, dry_run=dry_run,
+                                           batch_size=batch_size, client=client)
+    if invalidation_ids is None:
+        return False
+    return asyncio.run(wait_invalidations(distribution_id, invalidation_ids, dry_run=dry_run, client=client))
+
+
+class DistributionConfigCache(object):
+    """Configs of distributions, along with their ETag, read once per run.
+
+    The config is all a deploy needs to know about a distribution: the origin paths
+    to find the live versions, then the whole config (and its ETag) to update it.
+    Successful updates store the config they return, so it is never read twice.
+    Entries are shared, so callers must not modify them.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, distribution_id: str, client=None, refresh: bool = False) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Get the config of a distribution and its ETag, reading them unless they are cached.
+
+        :param refresh: Read them even if they are cached, e.g. after they changed.
+        :return: The config and ETag, or None if they could not be read.
+        """
+        with self._lock:
+            entry = self._entries.get(distribution_id)
+        if entry is not None and not refresh:
+            return entry
+        client = client or boto3.client('cloudfront')
+        try:
+            response = client.get_distribution_config(Id=distribution_id)
+        except (ClientError, BotoCoreError) as e:
+            logging.error(e)
+            return None
+        entry = (response.get('DistributionConfig', {}), response.get('ETag', ''))
+        self.put(distribution_id, *entry)
+        return entry
+
+    def put(self, distribution_id: str, config: Dict[str, Any], etag: str) -> None:
+        with self._lock:
+            self._entries[distribution_id] = (config, etag)
+
+
+_config_cache = DistributionConfigCache()
+
+
+def reset_config_cache() -> None:
+    """Forget the configs read so far, so the next reads see the changes made by others since."""
+    global _config_cache
+    _config_cache = DistributionConfigCache()
+
+
+def get_origin_paths(distribution_id: str, client=None) -> Optional[Dict[str, str]]:
+    """Get the path each origin of a distribution points to, from its cached config.
+
+    :return: The OriginPath's without their leading slash, by origin name, or None if the config could not be read.
+    """
+    entry = _config_cache.get(distribution_id, client=client)
+    if entry is None:
+        return None
+    origins = entry[0].get('Origins', {}).get('Items', [])
+    return {origin.get('Id'): origin.get('OriginPath', '').lstrip('/') for origin in origins}
+
+
+def get_origin_path(distribution_id: str, origin_name: str) -> Optional[str]:
+    """Get the path the given origin currently points to.
+
+    :return: The OriginPath without its leading slash, or None if the origin could not be found.
+    """
+    origin_paths = get_origin_paths(distribution_id)
+    if origin_paths is None:
+        return None
+    if origin_name not in origin_paths:
+        logging.error(f'Could not find origin with origin_name={origin_name} in distribution_id={distribution_id}')
+        return None
+    return origin_paths[origin_name]
+
+
+def submit_distribution_update(distribution_id: str, origin_name: Union[str, List[str]], new_origin_path: str,
+                               dry_run: bool = False, client=None) -> bool:
+    """Point one or more origins of a distribution to a new path, without waiting for the change to be deployed.
+
+    The update is conditional on the ETag of the config it is based on. If another
+    change got in first (e.g. a concurrent deploy to another origin), the latest
+    config is read again and only the origin paths are changed in it, with backoff
+    between attempts, so the other change is kept.
+    """
+    origin_names = [origin_name] if isinstance(origin_name, str) else origin_name
+    client = client or boto3.client('cloudfront')
+    new_origin_path = new_origin_path if new_origin_path.startswith('/') else '/' + new_origin_path
+    if dry_run:
+        return True
+    for attempt in range(MAX_UPDATE_ATTEMPTS):
+        # About the `get_distribution_config` method:
         # 1. If the distribution was not found, it throws `CloudFront.Client.exceptions.NoSuchDistribution`
         # 2. If the user has no permission to describe the distribution, it throws `CloudFront.Client.exceptions.AccessDenied`
-        response = client.get_distribution(Id=distribution_id)
-        distribution_etag = response.get('ETag', '')
-        distribution_config = response \
-            .get('Distribution', {}) \
-            .get('DistributionConfig', {})
+        entry = _config_cache.get(distribution_id, client=client, refresh=attempt > 0)
+        if entry is None:
+            return False
+        # The cached config is shared, so the change is made on a copy.
+        distribution_config, distribution_etag = copy.deepcopy(entry[0]), entry[1]
         all_origins = distribution_config \
             .get('Origins', {}) \
             .get('Items', [])
-        filtered_origins = list(filter(lambda origin: origin.get('Id') == origin_name, all_origins))
-        if len(filtered_origins) == 0:
-            logging.error(f'Could not find origin with origin_name={origin_name} in distribution_id={distribution_id}')
-            return False
+        for name in origin_names:
+            filtered_origins = list(filter(lambda origin: origin.get('Id') == name, all_origins))
+            if len(filtered_origins) == 0:
+                logging.error(f'Could not find origin with origin_name={name} in distribution_id={distribution_id}')
+                return False
+            # Update the OriginPath to the new version path
+            filtered_origins[0]['OriginPath'] = new_origin_path
 
-        new_origin_path = new_origin_path if new_origin_path.startswith('/') else '/' + new_origin_path
-        # Update the OriginPath to the new version path
-        filtered_origins[0]['OriginPath'] = new_origin_path
+        try:
+            # Update the distribution config
+            response = client.update_distribution(
+                DistributionConfig=distribution_config,
+                Id=distribution_id,
+                IfMatch=distribution_etag,
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'PreconditionFailed' or attempt + 1 >= MAX_UPDATE_ATTEMPTS:
+                logging.error(e)
+                return False
+            delay = UPDATE_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+            logging.warning(f'Distribution ({distribution_id}) was changed by someone else, retrying its update in {delay:.1f}s')
+            metrics.count('distribution_update_conflicts')
+            time.sleep(delay)
+            continue
+        except BotoCoreError as e:
+            logging.error(e)
+            return False
+        _config_cache.put(distribution_id, response.get('Distribution', {}).get('DistributionConfig', distribution_config),
+                          response.get('ETag', ''))
+        break
+    logging.info(f'Submitted distribution ({distribution_id}) update: origin {", ".join(origin_names)} -> {new_origin_path}')
+    return True
 
-        # Update the distribution config
-        response = client.update_distribution(
-            DistributionConfig=distribution_config,
-            Id=distribution_id,
-            IfMatch=distribution_etag,
-        )
 
+def update_distribution(distribution_id: str, origin_name: str, new_origin_path: str, dry_run: bool = False) -> bool:
+    client = boto3.client('cloudfront')
+    success = submit_distribution_update(distribution_id, origin_name, new_origin_path, dry_run=dry_run, client=client)
+    if not success:
+        return False
     logging.info(f'Waiting for distribution ({distribution_id}) update to complete...')
-    if not dry_run:
-        waiter = client.get_waiter('distribution_deployed')
-        # This can take up to `Delay * MaxAttempts` seconds.
-        waiter.wait(
-            Id=distribution_id,
-            # WaiterConfig={
-            # 	'Delay': 30, # Wait N seconds between attempts.
-            # 	'MaxAttempts': 60 # Try at most N times.
-            # },
-        )
-    logging.info(f'Distribution ({distribution_id}) update completed')
+    return asyncio.run(wait_deployed(distribution_id, dry_run=dry_run, client=client))
 
-    return True
 
+async def update_async(distribution_id: str, origin_name: Union[str, List[str]], new_origin_path: str, dry_run: bool = False,
+                       paths_to_invalidate: Optional[List[str]] = None,
+                       batch_size: Optional[int] = None, wait: bool = True) -> bool:
+    """Point the origin to a new path, then invalidate the cached copies of the files that changed.
+
+    The invalidation is submitted as soon as the new origin path is deployed to
+    all edge locations: an edge still using the previous path could otherwise
+    cache stale content again right after being invalidated.
 
-def update(distribution_id: str, origin_name: str, new_origin_path: str, dry_run: bool = False) -> bool:
-    success = update_distribution(
-        distribution_id,
-        origin_name,
-        new_origin_path=new_origin_path,
-        dry_run=dry_run,
-    )
+    With `wait=False`, both requests are submitted right away and the function
+    returns once they are accepted. Edges that are slow to switch to the new path
+    may then keep serving stale content until it expires.
+
+    :param paths_to_invalidate: Paths to invalidate, or None to invalidate everything.
+    """
+    if paths_to_invalidate is None:
+        paths_to_invalidate = ['/*']
+    client = boto3.client('cloudfront')
+    started_at = time.monotonic()
+    success = await _run(submit_distribution_update, distribution_id, origin_name, new_origin_path,
+                         dry_run=dry_run, client=client)
     if not success:
         return False
+    metrics.count('invalidation_paths', len(paths_to_invalidate))
 
-    success = invalidate_paths(distribution_id, paths_to_invalidate=['/*'], dry_run=dry_run)
+    if not wait:
+        invalidation_ids = await _run(submit_invalidation, distribution_id, paths_to_invalidate,
+                                      dry_run=dry_run, batch_size=batch_size, client=client)
+        if invalidation_ids is None:
+            return False
+        logging.warning(f'Not waiting for distribution ({distribution_id}), the update and invalidations are still in progress.'
+                        f' Run `static-deployer wait --distribution-id {distribution_id}` to wait for them')
+        return True
+
+    success = await wait_deployed(distribution_id, dry_run=dry_run, client=client)
+    metrics.observe('distribution_update_seconds', time.monotonic() - started_at)
+    if not success:
+        return False
+    started_at = time.monotonic()
+    invalidation_ids = await _run(submit_invalidation, distribution_id, paths_to_invalidate,
+                                  dry_run=dry_run, batch_size=batch_size, client=client)
+    if invalidation_ids is None:
+        return False
+    success = await wait_invalidations(distribution_id, invalidation_ids, dry_run=dry_run, client=client)
+    metrics.observe('invalidation_seconds', time.monotonic() - started_at)
     return success
+
+
+def update(distribution_id: str, origin_name: str, new_origin_path: str, dry_run: bool = False,
+           paths_to_invalidate: Optional[List[str]] = None,
+           batch_size: Optional[int] = None, wait: bool = True) -> bool:
+    return asyncio.run(update_async(distribution_id, origin_name, new_origin_path, dry_run=dry_run,
+                                    paths_to_invalidate=paths_to_invalidate, batch_size=batch_size, wait=wait))
+
+
+async def wait_async(distribution_ids: List[str], invalidation_ids: Optional[List[str]] = None) -> bool:
+    """Wait until distributions are deployed and their invalidations complete.
+
+    :param invalidation_ids: Invalidations to wait for, or None for all those in progress.
+    """
+    client = boto3.client('cloudfront')
+
+    async def wait_one(distribution_id: str) -> bool:
+        ids = invalidation_ids
+        if ids is None:
+            ids = await _run(list_pending_invalidations, distribution_id, client=client)
+            if ids is None:
+                return False
+        results = await asyncio.gather(
+            wait_deployed(distribution_id, client=client),
+            wait_invalidations(distribution_id, ids, client=client),
+        )
+        return all(results)
+
+    results = await asyncio.gather(*[wait_one(distribution_id) for distribution_id in distribution_ids])
+    return all(results)
+
+
+def wait(distribution_ids: List[str], invalidation_ids: Optional[List[str]] = None) -> bool:
+    return asyncio.run(wait_async(distribution_ids, invalidation_ids))
+
+
+async def update_all_async(cdns: List[types.CdnDetails], new_origin_path: str, dry_run: bool = False,
+                           paths_to_invalidate: Optional[Dict[Tuple[str, str], Optional[List[str]]]] = None) -> bool:
+    """Update several distributions at the same time, then report the outcome and duration of each one.
+
+    The origins of a same distribution are updated together, since CloudFront
+    rejects concurrent changes to a distribution.
+
+    :param paths_to_invalidate: Paths to invalidate for each (distribution id, origin name), all paths (`/*`) if missing.
+    """
+    paths_to_invalidate = paths_to_invalidate or {}
+    groups: Dict[str, List[types.CdnDetails]] = {}
+    for cdn in cdns:
+        groups.setdefault(cdn.distribution_id, []).append(cdn)
+
+    async def update_group(distribution_id: str, group: List[types.CdnDetails]) -> Tuple[bool, float]:
+        started_at = time.monotonic()
+        paths = None
+        group_paths = [paths_to_invalidate.get((cdn.distribution_id, cdn.origin_name)) for cdn in group]
+        if all(item is not None for item in group_paths):
+            paths = sorted(set().union(*group_paths))
+            if len(paths) > group[0].invalidation_limits.max_paths:
+                paths = None
+        success = await update_async(distribution_id, [cdn.origin_name for cdn in group], new_origin_path,
+                                     dry_run=dry_run, paths_to_invalidate=paths,
+                                     batch_size=group[0].invalidation_limits.batch_size,
+                                     wait=any(cdn.wait for cdn in group))
+        return success, time.monotonic() - started_at
+
+    results = await asyncio.gather(*[update_group(distribution_id, group) for distribution_id, group in groups.items()])
+    for (distribution_id, group), (success, elapsed) in zip(groups.items(), results):
+        origin_names = ', '.join(cdn.origin_name for cdn in group)
+        if success:
+            logging.info(f'Distribution {distribution_id} (origin {origin_names}): updated in {elapsed:.1f}s')
+        else:
+            logging.error(f'Distribution {distribution_id} (origin {origin_names}): failed after {elapsed:.1f}s')
+    if len(groups) > 1:
+        logging.info(f'Updated {sum(success for success, _ in results)} of {len(groups)} distributions')
+    return all(success for success, _ in results)
+
+
+def update_all(cdns: List[types.CdnDetails], new_origin_path: str, dry_run: bool = False,
+               paths_to_invalidate: Optional[Dict[Tuple[str, str], Optional[List[str]]]] = None) -> bool:
+    return asyncio.run(update_all_async(cdns, new_origin_path, dry_run=dry_run, paths_to_invalidate=paths_to_invalidate))
+
+
+def get_status(distribution_id: str) -> Optional[Dict[str, Any]]:
+    """Describe the state of a distribution: its status, the path of each origin and the invalidations in progress.
+
+    :return: The status, or None if it could not be fetched.
+    """
+    client = boto3.client('cloudfront')
+    try:
+        response = client.get_distribution(Id=distribution_id)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    distribution = response.get('Distribution', {})
+    origins = distribution.get('DistributionConfig', {}).get('Origins', {}).get('Items', [])
+    pending_invalidations = list_pending_invalidations(distribution_id, client=client)
+    if pending_invalidations is None:
+        return None
+    return {
+        'distribution_id': distribution_id,
+        'status': distribution.get('Status'),
+        'domain_name': distribution.get('DomainName'),
+        'origins': {origin.get('Id'): origin.get('OriginPath', '').lstrip('/') for origin in origins},
+        'pending_invalidations': pending_invalidations,
+    }
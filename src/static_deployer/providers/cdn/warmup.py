@@ -0,0 +1,188 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from ...common import invalidation, log, metrics, throttle, types
+from . import cloudfront
+import attr
+import heapq
+import logging
+import threading
+import time
+import urllib3
+
+# Pages are fetched first: visitors request them before the files they reference.
+PAGE_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+PAGE_EXTENSIONS = ('.html', '.htm')
+# Browsers ask for compressed content, and CloudFront caches each encoding it serves apart.
+ACCEPT_ENCODING = 'br, gzip'
+USER_AGENT = 'static-deployer-warmup'
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 60.0
+# Responses are read to the end, since edges only cache complete ones, and dropped chunk by chunk.
+READ_CHUNK_SIZE = 64 * 1024
+
+
+@attr.s(auto_attribs=True)
+class WarmupReport(object):
+    """Outcome of the requests sent to warm up a distribution.
+
+    Hits and misses are told by the X-Cache header CloudFront adds to its responses
+    (e.g. 'Hit from cloudfront', 'RefreshHit from cloudfront', 'Miss from cloudfront').
+    """
+    requests: int = 0
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+
+    def record(self, status: Optional[int], x_cache: Optional[str] = None, size: int = 0) -> str:
+        """Count a response, or a request that failed without one if `status` is None.
+
+        :return: How it counted: 'hits', 'misses' or 'errors'.
+        """
+        if status is None or status >= 400:
+            outcome = 'errors'
+        elif x_cache and 'hit' in x_cache.lower():
+            outcome = 'hits'
+        else:
+            outcome = 'misses'
+        self.requests += 1
+        self.bytes += size
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        return outcome
+
+    def hit_rate(self) -> float:
+        num_served = self.hits + self.misses
+        return self.hits / num_served if num_served else 0.0
+
+    def summary(self) -> str:
+        return (f'{self.requests} files ({self.bytes / 1024 / 1024:.2f} MiB) in {self.elapsed:.2f}s:'
+                f' {self.hits} hits ({self.hit_rate():.0%}), {self.misses} misses, {self.errors} errors')
+
+
+def is_page(entry: types.ManifestEntry) -> bool:
+    content_type = (entry.content_type or '').split(';')[0].strip().lower()
+    return content_type in PAGE_CONTENT_TYPES or entry.path.lower().endswith(PAGE_EXTENSIONS)
+
+
+def url_path(path: str) -> str:
+    """Get the URL path visitors request a file by: index documents are requested by their directory (e.g. `/docs/`)."""
+    directory, _, file_name = path.rpartition('/')
+    if file_name == invalidation.INDEX_DOCUMENT:
+        return '/' + (quote(directory) + '/' if directory else '')
+    return '/' + quote(path)
+
+
+def plan_warmup(get_entries: Callable[[], Iterable[types.ManifestEntry]], max_files: int) -> List[str]:
+    """Pick the files to fetch: the pages first, from the shallowest (e.g. the home page), then the largest other files.
+
+    Each pass over the entries only keeps `max_files` of them, so memory usage does
+    not depend on the number of files.
+
+    :param get_entries: Returns the manifest entries of the version, called once per pass.
+    :return: The URL paths to fetch, in order.
+    """
+    pages = heapq.nsmallest(max_files, (entry.path for entry in get_entries() if is_page(entry)),
+                            key=lambda path: (path.count('/'), not path.endswith(invalidation.INDEX_DOCUMENT), path))
+    assets = heapq.nlargest(max_files - len(pages), (entry for entry in get_entries() if not is_page(entry)),
+                            key=lambda entry: entry.size)
+    return [url_path(path) for path in pages] + [url_path(entry.path) for entry in assets]
+
+
+def fetch(pool: urllib3.PoolManager, url: str) -> Tuple[int, Optional[str], int]:
+    """Download a file and drop its content.
+
+    :return: The status of the response, its X-Cache header, and the number of bytes read.
+    """
+    response = pool.request('GET', url, preload_content=False, redirect=False, headers={
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'User-Agent': USER_AGENT,
+    })
+    try:
+        size = sum(len(chunk) for chunk in response.stream(READ_CHUNK_SIZE, decode_content=False))
+    finally:
+        response.release_conn()
+    return response.status, response.headers.get('X-Cache'), size
+
+
+def warm_up(base_url: str, paths: List[str], settings: types.WarmupSettings) -> WarmupReport:
+    """Fetch files through a distribution, so its edges cache them before visitors ask for them.
+
+    The requests are sent from this machine, so they fill the edge it reaches and
+    the regional cache behind it, which then shields the origin from the other edges
+    of its region.
+
+    :param base_url: URL the paths are appended to, e.g. https://d111111abcdef8.cloudfront.net
+    """
+    base_url = base_url.rstrip('/')
+    pool = urllib3.PoolManager(maxsize=settings.concurrency, retries=False,
+                               timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT))
+    # Requests are evenly spaced rather than sent in bursts, which would reach the origin all at once.
+    rate = throttle.TokenBucket(settings.max_rate, capacity=1) if settings.max_rate else None
+    report = WarmupReport()
+    lock = threading.Lock()
+
+    def task(path: str) -> None:
+        if rate:
+            rate.consume(1)
+        started_at = time.monotonic()
+        try:
+            status, x_cache, size = fetch(pool, base_url + path)
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            with lock:
+                outcome = report.record(None)
+                is_first_error = report.errors == 1
+            # The first error is enough to tell e.g. a wrong base URL, the others would only repeat it.
+            if is_first_error:
+                logging.warning(f'Failed to fetch {base_url + path}: {e}')
+            else:
+                log.debug(f'Failed to fetch {base_url + path}: {e}')
+        else:
+            metrics.observe('warmup_request_seconds', time.monotonic() - started_at)
+            metrics.count('warmup_bytes', size)
+            log.debug(f'Fetched {base_url + path}: status={status} x-cache={x_cache} size={size}')
+            with lock:
+                outcome = report.record(status, x_cache, size)
+        metrics.count('warmup_requests')
+        metrics.count(f'warmup_{outcome}')
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=settings.concurrency) as executor:
+        list(executor.map(task, paths))
+    report.elapsed = time.monotonic() - started_at
+    pool.clear()
+    return report
+
+
+def warm_up_distributions(base_urls: Dict[str, Optional[str]], paths: List[str], settings: types.WarmupSettings,
+                          dry_run: bool = False) -> bool:
+    """Warm up the edges of distributions that serve a new version, with the same files for each one.
+
+    :param base_urls: URL of the site served by each distribution id, None for its CloudFront domain.
+    :param paths: The URL paths to fetch, as planned by `plan_warmup`.
+    :return: True if every file was fetched from every distribution, else False
+    """
+    if not paths:
+        logging.info('Nothing to warm up')
+        return True
+    if dry_run:
+        logging.info(f'Would warm up {len(paths)} files in {len(base_urls)} distributions: {paths[:5]}'
+                     + ('...' if len(paths) > 5 else ''))
+        return True
+    success = True
+    for distribution_id, base_url in base_urls.items():
+        if base_url is None:
+            domain_name = cloudfront.get_domain_name(distribution_id)
+            if domain_name is None:
+                success = False
+                continue
+            base_url = f'https://{domain_name}'
+        logging.info(f'Warming up distribution ({distribution_id}) with {len(paths)} files from {base_url}')
+        report = warm_up(base_url, paths, settings)
+        if report.errors:
+            logging.warning(f'Warmed up distribution ({distribution_id}) with {report.summary()}')
+            success = False
+        else:
+            logging.info(f'Warmed up distribution ({distribution_id}) with {report.summary()}')
+    return success
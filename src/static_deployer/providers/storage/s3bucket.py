@@ -1,15 +1,51 @@
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from boto3.s3.transfer import TransferConfig
+from s3transfer.utils import ChunksizeAdjuster
 from botocore.config import Config
-from botocore.exceptions import ClientError
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.exceptions import BotoCoreError, ClientError
+from botocore.parsers import ResponseParserFactory
+from botocore.utils import parse_timestamp as botocore_parse_timestamp
 from io import IOBase
+import attr
 import boto3
+import fnmatch
+import heapq
 import os
 import mimetypes
-import multiprocessing
+import queue
+import re
+import threading
+import time
 import logging
 import hashlib
-# import base64
-from ...common import log, types
+import base64
+import datetime
+import zlib
+from ...common import journal, log, manifest, metrics, throttle, types
+
+# Number of files upload_files looks ahead to pick the largest one to start.
+SORT_WINDOW_SIZE = 256
+# Number of shards of a prefix listed at the same time.
+DEFAULT_LIST_CONCURRENCY = 16
+# How many levels of '/' delimited sub-prefixes are explored to find shards.
+MAX_LIST_SHARD_DEPTH = 3
+# Larger objects can only be copied with a multipart copy.
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * 1024 * 1024
+# Maximum number of keys of a DeleteObjects request.
+MAX_DELETE_BATCH_SIZE = 1000
+# Error codes S3 answers with when requests are sent too fast.
+THROTTLING_ERROR_CODES = ('SlowDown', 'RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'RequestThrottled')
+# Requests sending at most this many bytes take about one round trip, so their
+# duration tells whether requests start queueing up.
+LATENCY_PROBE_MAX_SIZE = 64 * 1024
+# Attempts of each request when the concurrency adapts: throttled requests are
+# retried longer, since the concurrency decreases in the meantime.
+ADAPTIVE_MAX_ATTEMPTS = 10
+# Size of the reads when hashing a file.
+HASH_CHUNK_SIZE = 1024 * 1024
+# Checksums S3 can verify, in addition to the Content-MD5 of the single request uploads.
+CHECKSUM_ALGORITHMS = ('CRC32', 'CRC32C', 'SHA1', 'SHA256')
 
 
 # Original source: https://stackoverflow.com/a/3431838/298054
@@ -21,82 +57,993 @@ def hash_file(file: IOBase) -> str:
     return hash_impl.hexdigest()
 
 
-def upload_file(file_name: str, bucket_name: str, object_name: str, options: types.UploadOptions, dry_run: bool = False) -> bool:
+def check_checksum_algorithm(algorithm: str) -> bool:
+    """Tell whether a checksum algorithm is supported, logging why it is not."""
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        logging.error(f'Unsupported checksum algorithm: {algorithm} (expected one of {", ".join(CHECKSUM_ALGORITHMS)})')
+        return False
+    if algorithm == 'CRC32C':
+        try:
+            import awscrt.checksums  # noqa: F401
+        except ImportError:
+            logging.error('CRC32C checksums require the awscrt package: pip3 install awscrt')
+            return False
+    return True
+
+
+class _Crc(object):
+    """hashlib-like interface to a CRC function."""
+
+    def __init__(self, function: Callable[[Any, int], int]):
+        self._function = function
+        self._value = 0
+
+    def update(self, data) -> None:
+        self._value = self._function(data, self._value)
+
+    def digest(self) -> bytes:
+        return self._value.to_bytes(4, 'big')
+
+
+def _new_checksum(algorithm: str):
+    if algorithm == 'CRC32':
+        return _Crc(zlib.crc32)
+    if algorithm == 'CRC32C':
+        from awscrt import checksums
+        return _Crc(checksums.crc32c)
+    return hashlib.new(algorithm.lower())
+
+
+class DigestBuilder(object):
+    """Compute the digests of a file from its data, fed in order in chunks of any size.
+
+    This computes the MD5 of the file, the ETag S3 assigns to it when uploaded
+    and, if an algorithm is specified, a checksum S3 can verify. Chunks are not
+    copied, so the data being uploaded can be hashed as it is read.
+
+    :param part_size: Size of each part if the file is uploaded in multiple parts, else 0.
+    :param checksum_algorithm: One of CHECKSUM_ALGORITHMS, or None.
+    :param whole_md5: Compute the MD5 of the whole file, which the ETag of multipart uploads does not need.
+    """
+
+    def __init__(self, part_size: int = 0, checksum_algorithm: Optional[str] = None, whole_md5: bool = True):
+        self.part_size = part_size
+        self.checksum_algorithm = checksum_algorithm
+        self.size = 0
+        self._md5 = hashlib.md5() if whole_md5 or not part_size else None
+        self._checksum = _new_checksum(checksum_algorithm) if checksum_algorithm else None
+        self._part_md5 = hashlib.md5()
+        self._part_filled = 0
+        self._part_digests = []
+
+    def update(self, data) -> None:
+        if self._md5 is not None:
+            self._md5.update(data)
+        if self._checksum is not None:
+            self._checksum.update(data)
+        self.size += len(data)
+        if not self.part_size:
+            return
+        view = memoryview(data)
+        while view:
+            # A part is only closed once the next one starts, so a file never ends with an empty part.
+            if self._part_filled == self.part_size:
+                self._part_digests.append(self._part_md5.digest())
+                self._part_md5 = hashlib.md5()
+                self._part_filled = 0
+            chunk = view[:self.part_size - self._part_filled]
+            self._part_md5.update(chunk)
+            self._part_filled += len(chunk)
+            view = view[len(chunk):]
+
+    def etag(self) -> str:
+        """The ETag S3 assigns to the file: the plain MD5 hex digest for single part uploads,
+        or the `md5-of-md5s-N` form for multipart uploads."""
+        if not self.part_size:
+            return self._md5.hexdigest()
+        part_digests = self._part_digests + ([self._part_md5.digest()] if self._part_filled else [])
+        return f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+
+    def _whole_md5(self):
+        if self._md5 is None:
+            raise ValueError('The MD5 of the whole file is not computed with whole_md5=False')
+        return self._md5
+
+    def finish(self) -> types.FileDigest:
+        """:raise ValueError: If the MD5 of the whole file was not computed (see `whole_md5`)."""
+        return types.FileDigest(md5=self._whole_md5().hexdigest(), etag=self.etag())
+
+    def checksum_args(self) -> Dict[str, str]:
+        """The arguments of a PutObject request telling S3 the digests of the whole file, for it to verify them.
+
+        :raise ValueError: If the MD5 of the whole file was not computed (see `whole_md5`).
+        """
+        result = {'ContentMD5': base64.b64encode(self._whole_md5().digest()).decode('ascii')}
+        if self._checksum is not None:
+            result[f'Checksum{self.checksum_algorithm}'] = base64.b64encode(self._checksum.digest()).decode('ascii')
+        return result
+
+
+class DigestReader(object):
+    """File object wrapper feeding the data read to a DigestBuilder.
+
+    The managed transfer may read some data again (e.g. to retry a request), so
+    only the data past what was already fed is. If some data is skipped, the
+    digest is incomplete, see `is_complete`.
+    """
+
+    def __init__(self, fileobj: IOBase, builder: DigestBuilder):
+        self._fileobj = fileobj
+        self._builder = builder
+        self._position = fileobj.tell()
+        # The data up to this offset was fed to the builder.
+        self._fed = self._position
+        self._skipped = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        start = self._position
+        self._position += len(data)
+        if start > self._fed:
+            self._skipped = self._skipped or bool(data)
+        elif self._position > self._fed:
+            self._builder.update(memoryview(data)[self._fed - start:])
+            self._fed = self._position
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        self._position = self._fileobj.seek(offset, whence)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        self._fileobj.close()
+
+    def is_complete(self, size: int) -> bool:
+        """Tell whether all the data of a file of `size` bytes was fed to the builder."""
+        return not self._skipped and self._fed == size
+
+
+def compute_digest(file: IOBase, part_size: int = 0) -> types.FileDigest:
+    """Compute the MD5 of a file and the ETag S3 assigns to it when uploaded.
+
+    Both are computed reading the file only once.
+
+    :param file: File object opened in binary mode.
+    :param part_size: Size of each part if the file is uploaded in multiple parts, else 0.
+    :return: A FileDigest, see `DigestBuilder.etag`.
+    """
+    builder = DigestBuilder(part_size)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        builder.update(chunk)
+    return builder.finish()
+
+
+def build_extra_args(file_name: str, options: types.UploadOptions) -> Dict[str, Any]:
+    # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/customizations/s3.html#boto3.s3.transfer.S3Transfer.ALLOWED_UPLOAD_ARGS
+    content_type, content_encoding = mimetypes.guess_type(file_name)
+    extra_opts = {}
+    if options and options.cache_maxage is not None:
+        extra_opts = {
+            **extra_opts,
+            'CacheControl': f'public, max-age={options.cache_maxage}',
+        }
+    if content_type:
+        extra_opts = {
+            **extra_opts,
+            'ContentType': content_type,
+        }
+    return extra_opts
+
+
+def create_client(max_pool_connections: int = 10, max_attempts: int = 3):
+    """Create an S3 client.
+
+    Clients are thread-safe, so a single one should be shared by all the threads
+    of a deploy, with a connection pool large enough to serve all of them.
+    """
+    # Retry configuration
+    # See https://boto3.amazonaws.com/v1/documentation/api/latest/guide/retries.html
+    config = Config(
+        retries = {
+            'max_attempts': max_attempts,
+            'mode': 'standard',
+        },
+        max_pool_connections=max_pool_connections,
+    )
+    client = boto3.client('s3', config=config)
+    use_fast_timestamp_parser(client)
+    return client
+
+
+def parse_timestamp(value) -> datetime.datetime:
+    """Parse a timestamp of a response, quickly if it is in the ISO 8601 form listings use.
+
+    Other forms (e.g. the RFC 1123 dates of headers) are parsed by botocore.
+    """
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return botocore_parse_timestamp(value)
+
+
+def use_fast_timestamp_parser(client) -> None:
+    """Have an S3 client parse timestamps with `parse_timestamp`.
+
+    botocore parses them with dateutil, which takes most of the time of listing
+    objects, as it happens for the LastModified of every key. The client gets a
+    parser factory of its own, since the one of the session is shared by all its
+    clients (e.g. CloudFront ones).
+    """
+    factory = ResponseParserFactory()
+    factory.set_parser_defaults(timestamp_parser=parse_timestamp)
+    client._endpoint._response_parser_factory = factory
+
+
+class RequestObserver(object):
+    """Hooks into an S3 client to cap its request rate and to feed an AdaptiveLimiter.
+
+    Each attempt of a request (retries included) counts: it takes a token from
+    `request_rate`, then tells the limiter whether it succeeded or was throttled.
+    """
+
+    def __init__(self, limiter: Optional[throttle.AdaptiveLimiter] = None,
+                 request_rate: Optional[throttle.TokenBucket] = None):
+        self.limiter = limiter
+        self.request_rate = request_rate
+        # Attempts are sent and their outcome handled by the same thread.
+        self._local = threading.local()
+
+    def register(self, client) -> None:
+        client.meta.events.register('request-created.s3', self._on_request_created)
+        client.meta.events.register('needs-retry.s3', self._on_attempt_done)
+
+    def _on_request_created(self, request, **kwargs) -> None:
+        if self.request_rate is not None:
+            self.request_rate.consume(1)
+        size = request.headers.get('Content-Length')
+        if size is None:
+            body = request.body
+            size = len(body) if isinstance(body, (bytes, bytearray, str)) else 0 if body is None else None
+        self._local.is_probe = size is not None and int(size) <= LATENCY_PROBE_MAX_SIZE
+        self._local.started_at = time.monotonic()
+
+    def _on_attempt_done(self, response, **kwargs) -> None:
+        # The response is missing when the request failed before getting one (e.g. a connection error).
+        if self.limiter is None or response is None:
+            return None
+        http_response, parsed = response
+        error_code = parsed.get('Error', {}).get('Code') if isinstance(parsed, dict) else None
+        if http_response.status_code == 503 or error_code in THROTTLING_ERROR_CODES:
+            self.limiter.on_throttle()
+        elif http_response.status_code < 400:
+            started_at = getattr(self._local, 'started_at', None)
+            is_probe = getattr(self._local, 'is_probe', False) and started_at is not None
+            self.limiter.on_success(time.monotonic() - started_at if is_probe else None)
+        # Leave the decision to retry to the retry handler.
+        return None
+
+
+class TransferResponses(object):
+    """Hooks into an S3 client to keep the final response of the managed transfers.
+
+    The managed transfer does not return the response of its final request
+    (PutObject or CompleteMultipartUpload), which holds the ETag of the object.
+    Only the responses for the keys passed to `expect` are kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def register(self, client) -> None:
+        for operation in ('PutObject', 'CompleteMultipartUpload'):
+            client.meta.events.register(f'before-parameter-build.s3.{operation}', self._on_before_call)
+            client.meta.events.register(f'after-call.s3.{operation}', self._on_after_call)
+
+    def expect(self, key: str) -> None:
+        with self._lock:
+            self._responses[key] = None
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._responses.pop(key, None)
+
+    @staticmethod
+    def _on_before_call(params, context, **kwargs) -> None:
+        # The response of a PutObject does not tell which key it is for.
+        context['static_deployer_key'] = params.get('Key')
+
+    def _on_after_call(self, http_response, parsed, context, **kwargs) -> None:
+        key = context.get('static_deployer_key')
+        if http_response.status_code >= 300 or not isinstance(parsed, dict) or 'ETag' not in parsed:
+            return
+        with self._lock:
+            if key in self._responses:
+                self._responses[key] = parsed
+
+
+def has_md5_etag(response: Dict[str, Any]) -> bool:
+    """Tell whether the ETag of an object is derived from the MD5 of its data, which depends on its encryption."""
+    return not str(response.get('ServerSideEncryption', '')).startswith('aws:kms') \
+        and 'SSECustomerAlgorithm' not in response
+
+
+class TransferPolicy(object):
+    """Transfer settings of each file, compiled once from the UploadOptions."""
+
+    def __init__(self, options: types.UploadOptions):
+        self._small_file_threshold = options.small_file_threshold
+        self._chunksize_adjuster = ChunksizeAdjuster()
+        default_settings = options.transfer
+        self._default = (default_settings, self._make_config(default_settings))
+        self._rules = []
+        for rule in options.transfer_rules:
+            settings = types.TransferSettings(
+                multipart_threshold=rule.multipart_threshold or default_settings.multipart_threshold,
+                multipart_chunksize=rule.multipart_chunksize or default_settings.multipart_chunksize,
+                max_concurrency=rule.max_concurrency or default_settings.max_concurrency,
+            )
+            regex = re.compile(fnmatch.translate(rule.pattern))
+            self._rules.append((regex, settings, self._make_config(settings)))
+
+    @staticmethod
+    def _make_config(settings: types.TransferSettings, max_concurrency: Optional[int] = None) -> TransferConfig:
+        max_concurrency = min(settings.max_concurrency, max_concurrency or settings.max_concurrency)
+        return TransferConfig(
+            multipart_threshold=settings.multipart_threshold,
+            multipart_chunksize=settings.multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
+
+    def limit(self, settings: types.TransferSettings, config: TransferConfig, max_concurrency: int) -> TransferConfig:
+        """Get a transfer config running at most `max_concurrency` part threads, e.g. the budget slots taken."""
+        if config.max_concurrency <= max_concurrency:
+            return config
+        return self._make_config(settings, max_concurrency)
+
+    def lookup(self, relative_path: str) -> Tuple[types.TransferSettings, TransferConfig]:
+        """Find the settings for a file.
+
+        :param relative_path: Path relative to the root directory, using '/' as separator.
+        """
+        for regex, settings, config in self._rules:
+            if regex.match(relative_path):
+                return settings, config
+        return self._default
+
+    def part_size(self, settings: types.TransferSettings, size: int) -> int:
+        """Get the size of the parts a file will be uploaded in.
+
+        :return: The part size, or 0 if the file is uploaded with a single request.
+        """
+        if size < max(settings.multipart_threshold, self._small_file_threshold):
+            return 0
+        # Same adjustment the managed transfer applies, to respect S3's limits on parts.
+        return self._chunksize_adjuster.adjust_chunksize(settings.multipart_chunksize, size)
+
+
+class MetadataPolicy(object):
+    """Object metadata of each file, compiled once from the UploadOptions.
+
+    The patterns of all the rules are combined into a single regex, so finding
+    the rule of a file takes a single match, and the first rule matching wins.
+    The metadata is built once for each rule, content type and encoding, and
+    shared by all the files having them, so it must not be modified.
+    """
+
+    def __init__(self, options: types.UploadOptions):
+        self._default_cache_control = f'public, max-age={options.cache_maxage}' if options.cache_maxage is not None else None
+        self._rules = options.metadata_rules
+        self._regex = None
+        # Number of the regex group of each rule -> index of the rule.
+        self._rule_indexes: Dict[int, int] = {}
+        if self._rules:
+            self._regex = re.compile('|'.join(
+                f'(?P<rule{index}>{fnmatch.translate(rule.pattern)})' for index, rule in enumerate(self._rules)
+            ))
+            self._rule_indexes = {self._regex.groupindex[f'rule{index}']: index for index in range(len(self._rules))}
+        self._cache: Dict[Tuple[Optional[int], Optional[str], Optional[str]], Dict[str, Any]] = {}
+
+    def _find_rule(self, relative_path: str) -> Optional[int]:
+        if self._regex is None:
+            return None
+        match = self._regex.match(relative_path)
+        if match is None:
+            return None
+        # The group of the matching rule encloses the groups of its pattern, so it is the last one closed.
+        return self._rule_indexes[match.lastindex]
+
+    def _build(self, rule: Optional[types.MetadataRule], content_type: Optional[str],
+               content_encoding: Optional[str]) -> Dict[str, Any]:
+        extra_args = {}
+        cache_control = rule.cache_control if rule and rule.cache_control else self._default_cache_control
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        if rule and rule.content_type:
+            content_type = rule.content_type
+        if content_type:
+            extra_args['ContentType'] = content_type
+        if content_encoding:
+            extra_args['ContentEncoding'] = content_encoding
+        if rule and rule.content_disposition:
+            extra_args['ContentDisposition'] = rule.content_disposition
+        if rule and rule.metadata:
+            extra_args['Metadata'] = dict(rule.metadata)
+        return extra_args
+
+    def lookup(self, relative_path: str, content_encoding: Optional[str] = None) -> Dict[str, Any]:
+        """Find the metadata of a file.
+
+        :param relative_path: Path relative to the root directory, using '/' as separator.
+        :param content_encoding: Encoding of the data uploaded, if it was compressed.
+        :return: The extra arguments of the upload or copy request, shared with other files.
+        """
+        rule_index = self._find_rule(relative_path)
+        content_type, _ = mimetypes.guess_type(relative_path)
+        key = (rule_index, content_type, content_encoding)
+        extra_args = self._cache.get(key)
+        if extra_args is None:
+            rule = self._rules[rule_index] if rule_index is not None else None
+            # Threads may race to build the same entry, they get equal values.
+            extra_args = self._cache[key] = self._build(rule, content_type, content_encoding)
+        return extra_args
+
+
+@attr.s(auto_attribs=True)
+class UploadContext(object):
+    """State shared by all the tasks of an `upload_files` call."""
+    client: Any
+    root_dir: str
+    bucket_name: str
+    options: types.UploadOptions
+    policy: TransferPolicy
+    metadata: MetadataPolicy
+    # Slots shared by the file-level and the part-level threads.
+    budget: throttle.ConcurrencyBudget
+    responses: Optional[TransferResponses] = None
+    bandwidth: Optional[throttle.TokenBucket] = None
+    dry_run: bool = False
+
+
+def upload_file(file_name: str, bucket_name: str, object_name: str, options: types.UploadOptions, dry_run: bool = False, client=None,
+                transfer_config: Optional[TransferConfig] = None, bandwidth: Optional[throttle.TokenBucket] = None,
+                extra_args: Optional[Dict[str, Any]] = None, part_size: int = 0,
+                responses: Optional[TransferResponses] = None) -> Optional[str]:
     """Upload a file to an S3 bucket.
 
-    This will use a managed transfer which will perform a multipart upload
-    in multiple threads if necessary.
+    Files smaller than `options.small_file_threshold` are read at once and sent
+    with a single PutObject request. Other files use a managed transfer which
+    will perform a multipart upload in multiple threads if necessary.
+
+    Each file is read once: its digests are computed from the data being sent.
+    Single requests carry the Content-MD5 (and checksum) of the file, which S3
+    verifies. For managed transfers, the ETag S3 returns is checked against the
+    one computed locally.
 
     :param file_name: File to upload
     :param bucket_name: BucketDetails to upload to
     :param object_name: S3 object name. If not specified then file_name is used
     :param dry_run: if True, do not actually perform the action.
-    :return: True if file was uploaded, else False
+    :param client: S3 client to use. If not specified then a new one is created
+    :param transfer_config: Configuration of the managed transfer. If not specified then boto3's defaults are used
+    :param bandwidth: Token bucket limiting the bytes/s, shared with other uploads
+    :param extra_args: Object metadata. If not specified then it is built from file_name and options
+    :param part_size: Size of the parts of the managed transfer (see `TransferPolicy.part_size`), 0 if it sends a single request
+    :param responses: Keeps the final response of managed transfers. If not specified then the object is requested after the upload
+    :return: The ETag of the uploaded object (empty on dry runs), or None if the upload failed
     """
 
     # If S3 object_name was not specified, use file_name
     if object_name is None:
         object_name = os.path.basename(file_name)
 
-    # Retry configuration
-    # See https://boto3.amazonaws.com/v1/documentation/api/latest/guide/retries.html
-    config = Config(
-        retries = {
-            'max_attempts': 3,
-            'mode': 'standard',
-        }
-    )
-
     # Upload the file
-    client = boto3.client('s3', config=config)
+    client = client or create_client()
+    etag = ''
     try:
         with open(file_name, "rb") as fileobj:
-            # hash_string = hash_file(fileobj)
-            # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/customizations/s3.html#boto3.s3.transfer.S3Transfer.ALLOWED_UPLOAD_ARGS
-            content_type, content_encoding = mimetypes.guess_type(file_name)
-            extra_opts = {
-                # 'ContentMD5': base64.b64encode(hash_string),
-            }
-            if options and options.cache_maxage is not None:
-                extra_opts = {
-                    **extra_opts,
-                    'CacheControl': f'public, max-age={options.cache_maxage}',
-                }
-            if content_type:
-                extra_opts = {
-                    **extra_opts,
-                    'ContentType': f'{content_type}{"; {content_encoding}" if content_encoding else ""}',
-                }
-            log.debug(f'\'{file_name}\' -> \'s3://{bucket_name}/{object_name}\' extra_opts={extra_opts}')
+            extra_opts = extra_args if extra_args is not None else build_extra_args(file_name, options)
+            size = os.fstat(fileobj.fileno()).st_size
+            is_small_file = size < options.small_file_threshold
+            log.debug(f'\'{file_name}\' -> \'s3://{bucket_name}/{object_name}\' size={size} extra_opts={extra_opts}')
             if not dry_run:
-                response = client.upload_fileobj(fileobj, bucket_name, object_name, ExtraArgs=extra_opts)
+                if is_small_file:
+                    # Skip the managed transfer machinery, whose setup dominates the time spent on small files.
+                    body = fileobj.read()
+                    builder = DigestBuilder(checksum_algorithm=options.checksum_algorithm)
+                    builder.update(body)
+                    if bandwidth:
+                        bandwidth.consume(len(body))
+                    response = client.put_object(Bucket=bucket_name, Key=object_name, Body=body,
+                                                 **extra_opts, **builder.checksum_args())
+                    etag = response['ETag'].strip('"')
+                else:
+                    # The parts are read one after the other by a single thread, so only what the ETag needs is computed.
+                    builder = DigestBuilder(part_size, whole_md5=False)
+                    digest_reader = DigestReader(fileobj, builder)
+                    reader = throttle.ThrottledReader(digest_reader, bandwidth) if bandwidth else digest_reader
+                    if options.checksum_algorithm:
+                        # The managed transfer computes the checksum of each part.
+                        extra_opts = {**extra_opts, 'ChecksumAlgorithm': options.checksum_algorithm}
+                    if responses:
+                        responses.expect(object_name)
+                    try:
+                        client.upload_fileobj(reader, bucket_name, object_name, ExtraArgs=extra_opts, Config=transfer_config)
+                    finally:
+                        response = responses.pop(object_name) if responses else None
+                    if response is None:
+                        response = client.head_object(Bucket=bucket_name, Key=object_name)
+                    etag = response['ETag'].strip('"')
+                    # Without the right part size (e.g. when none was passed), the ETags cannot be compared.
+                    is_comparable = ('-' in etag) == (part_size > 0) and has_md5_etag(response)
+                    if is_comparable and digest_reader.is_complete(size):
+                        expected_etag = builder.etag()
+                        if etag != expected_etag:
+                            logging.error(f'\'s3://{bucket_name}/{object_name}\' does not match \'{file_name}\':'
+                                          f' its ETag is {etag} instead of {expected_etag}')
+                            metrics.count('integrity_errors')
+                            return None
     except OSError as e:
         logging.error(e)
+        return None
+    except ClientError as e:
+        logging.error(e)
+        return None
+    return etag
+
+
+def copy_file(file_name: str, bucket_name: str, source_name: str, object_name: str, options: types.UploadOptions, dry_run: bool = False, client=None,
+              size: Optional[int] = None, extra_args: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Copy an existing object to a new key, server-side.
+
+    The metadata is rebuilt from `file_name` and `options`, so the copy carries
+    the same headers a fresh upload of that file would.
+
+    :param file_name: Local file the source object was uploaded from
+    :param bucket_name: Bucket holding both objects
+    :param source_name: S3 object name to copy from
+    :param object_name: S3 object name to copy to
+    :param dry_run: if True, do not actually perform the action.
+    :param client: S3 client to use. If not specified then a new one is created
+    :param size: Size of the source object, if known
+    :param extra_args: Object metadata. If not specified then it is built from file_name and options
+    :return: The ETag of the new object (empty on dry runs), or None if the copy failed
+    """
+    client = client or create_client()
+    extra_opts = {
+        **(extra_args if extra_args is not None else build_extra_args(file_name, options)),
+        'MetadataDirective': 'REPLACE',
+    }
+    log.debug(f'\'s3://{bucket_name}/{source_name}\' -> \'s3://{bucket_name}/{object_name}\' extra_opts={extra_opts}')
+    if dry_run:
+        return ''
+    copy_source = {'Bucket': bucket_name, 'Key': source_name}
+    try:
+        if size is not None and size < MAX_COPY_OBJECT_SIZE:
+            response = client.copy_object(CopySource=copy_source, Bucket=bucket_name, Key=object_name, **extra_opts)
+            return response['CopyObjectResult']['ETag'].strip('"')
+        # The managed copy switches to a multipart copy for large objects.
+        client.copy(copy_source, bucket_name, object_name, ExtraArgs=extra_opts)
+        response = client.head_object(Bucket=bucket_name, Key=object_name)
+        return response['ETag'].strip('"')
+    except ClientError as e:
+        logging.error(e)
+        return None
+
+
+def is_unchanged(file_mapping: types.FileMapping) -> bool:
+    """Tell whether a local file has the same contents as its object in the live version."""
+    base_object = file_mapping.base_object
+    digest = file_mapping.digest
+    if base_object is None or digest is None:
         return False
+    # Objects created by a (single part) copy have the MD5 of the whole file as their ETag.
+    return base_object.etag in (digest.etag, digest.md5)
+
+
+def task_upload_file(context: UploadContext, file_mapping: types.FileMapping) -> Optional[types.ManifestEntry]:
+    local_path = os.path.join(context.root_dir, file_mapping.local_path)
+    relative_path = file_mapping.local_path.replace(os.sep, '/')
+    # The metadata is derived from the original file name, but the data may come from another file.
+    extra_args = context.metadata.lookup(relative_path, file_mapping.content_encoding)
+    source_path = file_mapping.source_path or local_path
+    if is_unchanged(file_mapping):
+        slots = context.budget.acquire(1)
+        started_at = time.monotonic()
+        try:
+            source_name = file_mapping.base_object.key
+            etag = copy_file(local_path, context.bucket_name, source_name, file_mapping.remote_path, context.options,
+                             dry_run=context.dry_run, client=context.client,
+                             size=file_mapping.base_object.size, extra_args=extra_args)
+        finally:
+            context.budget.release(slots)
+        # Only the transfer is measured, not the time spent waiting for a slot.
+        metrics.observe('copy_seconds', time.monotonic() - started_at)
+        if etag is not None:
+            metrics.count('files_copied')
+            metrics.count('bytes_copied', file_mapping.size or 0)
+    else:
+        settings, transfer_config = context.policy.lookup(relative_path)
+        part_size = context.policy.part_size(settings, file_mapping.size or 0)
+        is_multipart = part_size > 0
+        # A multipart upload uses one slot per part thread, so the total number of
+        # requests in flight never exceeds the configured concurrency.
+        slots = context.budget.acquire(settings.max_concurrency if is_multipart else 1)
+        # The budget caps the slots to its total, which may be lower than the part threads.
+        transfer_config = context.policy.limit(settings, transfer_config, slots)
+        started_at = time.monotonic()
+        try:
+            etag = upload_file(source_path, context.bucket_name, file_mapping.remote_path, context.options,
+                               dry_run=context.dry_run, client=context.client,
+                               transfer_config=transfer_config, bandwidth=context.bandwidth, extra_args=extra_args,
+                               part_size=part_size, responses=context.responses)
+        finally:
+            context.budget.release(slots)
+        metrics.observe('upload_seconds', time.monotonic() - started_at)
+        if etag is not None:
+            metrics.count('files_uploaded')
+            metrics.count('bytes_uploaded', file_mapping.size or 0)
+    if etag is None:
+        metrics.count('files_failed')
+        return None
+    return types.ManifestEntry(
+        path=relative_path,
+        size=file_mapping.size,
+        etag=etag,
+        content_type=extra_args.get('ContentType'),
+        content_encoding=file_mapping.content_encoding,
+    )
+
+
+def largest_first(file_mappings: Iterable[types.FileMapping], window_size: int) -> Iterator[types.FileMapping]:
+    """Reorder a stream of FileMapping's so the largest of the next `window_size` ones comes first."""
+    window = []
+    for sequence, file_mapping in enumerate(file_mappings):
+        # The sequence number keeps the order stable and avoids comparing FileMapping's.
+        heapq.heappush(window, (-(file_mapping.size or 0), sequence, file_mapping))
+        if len(window) >= window_size:
+            yield heapq.heappop(window)[2]
+    while window:
+        yield heapq.heappop(window)[2]
+
+
+def upload_files(root_dir: str, bucket_name: str, file_mappings: Iterable[types.FileMapping], options: types.UploadOptions, dry_run: bool = False,
+                 manifest_writer: Optional[manifest.ManifestWriter] = None,
+                 upload_journal: Optional[journal.UploadJournal] = None) -> bool:
+    """Upload files to an S3 bucket using a pool of threads sharing a single client.
+
+    `file_mappings` is consumed lazily, so it may be a generator still discovering
+    files. Among the next `SORT_WINDOW_SIZE` files, the largest are started first,
+    so the long transfers overlap with the small files that follow them. At most
+    twice as many tasks as the concurrency are queued at any time, so memory usage
+    does not grow with the number of files.
+
+    With `options.adaptive_concurrency`, the concurrency starts at `options.concurrency`
+    and is adjusted while the files are uploaded, see `throttle.AdaptiveLimiter`.
+
+    :param manifest_writer: If specified, receives an entry for each uploaded file.
+    :param upload_journal: If specified, records each uploaded file, so the upload can be resumed if it is interrupted.
+    :return: True if all files were uploaded, else False
+    """
+    num_concurrent_tasks = options.concurrency
+    budget = throttle.ConcurrencyBudget(num_concurrent_tasks)
+    limiter = None
+    if options.adaptive_concurrency:
+        # There is a thread for each slot the limiter may grow to, waiting for the budget.
+        num_concurrent_tasks = max(options.max_concurrency or options.concurrency * 4, options.concurrency)
+        limiter = throttle.AdaptiveLimiter(budget, maximum=num_concurrent_tasks)
+        logging.info(f'Will use between 1 and {num_concurrent_tasks} concurrent tasks, starting with {options.concurrency}')
+    else:
+        logging.info(f'Will use {num_concurrent_tasks} concurrent tasks')
+    max_pending_tasks = num_concurrent_tasks * 2
+    client = create_client(max_pool_connections=num_concurrent_tasks,
+                           max_attempts=ADAPTIVE_MAX_ATTEMPTS if limiter else 3)
+    if limiter or options.max_request_rate:
+        request_rate = throttle.TokenBucket(options.max_request_rate) if options.max_request_rate else None
+        RequestObserver(limiter, request_rate).register(client)
+    responses = TransferResponses()
+    responses.register(client)
+    context = UploadContext(
+        client=client,
+        root_dir=root_dir,
+        bucket_name=bucket_name,
+        options=options,
+        policy=TransferPolicy(options),
+        metadata=MetadataPolicy(options),
+        budget=budget,
+        responses=responses,
+        bandwidth=throttle.TokenBucket(options.max_bandwidth) if options.max_bandwidth else None,
+        dry_run=dry_run,
+    )
+
+    num_tasks = 0
+    num_small_files = 0
+    num_bytes = 0
+    failed_paths = []
+    pending = {}
+
+    def collect(finished) -> None:
+        for future in finished:
+            file_mapping = pending.pop(future)
+            try:
+                entry = future.result()
+            except Exception as e:
+                logging.error(f'Failed to upload \'{file_mapping.local_path}\': {e}')
+                entry = None
+            if entry is None:
+                failed_paths.append(file_mapping.local_path)
+                continue
+            if manifest_writer is not None:
+                manifest_writer.add(entry)
+            if upload_journal is not None:
+                upload_journal.record(file_mapping.local_stat, entry)
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=num_concurrent_tasks) as executor:
+        for file_mapping in largest_first(file_mappings, SORT_WINDOW_SIZE):
+            if len(pending) >= max_pending_tasks:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            future = executor.submit(task_upload_file, context, file_mapping)
+            pending[future] = file_mapping
+            num_tasks += 1
+            num_bytes += file_mapping.size or 0
+            if (file_mapping.size or 0) < options.small_file_threshold:
+                num_small_files += 1
+        logging.info(f'Waiting for the remaining {len(pending)} of {num_tasks} tasks to finish')
+        finished, _ = wait(pending)
+        collect(finished)
+    elapsed = time.monotonic() - started_at
+
+    success = len(failed_paths) == 0
+    if not success:
+        logging.error(f'Failed to upload {len(failed_paths)} files: {failed_paths}')
+    logging.info(f'All {num_tasks} tasks have finished in {elapsed:.2f}s, final result is {"success" if success else "failure"}')
+    if elapsed > 0:
+        logging.info(f'Transferred {num_tasks} files ({num_small_files} small) and {num_bytes} bytes:'
+                     f' {num_tasks / elapsed:.1f} files/s, {num_bytes / elapsed / 1024 / 1024:.2f} MiB/s')
+        metrics.gauge('transfer_files_per_second', num_tasks / elapsed)
+        metrics.gauge('transfer_bytes_per_second', num_bytes / elapsed)
+    if limiter:
+        logging.info(f'Adaptive {limiter.summary()}')
+    return success
+
+
+def _to_remote_object(item: Dict[str, Any]) -> types.RemoteObject:
+    return types.RemoteObject(key=item['Key'], size=item['Size'], etag=item['ETag'].strip('"'))
+
+
+def _find_list_shards(client, bucket_name: str, prefix: str, num_shards: int,
+                      output: Callable[[types.RemoteObject], None]) -> List[str]:
+    """Split a prefix into sub-prefixes (shards) that can be listed independently.
+
+    The prefix is listed with a '/' delimiter, and so on for the sub-prefixes
+    found, level by level, until there are at least `num_shards` of them or
+    `MAX_LIST_SHARD_DEPTH` levels were explored. The objects found along the way
+    are passed to `output`, since they belong to no shard.
+    """
+    shards = [prefix]
+    for _ in range(MAX_LIST_SHARD_DEPTH):
+        if len(shards) >= num_shards:
+            break
+        next_shards = []
+        for shard in shards:
+            paginator = client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=shard, Delimiter='/'):
+                for item in page.get('Contents', []):
+                    output(_to_remote_object(item))
+                next_shards.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []))
+        shards = next_shards
+        if not shards:
+            break
+    return shards
+
+
+def list_objects(bucket_name: str, prefix: str, concurrency: int = DEFAULT_LIST_CONCURRENCY) -> Iterator[types.RemoteObject]:
+    """Stream all objects under a prefix.
+
+    With a concurrency above 1, the prefix is split into shards by '/'
+    delimited sub-prefixes, which are paged through concurrently. Objects are
+    yielded as pages arrive, in no particular order.
+
+    :param bucket_name: Bucket to list.
+    :param prefix: Prefix to list. An empty prefix lists the whole bucket.
+    :param concurrency: Maximum number of shards listed at the same time.
+    :return: An iterator over the RemoteObject's.
+    """
+    started_at = time.monotonic()
+    num_objects = 0
+    client = create_client(max_pool_connections=max(concurrency, 1))
+    if concurrency <= 1:
+        paginator = client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for item in page.get('Contents', []):
+                num_objects += 1
+                yield _to_remote_object(item)
+        num_shards = 1
+    else:
+        # Bounded, so listing threads wait for a slow consumer instead of buffering everything.
+        results = queue.Queue(maxsize=concurrency * 1000)
+        stop = threading.Event()
+
+        def output(item) -> None:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def list_shard(shard: str) -> None:
+            try:
+                paginator = client.get_paginator('list_objects_v2')
+                for page in paginator.paginate(Bucket=bucket_name, Prefix=shard):
+                    for item in page.get('Contents', []):
+                        output(_to_remote_object(item))
+                    if stop.is_set():
+                        return
+            except Exception as e:
+                output(e)
+
+        def list_all() -> None:
+            try:
+                shards = _find_list_shards(client, bucket_name, prefix, concurrency, output)
+                log.debug(f'Listing \'s3://{bucket_name}/{prefix}\' in {len(shards)} shards')
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    for shard in shards:
+                        executor.submit(list_shard, shard)
+                output(len(shards))
+            except Exception as e:
+                output(e)
+
+        producer = threading.Thread(target=list_all, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = results.get()
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, int):
+                    num_shards = item
+                    break
+                num_objects += 1
+                yield item
+        finally:
+            stop.set()
+    elapsed = time.monotonic() - started_at
+    logging.info(f'Listed {num_objects} objects in \'s3://{bucket_name}/{prefix}\' using {num_shards} shards'
+                 f' in {elapsed:.2f}s ({num_objects / elapsed if elapsed > 0 else 0:.0f} keys/s)')
+
+
+def index_objects(bucket_name: str, prefix: str) -> Dict[str, types.RemoteObject]:
+    """Index all objects under a prefix by their path relative to that prefix.
+
+    :param bucket_name: Bucket to list.
+    :param prefix: Prefix (directory) to list. An empty prefix lists the whole bucket.
+    :return: A dict mapping relative paths (using '/' as separator) to RemoteObject's.
+    """
+    if prefix and not prefix.endswith('/'):
+        prefix = prefix + '/'
+    result = {}
+    try:
+        for remote_object in list_objects(bucket_name, prefix):
+            relative_path = remote_object.key[len(prefix):]
+            if relative_path == manifest.MANIFEST_NAME:
+                continue
+            result[relative_path] = remote_object
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return {}
+    log.debug(f'Indexed {len(result)} objects in \'s3://{bucket_name}/{prefix}\'')
+    return result
+
+
+def diff_objects(bucket_name: str, prefix: str,
+                 expected: Dict[str, types.ManifestEntry]) -> Optional[Tuple[List[str], List[str], List[str]]]:
+    """Compare the objects under a prefix with the ones expected to be there, by size and ETag.
+
+    The prefix is listed in concurrent shards (see `list_objects`), and each
+    object is checked as soon as it is listed, so this takes about as long as
+    the listing itself. The manifest is ignored.
+
+    :param expected: The expected objects, indexed by their path relative to the prefix. Emptied in the process.
+    :return: The relative paths of the missing, different and unexpected objects, or None if the prefix could not be listed.
+    """
+    if prefix and not prefix.endswith('/'):
+        prefix = prefix + '/'
+    different = []
+    unexpected = []
+    try:
+        for remote_object in list_objects(bucket_name, prefix):
+            relative_path = remote_object.key[len(prefix):]
+            entry = expected.pop(relative_path, None)
+            if entry is None:
+                if relative_path != manifest.MANIFEST_NAME:
+                    unexpected.append(relative_path)
+            elif remote_object.etag != entry.etag or remote_object.size != entry.size:
+                log.debug(f'{relative_path}: expected size={entry.size} etag={entry.etag},'
+                          f' found size={remote_object.size} etag={remote_object.etag}')
+                different.append(relative_path)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return sorted(expected), different, unexpected
+
+
+def manifest_key(prefix: str) -> str:
+    """Get the key of the manifest of a version, stored next to it rather than in it, so the CDNs never serve it.
+
+    e.g. 'site/.static-deployer/v2.jsonl.gz' for the prefix 'site/v2'.
+    """
+    parent, _, name = prefix.strip('/').rpartition('/')
+    object_name = f'{manifest.MANIFEST_DIR}/{name}{manifest.MANIFEST_EXTENSION}'
+    return f'{parent}/{object_name}' if parent else object_name
+
+
+def legacy_manifest_key(prefix: str) -> str:
+    """Get the key older releases stored the manifest of a version at, inside its prefix."""
+    return f'{prefix.rstrip("/")}/{manifest.MANIFEST_NAME}' if prefix else manifest.MANIFEST_NAME
+
+
+def upload_manifest(bucket_name: str, prefix: str, manifest_writer: manifest.ManifestWriter, dry_run: bool = False) -> bool:
+    """Upload the manifest of a version, listing all the files it contains."""
+    object_name = manifest_key(prefix)
+    fileobj = manifest_writer.close()
+    logging.info(f'Uploading manifest with {manifest_writer.count} entries to \'s3://{bucket_name}/{object_name}\'')
+    if dry_run:
+        return True
+    try:
+        client = boto3.client("s3")
+        client.put_object(Bucket=bucket_name, Key=object_name, Body=fileobj,
+                          ContentType='application/x-ndjson', ContentEncoding='gzip')
     except ClientError as e:
         logging.error(e)
         return False
+    finally:
+        fileobj.close()
     return True
 
 
-def task_upload_file(root_dir: str, bucket_name: str, file_mapping: types.FileMapping, options: types.UploadOptions, dry_run: bool = False) -> bool:
-    local_path = os.path.join(root_dir, file_mapping.local_path)
-    return upload_file(local_path, bucket_name, file_mapping.remote_path, options, dry_run=dry_run)
+def iter_manifest(bucket_name: str, prefix: str) -> Optional[Iterator[types.ManifestEntry]]:
+    """Stream the entries of the manifest of a version.
+
+    :return: An iterator over the entries, or None if the version has no manifest.
+    """
+    client = boto3.client("s3")
+    for object_name in (manifest_key(prefix), legacy_manifest_key(prefix)):
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'AccessDenied'):
+                log.debug(f'No manifest found at \'s3://{bucket_name}/{object_name}\': {e}')
+                continue
+            logging.error(e)
+            return None
+        return manifest.read_manifest(response['Body'])
+    return None
 
 
-def upload_files(root_dir: str, bucket_name: str, file_mappings: List[types.FileMapping], options: types.UploadOptions, dry_run: bool = False) -> bool:
-    num_concurrent_tasks = multiprocessing.cpu_count() * 2
-    logging.info(f'Will use {num_concurrent_tasks} concurrent tasks')
-    pool = multiprocessing.Pool(processes=num_concurrent_tasks)
+def index_manifest(bucket_name: str, prefix: str) -> Optional[Dict[str, types.RemoteObject]]:
+    """Index the objects of a version from its manifest, by their path relative to the prefix.
 
-    all_results = [ pool.apply_async(task_upload_file, (root_dir, bucket_name, mapping, options, dry_run,)) for mapping in file_mappings ]
-    logging.info(f'Waiting for {len(all_results)} tasks to finish')
-    # Wait for all tasks to complete
-    [result.wait() for result in all_results]
-    # Return True if all elements of the iterable are true (or if the iterable is empty).
-    success = all(all_results)
-    logging.info(f'All {len(all_results)} tasks have finished, final result is {"success" if success else "failure"}')
-    return success
+    :return: The same as `index_objects`, or None if the version has no (valid) manifest.
+    """
+    entries = iter_manifest(bucket_name, prefix)
+    if entries is None:
+        return None
+    prefix = prefix.rstrip('/') + '/' if prefix else ''
+    try:
+        return {
+            entry.path: types.RemoteObject(key=prefix + entry.path, size=entry.size, etag=entry.etag)
+            for entry in entries
+        }
+    except (OSError, ValueError, KeyError, BotoCoreError) as e:
+        logging.warning(f'Ignoring invalid manifest in \'s3://{bucket_name}/{prefix}\': {e}')
+        return None
 
 
 def file_exists(bucket_name: str, path: str) -> bool:
@@ -117,3 +1064,162 @@ def directory_exists(bucket_name: str, path: str) -> bool:
     if not path.endswith('/'):
         path = path + '/'
     return file_exists(bucket_name=bucket_name, path=path)
+
+
+def list_versions(bucket_name: str, parent_prefix: str) -> Optional[List[str]]:
+    """List the versions stored under a prefix, i.e. its '/' delimited sub-prefixes.
+
+    :param parent_prefix: The part of the bucket prefix that comes before the version.
+    :return: The names of the versions, or None if they could not be listed.
+    """
+    result = []
+    try:
+        client = boto3.client('s3')
+        paginator = client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=parent_prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                name = common_prefix['Prefix'][len(parent_prefix):].rstrip('/')
+                # The manifests of the versions are stored next to them, see `manifest_key`.
+                if name != manifest.MANIFEST_DIR:
+                    result.append(name)
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+    return result
+
+
+def get_version_timestamp(bucket_name: str, prefix: str, client=None) -> Optional[float]:
+    """Tell when a version was deployed, from the last modification time of its manifest.
+
+    Versions deployed before manifests existed (or whose deploy did not complete) use
+    the time of their first object instead.
+
+    :return: A POSIX timestamp, or None if the version holds no object.
+    :raise ClientError: If the bucket could not be read.
+    """
+    client = client or boto3.client('s3')
+    for object_name in (manifest_key(prefix), legacy_manifest_key(prefix)):
+        try:
+            response = client.head_object(Bucket=bucket_name, Key=object_name)
+            return response['LastModified'].timestamp()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+                raise
+    prefix = prefix.rstrip('/') + '/' if prefix else ''
+    response = client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=1)
+    contents = response.get('Contents', [])
+    return contents[0]['LastModified'].timestamp() if contents else None
+
+
+def get_version_timestamps(bucket_name: str, prefixes: List[str], concurrency: int = 8) -> Optional[Dict[str, Optional[float]]]:
+    """Get the timestamps of many versions at the same time, see `get_version_timestamp`.
+
+    :return: A dict mapping each prefix to its timestamp, or None if any of them could not be read.
+    """
+    client = create_client(max_pool_connections=concurrency)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            timestamps = executor.map(lambda prefix: get_version_timestamp(bucket_name, prefix, client), prefixes)
+            return dict(zip(prefixes, timestamps))
+    except (ClientError, BotoCoreError) as e:
+        logging.error(e)
+        return None
+
+
+def iter_version_keys(bucket_name: str, prefixes: Iterable[str]) -> Iterator[str]:
+    """Stream the keys of all the objects of some versions.
+
+    The manifests of each version come first (deleting a missing key is not an error),
+    so a version being deleted is no longer complete.
+    """
+    for prefix in prefixes:
+        version_manifest_keys = (manifest_key(prefix), legacy_manifest_key(prefix))
+        yield from version_manifest_keys
+        for remote_object in list_objects(bucket_name, prefix.rstrip('/') + '/'):
+            if remote_object.key not in version_manifest_keys:
+                yield remote_object.key
+
+
+def task_delete_batch(client, bucket_name: str, keys: List[str], rate: Optional[throttle.TokenBucket],
+                      dry_run: bool) -> List[str]:
+    """Delete up to MAX_DELETE_BATCH_SIZE objects with a single request.
+
+    :return: The keys that could not be deleted.
+    """
+    if dry_run:
+        return []
+    if rate is not None:
+        rate.consume(len(keys))
+    try:
+        # In quiet mode, the response only lists the keys that could not be deleted.
+        response = client.delete_objects(Bucket=bucket_name, Delete={
+            'Objects': [{'Key': key} for key in keys],
+            'Quiet': True,
+        })
+    except ClientError as e:
+        logging.error(e)
+        return keys
+    errors = response.get('Errors', [])
+    for error in errors[:10]:
+        logging.error(f'Could not delete \'s3://{bucket_name}/{error.get("Key")}\': {error.get("Code")} {error.get("Message")}')
+    return [error.get('Key') for error in errors]
+
+
+def delete_objects(bucket_name: str, keys: Iterable[str], concurrency: int = 8, max_rate: Optional[int] = None,
+                   dry_run: bool = False) -> bool:
+    """Delete a stream of objects, with DeleteObjects requests of up to 1000 keys sent concurrently.
+
+    `keys` is consumed lazily, so it may come from a listing still in progress. At
+    most `2 * concurrency` batches are held at any time, so memory usage does not
+    depend on the number of objects.
+
+    :param max_rate: Maximum number of objects deleted per second, shared by all the requests.
+    :return: True if all the objects were deleted, else False
+    """
+    client = create_client(max_pool_connections=concurrency)
+    rate = throttle.TokenBucket(max_rate) if max_rate else None
+    max_pending_batches = concurrency * 2
+    pending = {}
+    num_deleted = 0
+    num_failed = 0
+    success = True
+
+    def collect(finished) -> None:
+        nonlocal num_deleted, num_failed
+        for future in finished:
+            batch_size = pending.pop(future)
+            try:
+                num_batch_failed = len(future.result())
+            except Exception as e:
+                logging.error(f'Failed to delete {batch_size} objects: {e}')
+                num_batch_failed = batch_size
+            num_deleted += batch_size - num_batch_failed
+            num_failed += num_batch_failed
+            metrics.count('objects_deleted', batch_size - num_batch_failed)
+
+    def submit(batch: List[str]) -> None:
+        if len(pending) >= max_pending_batches:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+        pending[executor.submit(task_delete_batch, client, bucket_name, batch, rate, dry_run)] = len(batch)
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batch = []
+        try:
+            for key in keys:
+                batch.append(key)
+                if len(batch) >= MAX_DELETE_BATCH_SIZE:
+                    submit(batch)
+                    batch = []
+            if batch:
+                submit(batch)
+        except (ClientError, BotoCoreError) as e:
+            logging.error(f'Failed to list the objects to delete: {e}')
+            success = False
+        finished, _ = wait(pending)
+        collect(finished)
+    elapsed = time.monotonic() - started_at
+    logging.info(f'{"Would delete" if dry_run else "Deleted"} {num_deleted} objects from \'s3://{bucket_name}\''
+                 f' in {elapsed:.2f}s ({num_deleted / elapsed if elapsed else 0:.0f} objects/s), {num_failed} failed')
+    return success and num_failed == 0
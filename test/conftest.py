@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# The package and cli.py are imported from the source tree, and the S3/CloudFront stand-in from bench/.
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bench'))
+
+
+@pytest.fixture
+def fake_aws():
+    """Answer the requests of the boto3 clients created during the test from memory (see bench/fake_aws.py)."""
+    import boto3
+    import fake_aws
+    from static_deployer.providers.cdn import cloudfront
+    boto3.DEFAULT_SESSION = None
+    cloudfront.reset_config_cache()
+    backend = fake_aws.FakeAws()
+    backend.install()
+    yield backend
+    boto3.DEFAULT_SESSION = None
+
+
+class Site(object):
+    """Files to deploy, as versions of a bucket served by a distribution of the stand-in."""
+    bucket_name = 'bucket'
+    distribution_id = 'ETEST'
+    origin_name = 'website'
+
+    def __init__(self, root_dir: str, cache_dir: str):
+        self.root_dir = root_dir
+        self.cache_dir = cache_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def write(self, files) -> None:
+        """:param files: Content of each file, by path relative to the root directory."""
+        for path, content in files.items():
+            file_name = os.path.join(self.root_dir, path)
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            with open(file_name, 'wb') as f:
+                f.write(content)
+
+    def spec(self, version: str):
+        from static_deployer.common import types
+        return types.DeploySpec(
+            content=types.ContentDetails(root_dir=self.root_dir, patterns='**', cache_dir=self.cache_dir),
+            storage=types.StorageDetails(name=self.bucket_name, prefix='site/{{version}}'),
+            cdns=[types.CdnDetails(distribution_id=self.distribution_id, origin_name=self.origin_name)],
+            version=version)
+
+    def rollback(self, version: str, wait: bool = True) -> bool:
+        import cli
+        from static_deployer.common import types
+        return cli.run_rollback(types.RollbackSpec(
+            storage=types.StorageDetails(name=self.bucket_name, prefix='site/{{version}}'),
+            cdns=[types.CdnDetails(distribution_id=self.distribution_id, origin_name=self.origin_name, wait=wait)],
+            version=version))
+
+    def deploy(self, version: str, options=None, resume: bool = False) -> bool:
+        import cli
+        from static_deployer.common import types
+        return cli.run_deploy(self.spec(version), options or types.UploadOptions(concurrency=4), resume=resume)
+
+    def live_version(self):
+        from static_deployer.providers.cdn import cloudfront
+        cloudfront.reset_config_cache()
+        return cloudfront.get_origin_path(self.distribution_id, self.origin_name)
+
+
+@pytest.fixture
+def site(fake_aws, tmp_path):
+    return Site(str(tmp_path / 'site'), str(tmp_path / 'cache'))
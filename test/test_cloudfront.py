@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+
+import cli
+from static_deployer.common import configuration, types
+from static_deployer.providers.cdn import cloudfront
+
+DISTRIBUTION_ID = 'ETEST'
+ORIGIN_NAME = 'website'
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(cloudfront, 'POLL_INITIAL_DELAY', 0.05)
+
+
+def config_options(distribution_id: str = DISTRIBUTION_ID):
+    config = configuration.ConfigOptions()
+    config.load_from_dict({})
+    config.cdn.distribution_id = distribution_id
+    return config
+
+
+class UnreachableClient(object):
+    """Stands for a CloudFront client whose requests fail before getting a response."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def get_distribution(self, **kwargs):
+        raise self.error
+
+    def get_invalidation(self, **kwargs):
+        raise self.error
+
+    def create_invalidation(self, **kwargs):
+        raise self.error
+
+    def get_distribution_config(self, **kwargs):
+        raise self.error
+
+
+def test_update_waits_for_the_deploy_then_the_invalidation(fake_aws, fast_polling):
+    fake_aws.deploy_seconds = 0.2
+    fake_aws.invalidation_seconds = 0.2
+    assert cloudfront.update(DISTRIBUTION_ID, ORIGIN_NAME, 'v2', paths_to_invalidate=['/index.html'])
+    assert cloudfront.get_distribution_status(DISTRIBUTION_ID) == 'Deployed'
+    # The status was InProgress at first, so it was polled again.
+    assert fake_aws.requests['GetDistribution'] >= 2
+    assert fake_aws.requests['GetInvalidation'] >= 2
+    assert cloudfront.list_pending_invalidations(DISTRIBUTION_ID) == []
+
+
+def test_wait_polls_until_deployed_and_invalidated(fake_aws, fast_polling):
+    fake_aws.deploy_seconds = 0.2
+    fake_aws.invalidation_seconds = 0.3
+    assert cloudfront.update(DISTRIBUTION_ID, ORIGIN_NAME, 'v2', wait=False)
+    assert cloudfront.get_distribution_status(DISTRIBUTION_ID) == 'InProgress'
+    assert len(cloudfront.list_pending_invalidations(DISTRIBUTION_ID)) == 1
+    assert cli.wait(config_options())
+    assert cloudfront.get_distribution_status(DISTRIBUTION_ID) == 'Deployed'
+    assert cloudfront.list_pending_invalidations(DISTRIBUTION_ID) == []
+
+
+def test_status_shows_the_origins_and_pending_invalidations(fake_aws, capsys):
+    fake_aws.invalidation_seconds = 60
+    assert cloudfront.update(DISTRIBUTION_ID, ORIGIN_NAME, 'site/v2', wait=False)
+    assert cli.status(config_options())
+    output = capsys.readouterr().out
+    assert 'Status: Deployed' in output
+    assert f'Origin {ORIGIN_NAME}: site/v2' in output
+    assert 'Invalidations in progress: none' not in output
+
+
+@pytest.mark.parametrize('error', [
+    EndpointConnectionError(endpoint_url='https://cloudfront.amazonaws.com'),
+    ReadTimeoutError(endpoint_url='https://cloudfront.amazonaws.com'),
+])
+def test_connection_errors_fail_the_wait_instead_of_raising(error):
+    client = UnreachableClient(error)
+    assert cloudfront.get_distribution_status(DISTRIBUTION_ID, client=client) is None
+    assert cloudfront.get_invalidation_status(DISTRIBUTION_ID, 'I1', client=client) is None
+    assert cloudfront.submit_invalidation(DISTRIBUTION_ID, ['/*'], client=client) is None
+    assert not asyncio.run(cloudfront.wait_deployed(DISTRIBUTION_ID, client=client))
+    assert not asyncio.run(cloudfront.wait_invalidations(DISTRIBUTION_ID, ['I1'], client=client))
+
+
+def test_connection_errors_fail_the_distribution_update(fake_aws):
+    cloudfront.reset_config_cache()
+    client = UnreachableClient(EndpointConnectionError(endpoint_url='https://cloudfront.amazonaws.com'))
+    assert not cloudfront.submit_distribution_update(DISTRIBUTION_ID, ORIGIN_NAME, 'v2', client=client)
@@ -0,0 +1,32 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import gzip
+
+from static_deployer.common import compression, types
+
+
+def test_gzip_output_only_depends_on_input():
+    data = b'body { color: red; }\n' * 100
+    compressed = compression._compress(data, 'gzip', 9)
+    assert gzip.decompress(compressed) == data
+    assert compression._compress(data, 'gzip', 9) == compressed
+
+
+def test_compress_file_reuses_cached_output(tmp_path):
+    source = tmp_path / 'style.css'
+    source.write_bytes(b'body { color: red; }\n' * 100)
+    cache_dir = str(tmp_path / 'cache')
+    output_path, size = compression.compress_file(str(source), cache_dir, 'gzip', 9, 0.9)
+    assert output_path is not None and size < source.stat().st_size
+    assert compression.compress_file(str(source), cache_dir, 'gzip', 9, 0.9) == (output_path, size)
+
+
+def test_worker_failures_upload_the_file_as_is(tmp_path):
+    compressor = compression.Compressor(str(tmp_path), types.CompressionSettings(), str(tmp_path))
+    for error in (BrokenProcessPool('worker died'), ValueError('brotli error'), OSError('disk full')):
+        file_mapping = types.FileMapping(local_path='app.js', remote_path='v1/app.js', size=4096)
+        future = Future()
+        future.set_exception(error)
+        result = compressor._finish(file_mapping, future)
+        assert result.source_path is None and result.content_encoding is None and result.size == 4096
+    assert compressor.num_compressed == 0
@@ -0,0 +1,105 @@
+import base64
+import hashlib
+import os
+
+import pytest
+from boto3.s3.transfer import TransferConfig
+
+from static_deployer.common import types
+from static_deployer.providers.storage import s3bucket
+
+BUCKET_NAME = 'bucket'
+MIB = 1024 * 1024
+PART_SIZE = 5 * MIB
+
+
+def multipart_etag(data: bytes, part_size: int) -> str:
+    parts = [data[offset:offset + part_size] for offset in range(0, len(data), part_size)]
+    return f'{hashlib.md5(b"".join(hashlib.md5(part).digest() for part in parts)).hexdigest()}-{len(parts)}'
+
+
+def feed(builder: s3bucket.DigestBuilder, data: bytes, chunk_size: int) -> None:
+    for offset in range(0, len(data), chunk_size):
+        builder.update(data[offset:offset + chunk_size])
+
+
+def test_single_part_etag_is_the_md5():
+    data = os.urandom(100000)
+    builder = s3bucket.DigestBuilder()
+    feed(builder, data, 4096)
+    md5 = hashlib.md5(data)
+    assert builder.finish() == types.FileDigest(md5=md5.hexdigest(), etag=md5.hexdigest())
+    assert builder.checksum_args() == {'ContentMD5': base64.b64encode(md5.digest()).decode('ascii')}
+
+
+def test_multipart_etag_with_short_last_part():
+    data = os.urandom(1000)
+    builder = s3bucket.DigestBuilder(part_size=300)
+    # Chunks straddle the part boundaries.
+    feed(builder, data, 7)
+    assert builder.etag() == multipart_etag(data, 300) and builder.etag().endswith('-4')
+    assert builder.finish().md5 == hashlib.md5(data).hexdigest()
+
+
+def test_multipart_etag_without_empty_last_part():
+    data = os.urandom(900)
+    builder = s3bucket.DigestBuilder(part_size=300, whole_md5=False)
+    feed(builder, data, 300)
+    assert builder.etag() == multipart_etag(data, 300) and builder.etag().endswith('-3')
+
+
+def test_whole_file_digests_need_the_whole_md5():
+    builder = s3bucket.DigestBuilder(part_size=300, whole_md5=False)
+    builder.update(b'x' * 1000)
+    with pytest.raises(ValueError):
+        builder.finish()
+    with pytest.raises(ValueError):
+        builder.checksum_args()
+
+
+def test_md5_etag_depends_on_encryption():
+    assert s3bucket.has_md5_etag({})
+    assert s3bucket.has_md5_etag({'ServerSideEncryption': 'AES256'})
+    assert not s3bucket.has_md5_etag({'ServerSideEncryption': 'aws:kms'})
+    assert not s3bucket.has_md5_etag({'ServerSideEncryption': 'aws:kms:dsse'})
+    assert not s3bucket.has_md5_etag({'SSECustomerAlgorithm': 'AES256'})
+
+
+def upload(tmp_path, size: int):
+    file_name = tmp_path / 'large.bin'
+    file_name.write_bytes(os.urandom(size))
+    options = types.UploadOptions()
+    config = TransferConfig(multipart_threshold=PART_SIZE, multipart_chunksize=PART_SIZE, max_concurrency=1,
+                            use_threads=False)
+    return s3bucket.upload_file(str(file_name), BUCKET_NAME, 'large.bin', options, transfer_config=config,
+                                part_size=PART_SIZE)
+
+
+def rewrite_multipart_etags(backend, monkeypatch, headers):
+    """Make the stand-in answer multipart uploads with an ETag that is not derived from the MD5s of the parts."""
+    complete = backend._s3_CompleteMultipartUpload
+
+    def complete_with_other_etag(bucket_name, key, query, request_headers, body):
+        response = complete(bucket_name, key, query, request_headers, body)
+        obj = backend._objects[(bucket_name, key)]
+        obj.etag = '0' * 32 + obj.etag[32:]
+        obj.headers.update(headers)
+        return response
+
+    monkeypatch.setattr(backend, '_s3_CompleteMultipartUpload', complete_with_other_etag)
+
+
+def test_multipart_upload_etag_is_verified(fake_aws, tmp_path):
+    etag = upload(tmp_path, 2 * PART_SIZE + MIB)
+    assert etag.endswith('-3')
+    assert etag == fake_aws._objects[(BUCKET_NAME, 'large.bin')].etag
+
+
+def test_multipart_upload_with_wrong_etag_fails(fake_aws, tmp_path, monkeypatch):
+    rewrite_multipart_etags(fake_aws, monkeypatch, {})
+    assert upload(tmp_path, 2 * PART_SIZE + MIB) is None
+
+
+def test_multipart_upload_etag_is_not_compared_with_kms(fake_aws, tmp_path, monkeypatch):
+    rewrite_multipart_etags(fake_aws, monkeypatch, {'x-amz-server-side-encryption': 'aws:kms'})
+    assert upload(tmp_path, 2 * PART_SIZE + MIB) == '0' * 32 + '-3'
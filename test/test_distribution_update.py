@@ -0,0 +1,42 @@
+import pytest
+
+from static_deployer.providers.cdn import cloudfront
+
+DISTRIBUTION_ID = 'ETEST'
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(cloudfront, 'UPDATE_RETRY_DELAY', 0.0)
+
+
+def test_conflicting_update_is_retried_on_a_fresh_config(fake_aws, monkeypatch, no_retry_delay):
+    fake_aws.origin_names = ['website', 'assets']
+    assert cloudfront.get_origin_paths(DISTRIBUTION_ID) == {'website': '', 'assets': ''}
+    stale_cache = cloudfront._config_cache
+    # Someone else changes another origin, so the cached config (and its ETag) is stale.
+    monkeypatch.setattr(cloudfront, '_config_cache', cloudfront.DistributionConfigCache())
+    assert cloudfront.submit_distribution_update(DISTRIBUTION_ID, 'assets', 'assets/v7')
+    monkeypatch.setattr(cloudfront, '_config_cache', stale_cache)
+    fake_aws.reset_counts()
+
+    assert cloudfront.submit_distribution_update(DISTRIBUTION_ID, 'website', 'v2')
+    assert fake_aws.reset_counts() == {'UpdateDistribution': 2, 'GetDistributionConfig': 1}
+    # The other change is kept, and the cache holds the config of the successful update.
+    assert cloudfront.get_origin_paths(DISTRIBUTION_ID) == {'website': 'v2', 'assets': 'assets/v7'}
+    assert fake_aws.reset_counts() == {}
+
+
+def test_update_gives_up_after_max_attempts(fake_aws, monkeypatch, no_retry_delay):
+    update_distribution = fake_aws._cloudfront_UpdateDistribution
+
+    def always_changed_by_someone_else(distribution, parts, headers, body):
+        distribution.version += 1
+        return update_distribution(distribution, parts, headers, body)
+
+    monkeypatch.setattr(fake_aws, '_cloudfront_UpdateDistribution', always_changed_by_someone_else)
+    assert not cloudfront.submit_distribution_update(DISTRIBUTION_ID, 'website', 'v2')
+    requests = fake_aws.reset_counts()
+    assert requests['UpdateDistribution'] == cloudfront.MAX_UPDATE_ATTEMPTS
+    assert requests['GetDistributionConfig'] == cloudfront.MAX_UPDATE_ATTEMPTS
+    assert cloudfront.get_origin_paths(DISTRIBUTION_ID) == {'website': ''}
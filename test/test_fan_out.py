@@ -0,0 +1,57 @@
+import cli
+from static_deployer.common import configuration, types
+from static_deployer.providers.cdn import cloudfront
+
+
+def config_options(distribution_id: str, origin_name: str):
+    config = configuration.ConfigOptions()
+    config.load_from_dict({})
+    config.cdn.distribution_id = distribution_id
+    config.cdn.origin_name = origin_name
+    return config
+
+
+def pairs(cdns):
+    return [(cdn.distribution_id, cdn.origin_name) for cdn in cdns]
+
+
+def test_single_origin_applies_to_all_distributions():
+    cdns = cli.build_cdn_targets(config_options('E1, E2,E3', 'website'))
+    assert pairs(cdns) == [('E1', 'website'), ('E2', 'website'), ('E3', 'website')]
+
+
+def test_one_origin_per_distribution():
+    cdns = cli.build_cdn_targets(config_options('E1,E2,E1', 'website,assets,assets'))
+    assert pairs(cdns) == [('E1', 'website'), ('E2', 'assets'), ('E1', 'assets')]
+
+
+def test_mismatched_counts_are_rejected():
+    assert cli.build_cdn_targets(config_options('E1,E2,E3', 'website,assets')) is None
+    assert cli.build_cdn_targets(config_options('E1', 'website,assets')) is None
+    assert cli.build_cdn_targets(config_options('', 'website')) is None
+
+
+def test_settings_apply_to_every_pair():
+    config = config_options('E1,E2', 'website')
+    config.cdn.wait = False
+    config.cdn.max_invalidation_paths = 100
+    cdns = cli.build_cdn_targets(config)
+    assert [(cdn.wait, cdn.invalidation_limits.max_paths) for cdn in cdns] == [(False, 100), (False, 100)]
+    # Each pair has its own limits.
+    assert cdns[0].invalidation_limits is not cdns[1].invalidation_limits
+
+
+def test_failing_distribution_does_not_mask_the_others(fake_aws):
+    fake_aws.origin_names = ['website', 'assets']
+    cdns = [
+        types.CdnDetails(distribution_id='E1', origin_name='website'),
+        types.CdnDetails(distribution_id='E1', origin_name='assets'),
+        types.CdnDetails(distribution_id='E2', origin_name='missing'),
+        types.CdnDetails(distribution_id='E3', origin_name='website'),
+    ]
+    assert not cloudfront.update_all(cdns, 'v2')
+    assert cloudfront.get_origin_paths('E1') == {'website': 'v2', 'assets': 'v2'}
+    assert cloudfront.get_origin_paths('E3') == {'website': 'v2', 'assets': ''}
+    assert cloudfront.get_origin_paths('E2') == {'website': '', 'assets': ''}
+    # The origins of a distribution are updated with a single request.
+    assert fake_aws.requests['UpdateDistribution'] == 2
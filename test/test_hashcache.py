@@ -0,0 +1,92 @@
+import os
+
+from static_deployer.common import hashcache, types
+
+DIGEST = types.FileDigest(md5='a' * 32, etag='b' * 32 + '-2')
+
+
+def make_file(tmp_path, name: str = 'index.html', content: bytes = b'hello'):
+    path = tmp_path / 'site' / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_hit_only_while_the_file_and_part_size_are_unchanged(tmp_path):
+    path = make_file(tmp_path)
+    cache = hashcache.HashCache(str(tmp_path / 'cache'), str(tmp_path / 'site'))
+    cache.put('index.html', os.stat(path), DIGEST, part_size=8)
+    assert cache.get('index.html', os.stat(path), part_size=8) == DIGEST
+    assert cache.get('index.html', os.stat(path), part_size=16) is None
+    assert cache.get('index.html', os.stat(path)) is None
+    assert cache.get('other.html', os.stat(path), part_size=8) is None
+
+    stat_result = os.stat(path)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1000))
+    assert cache.get('index.html', os.stat(path), part_size=8) is None
+
+    # Same modification time, different size.
+    path.write_bytes(b'hello, world')
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    assert cache.get('index.html', os.stat(path), part_size=8) is None
+
+
+def test_entries_survive_a_save_and_load(tmp_path):
+    path = make_file(tmp_path)
+    cache_dir, root_dir = str(tmp_path / 'cache'), str(tmp_path / 'site')
+    cache = hashcache.HashCache(cache_dir, root_dir)
+    cache.put('index.html', os.stat(path), DIGEST)
+    cache.save()
+
+    loaded = hashcache.HashCache(cache_dir, root_dir)
+    loaded.load()
+    assert loaded.get('index.html', os.stat(path)) == DIGEST
+
+
+def test_stale_entries_are_dropped_on_save(tmp_path):
+    path = make_file(tmp_path)
+    cache_dir, root_dir = str(tmp_path / 'cache'), str(tmp_path / 'site')
+    cache = hashcache.HashCache(cache_dir, root_dir, max_entry_age=60)
+    cache.put('index.html', os.stat(path), DIGEST)
+    cache._entries['index.html'][6] -= 61
+    cache.save()
+
+    loaded = hashcache.HashCache(cache_dir, root_dir)
+    loaded.load()
+    assert loaded.get('index.html', os.stat(path)) is None
+
+
+def test_cache_of_another_format_is_ignored(tmp_path):
+    path = make_file(tmp_path)
+    cache_dir, root_dir = str(tmp_path / 'cache'), str(tmp_path / 'site')
+    cache = hashcache.HashCache(cache_dir, root_dir)
+    cache.put('index.html', os.stat(path), DIGEST)
+    cache.save()
+    with open(cache.file_name) as f:
+        data = f.read()
+    with open(cache.file_name, 'w') as f:
+        f.write(data.replace(f'"version":{hashcache.CACHE_FORMAT_VERSION}', '"version":1'))
+
+    loaded = hashcache.HashCache(cache_dir, root_dir)
+    loaded.load()
+    assert loaded.get('index.html', os.stat(path)) is None
+
+
+def test_eviction_keeps_the_most_recently_used_cache_files(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    now = hashcache.HashCache(str(cache_dir), str(tmp_path))._now
+    for index in range(5):
+        old_file = cache_dir / f'hashes-old{index}.json'
+        old_file.write_text('{}')
+        os.utime(old_file, (now - 100 * (index + 1), now - 100 * (index + 1)))
+    expired_file = cache_dir / 'hashes-expired.json'
+    expired_file.write_text('{}')
+    os.utime(expired_file, (now - 10000, now - 10000))
+    (cache_dir / 'unrelated.txt').write_text('')
+
+    cache = hashcache.HashCache(str(cache_dir), str(tmp_path / 'site'), max_files=3, max_file_age=5000)
+    cache.save()
+    # The current file counts among the 3 most recent ones.
+    assert sorted(os.listdir(cache_dir)) == sorted([os.path.basename(cache.file_name), 'hashes-old0.json',
+                                                    'hashes-old1.json', 'unrelated.txt'])
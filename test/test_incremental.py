@@ -0,0 +1,32 @@
+from static_deployer.common import types
+
+INCREMENTAL = types.UploadOptions(concurrency=4, incremental=True)
+
+
+def test_unchanged_files_are_copied_from_the_live_version(site, fake_aws):
+    site.write({'unchanged.html': b'<p>same</p>', 'changed.html': b'<p>v1</p>'})
+    assert site.deploy('v1', INCREMENTAL)
+    site.write({'changed.html': b'<p>v2</p>'})
+    fake_aws.reset_counts()
+
+    assert site.deploy('v2', INCREMENTAL)
+    requests = fake_aws.reset_counts()
+    assert requests['CopyObject'] == 1
+    # The changed file, and the manifest.
+    assert requests['PutObject'] == 2
+    assert fake_aws._objects[('bucket', 'site/v2/unchanged.html')].data == b'<p>same</p>'
+    assert fake_aws._objects[('bucket', 'site/v2/changed.html')].data == b'<p>v2</p>'
+    assert site.live_version() == 'site/v2'
+
+
+def test_all_files_are_uploaded_without_incremental(site, fake_aws):
+    site.write({'unchanged.html': b'<p>same</p>', 'changed.html': b'<p>v1</p>'})
+    assert site.deploy('v1')
+    site.write({'changed.html': b'<p>v2</p>'})
+    fake_aws.reset_counts()
+
+    assert site.deploy('v2')
+    requests = fake_aws.reset_counts()
+    assert 'CopyObject' not in requests
+    assert requests['PutObject'] == 3
+
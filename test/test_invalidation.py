@@ -0,0 +1,113 @@
+import cli
+from static_deployer.common import invalidation, types
+
+DISTRIBUTION_ID = 'ETEST'
+ORIGIN_NAME = 'website'
+
+
+def plan(changed, all_paths, **limits):
+    return invalidation.plan_invalidation(set(changed), list(all_paths), types.InvalidationLimits(**limits))
+
+
+def files(directory: str, count: int):
+    return [f'{directory}/file{index}.js' for index in range(count)]
+
+
+def is_covered(path: str, paths) -> bool:
+    url_path = '/' + path
+    return url_path in paths or any(p.endswith('*') and url_path.startswith(p[:-1]) for p in paths)
+
+
+def check_plan(paths, changed, all_paths, max_paths: int, max_wildcards: int):
+    assert all(is_covered(path, paths) for path in changed)
+    # CloudFront limits the wildcard paths apart from the others.
+    assert sum(not path.endswith('*') for path in paths) <= max_paths
+    assert sum(path.endswith('*') for path in paths) <= max_wildcards
+    evicted = sum(1 for path in all_paths if path not in changed and is_covered(path, paths))
+    assert len(changed) + evicted < len(all_paths) / 2
+
+
+def test_nothing_changed():
+    assert plan([], files('assets', 10)) == []
+
+
+def test_index_documents_are_invalidated_with_their_directory():
+    all_paths = ['index.html', 'docs/index.html'] + files('assets', 10)
+    assert plan(['docs/index.html'], all_paths) == ['/docs/', '/docs/index.html']
+    assert plan(['index.html'], all_paths) == ['/', '/index.html']
+
+
+def test_paths_are_quoted():
+    all_paths = ['a b/c%d.html'] + files('assets', 10)
+    assert plan(['a b/c%d.html'], all_paths) == ['/a%20b/c%25d.html']
+
+
+def test_changed_directory_is_collapsed_into_a_wildcard():
+    changed = files('assets/fonts', 3)
+    all_paths = changed + files('assets', 20) + ['index.html']
+    assert plan(changed + ['index.html'], all_paths) == ['/', '/assets/fonts/*', '/index.html']
+
+
+def test_single_changed_file_is_not_collapsed():
+    all_paths = files('assets/fonts', 1) + files('assets', 20)
+    assert plan(['assets/fonts/file0.js'], all_paths) == ['/assets/fonts/file0.js']
+
+
+def test_collapses_directories_to_fit_max_paths():
+    all_paths = files('a', 10) + files('b', 10) + files('c', 10) + files('other', 100)
+    changed = files('a', 10)[:4] + files('b', 10)[:4] + files('c', 10)[:4]
+    paths = plan(changed, all_paths, max_paths=5)
+    # Two of the directories are collapsed, which leaves the 4 paths of the third one.
+    assert len(paths) == 6 and sum(path.endswith('*') for path in paths) == 2
+    check_plan(paths, changed, all_paths, max_paths=5, max_wildcards=15)
+
+
+def test_fits_max_wildcards():
+    directories = [f'dir{index}' for index in range(5)]
+    changed = [path for directory in directories for path in files(directory, 3)]
+    all_paths = changed + files('other', 100)
+    paths = plan(changed, all_paths, max_wildcards=2)
+    assert sum(path.endswith('*') for path in paths) == 2
+    check_plan(paths, changed, all_paths, max_paths=3000, max_wildcards=2)
+
+
+def test_collapses_a_common_parent_to_fit_both_limits():
+    directories = [f'a/x{index}' for index in range(5)]
+    changed = [path for directory in directories for path in files(directory, 4)[:2]]
+    all_paths = [path for directory in directories for path in files(directory, 4)] + files('b', 100)
+    paths = plan(changed, all_paths, max_paths=3, max_wildcards=1)
+    assert paths == ['/a/*']
+    check_plan(paths, changed, all_paths, max_paths=3, max_wildcards=1)
+
+
+def test_invalidates_everything_when_half_the_files_changed():
+    all_paths = files('assets', 10)
+    assert plan(all_paths[:5], all_paths) == ['/*']
+    assert plan(all_paths[:4], all_paths) == sorted('/' + path for path in all_paths[:4])
+
+
+def test_invalidates_everything_when_the_plan_evicts_half_the_files():
+    all_paths = files('a', 10) + files('b', 10)
+    # The 3 changed files only fit in a single path once `a` is collapsed, which evicts half of the files.
+    changed = files('a', 10)[:3]
+    assert plan(changed, all_paths, max_paths=1) == ['/*']
+    assert plan(changed, all_paths, max_paths=1, full_invalidation_ratio=0.9) == ['/a/*']
+
+
+def test_removed_files_are_invalidated():
+    base_objects = {
+        path: types.RemoteObject(key=f'v1/{path}', size=1, etag='e' * 32)
+        for path in ['index.html', 'old.html'] + files('assets', 10)
+    }
+    entries = [types.ManifestEntry(path=path, size=1, etag='e' * 32) for path in ['index.html'] + files('assets', 10)]
+    changed, all_paths = invalidation.diff_versions(base_objects, entries)
+    assert changed == {'old.html'}
+    assert plan(changed, all_paths) == ['/old.html']
+
+
+def test_invalidates_everything_when_the_live_version_is_unknown():
+    cdns = [types.CdnDetails(distribution_id=DISTRIBUTION_ID, origin_name=ORIGIN_NAME)]
+    entries = [types.ManifestEntry(path='index.html', size=1, etag='e' * 32)]
+    # Plans are missing for CDNs which must invalidate everything.
+    assert cli.plan_invalidations(cdns, {}, {}, lambda: entries) == {}
+    assert cli.plan_invalidations(cdns, {(DISTRIBUTION_ID, ORIGIN_NAME): 'v1'}, {}, lambda: entries) == {}
@@ -0,0 +1,141 @@
+import hashlib
+import os
+
+import cli
+import fake_aws as fake
+from static_deployer.common import journal, manifest, types
+from static_deployer.providers.storage import s3bucket
+
+FILES = {f'page{i}.html': f'<p>{i}</p>'.encode('utf-8') for i in range(8)}
+MiB = 1024 * 1024
+
+
+def entry(path: str) -> types.ManifestEntry:
+    return types.ManifestEntry(path=path, size=10, etag='0' * 32, content_type='text/html')
+
+
+def make_journal(tmp_path, root_dir: str = 'site', options=None) -> journal.UploadJournal:
+    return journal.UploadJournal(str(tmp_path / 'cache'), 'bucket', 'site/v1', root_dir, options)
+
+
+def write_journal(upload_journal: journal.UploadJournal, paths) -> None:
+    upload_journal.open()
+    for path in paths:
+        upload_journal.record((10, 1), entry(path))
+    upload_journal.close()
+
+
+def fail_uploads(backend, monkeypatch, failing_keys) -> None:
+    """Have the stand-in deny the uploads of some keys."""
+    put_object = backend._s3_PutObject
+
+    def put_or_deny(bucket_name, key, query, headers, body):
+        if key in failing_keys:
+            return fake._error(403, 'AccessDenied', 'Access Denied')
+        return put_object(bucket_name, key, query, headers, body)
+
+    monkeypatch.setattr(backend, '_s3_PutObject', put_or_deny)
+
+
+def test_entries_are_loaded_back(tmp_path):
+    write_journal(make_journal(tmp_path), ['a.html', 'b/c.html'])
+    loaded = make_journal(tmp_path).load()
+    assert loaded == {'a.html': ((10, 1), entry('a.html')), 'b/c.html': ((10, 1), entry('b/c.html'))}
+
+
+def test_journal_of_another_root_dir_is_discarded(tmp_path):
+    write_journal(make_journal(tmp_path), ['a.html'])
+    assert make_journal(tmp_path, root_dir='other').load() == {}
+    # Resuming with it starts a new journal.
+    write_journal(make_journal(tmp_path, root_dir='other'), [])
+    assert make_journal(tmp_path).load() == {}
+
+
+def test_journal_of_other_options_is_discarded(tmp_path):
+    options = types.UploadOptions()
+    write_journal(make_journal(tmp_path, options=options), ['a.html'])
+    assert len(make_journal(tmp_path, options=types.UploadOptions(concurrency=4)).load()) == 1
+    assert make_journal(tmp_path, options=types.UploadOptions(cache_maxage=60)).load() == {}
+    assert make_journal(tmp_path, options=types.UploadOptions(
+        transfer=types.TransferSettings(multipart_chunksize=16 * MiB))).load() == {}
+    assert make_journal(tmp_path, options=types.UploadOptions(
+        compression=types.CompressionSettings())).load() == {}
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    write_journal(make_journal(tmp_path), ['a.html', 'b.html'])
+    upload_journal = make_journal(tmp_path)
+    with open(upload_journal.file_name, 'a') as f:
+        f.write('{"path":"c.ht')
+    assert set(upload_journal.load()) == {'a.html', 'b.html'}
+
+    # Resuming appends after it.
+    upload_journal.open(resume=True)
+    upload_journal.record((10, 1), entry('d.html'))
+    upload_journal.close()
+    assert set(make_journal(tmp_path).load()) == {'a.html', 'b.html', 'd.html'}
+
+
+def test_resumed_deploy_only_uploads_the_remaining_files(site, fake_aws, monkeypatch):
+    site.write(FILES)
+    with monkeypatch.context() as patch:
+        fail_uploads(fake_aws, patch, {'site/v1/page2.html', 'site/v1/page5.html'})
+        assert not site.deploy('v1')
+    assert site.live_version() == ''
+    assert fake_aws.requests['PutObject'] == len(FILES)
+
+    fake_aws.reset_counts()
+    assert not site.deploy('v1'), 'the version exists, so it is only deployed again with resume'
+    assert site.deploy('v1', resume=True)
+    # The two files that failed, and the manifest.
+    assert fake_aws.requests['PutObject'] == 3
+    assert site.live_version() == 'site/v1'
+
+
+def test_deploy_of_changed_files_is_not_resumed(site, fake_aws, monkeypatch):
+    site.write(FILES)
+    with monkeypatch.context() as patch:
+        fail_uploads(fake_aws, patch, {'site/v1/page2.html'})
+        assert not site.deploy('v1')
+    site.write({'page3.html': b'<p>changed</p>'})
+
+    fake_aws.reset_counts()
+    assert site.deploy('v1', resume=True)
+    assert fake_aws.requests['PutObject'] == 3
+    assert fake_aws._objects[('bucket', 'site/v1/page3.html')].data == b'<p>changed</p>'
+
+
+def test_objects_without_entries_are_hashed_with_the_part_size_of_their_rule(site, fake_aws, monkeypatch):
+    # The parts are smaller than the default ones, so the ETag only matches when they are hashed the same way.
+    options = types.UploadOptions(concurrency=4, transfer_rules=[
+        types.TransferRule(pattern='*.bin', multipart_threshold=5 * MiB, multipart_chunksize=5 * MiB)])
+    site.write({'index.html': b'<p>index</p>', 'large.bin': os.urandom(12 * MiB)})
+    with monkeypatch.context() as patch:
+        fail_uploads(fake_aws, patch, {'site/v1/index.html'})
+        assert not site.deploy('v1', options)
+    assert fake_aws.requests['UploadPart'] == 3
+    # The journal is gone, as if the deploy had been interrupted on another machine.
+    os.remove(journal.UploadJournal(site.cache_dir, site.bucket_name, 'site/v1', site.root_dir, options).file_name)
+
+    fake_aws.reset_counts()
+    assert site.deploy('v1', options, resume=True)
+    assert fake_aws.requests['PutObject'] == 2
+    assert 'UploadPart' not in fake_aws.requests
+
+
+def test_objects_without_entries_are_uploaded_again_when_they_differ(tmp_path):
+    files = {'same.html': b'<p>same</p>', 'other.html': b'<p>local</p>'}
+    for path, content in files.items():
+        (tmp_path / path).write_bytes(content)
+    file_mappings = [types.FileMapping(local_path=path, remote_path=f'site/v1/{path}', size=len(content))
+                     for path, content in files.items()]
+    remote_objects = {
+        'same.html': types.RemoteObject(key='site/v1/same.html', size=11, etag=hashlib.md5(b'<p>same</p>').hexdigest()),
+        'other.html': types.RemoteObject(key='site/v1/other.html', size=12, etag='0' * 32),
+    }
+    options = types.UploadOptions()
+    manifest_writer = manifest.ManifestWriter({})
+    missing = cli.iter_missing_files(str(tmp_path), file_mappings, remote_objects, {}, manifest_writer,
+                                     s3bucket.TransferPolicy(options), s3bucket.MetadataPolicy(options))
+    assert [file_mapping.local_path for file_mapping in missing] == ['other.html']
+    assert [entry.path for entry in manifest_writer.entries()] == ['same.html']
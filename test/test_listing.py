@@ -0,0 +1,103 @@
+import collections
+
+import pytest
+from botocore.exceptions import ClientError
+
+import fake_aws as fake
+from static_deployer.providers.storage import s3bucket
+
+BUCKET_NAME = 'bucket'
+
+
+def store(backend, keys) -> None:
+    for key in keys:
+        backend._store(BUCKET_NAME, key, fake._Object(1, '0' * 32, b'x', {}))
+
+
+def nested_keys(prefix: str):
+    """Keys at every depth, including deeper than the shards are searched, with a directory spanning several pages."""
+    keys = [f'{prefix}index.html', f'{prefix}a/index.html', f'{prefix}a/b/c/d/e/deep.html', f'{prefix}z']
+    keys += [f'{prefix}a/b/page{i}.html' for i in range(1500)]
+    keys += [f'{prefix}{directory}/c/file{i}.js' for directory in ('x', 'y') for i in range(20)]
+    return keys
+
+
+def listed_keys(prefix: str, concurrency: int):
+    return collections.Counter(item.key for item in s3bucket.list_objects(BUCKET_NAME, prefix, concurrency))
+
+
+@pytest.mark.parametrize('concurrency', [1, 2, 4, 64])
+def test_each_object_is_listed_once(fake_aws, concurrency):
+    keys = nested_keys('site/v1/')
+    store(fake_aws, keys + ['site/v10/index.html', 'other/index.html'])
+    assert listed_keys('site/v1/', concurrency) == collections.Counter(keys)
+
+
+def test_whole_bucket_is_listed(fake_aws):
+    keys = nested_keys('site/v1/') + nested_keys('site/v2/') + ['robots.txt']
+    store(fake_aws, keys)
+    assert listed_keys('', 8) == collections.Counter(keys)
+
+
+def find_shards(prefix: str, num_shards: int):
+    found = []
+    shards = s3bucket._find_list_shards(s3bucket.create_client(), BUCKET_NAME, prefix, num_shards,
+                                        lambda item: found.append(item.key))
+    return shards, found
+
+
+def assert_covered(keys, shards, found) -> None:
+    """Each key is either found along the way or under a single shard, never both."""
+    for key in keys:
+        assert found.count(key) + sum(key.startswith(shard) for shard in shards) == 1, key
+
+
+@pytest.mark.parametrize('num_shards', [1, 3, 4, 1000])
+def test_shards_and_objects_found_along_the_way_cover_the_prefix(fake_aws, num_shards):
+    keys = nested_keys('site/')
+    store(fake_aws, keys)
+    shards, found = find_shards('site/', num_shards)
+    assert_covered(keys, shards, found)
+
+
+def test_shards_are_searched_level_by_level(fake_aws):
+    store(fake_aws, nested_keys('site/'))
+    assert find_shards('site/', 3) == (['site/a/', 'site/x/', 'site/y/'], ['site/index.html', 'site/z'])
+    # Too few sub-prefixes at each level, so the search stops after `MAX_LIST_SHARD_DEPTH` levels.
+    shards, found = find_shards('site/', 4)
+    assert shards == ['site/a/b/c/']
+    assert len(found) == 3 + 1500 + 40
+
+
+def test_flat_prefix_has_no_shards(fake_aws):
+    keys = [f'site/file{i}.html' for i in range(50)]
+    store(fake_aws, keys)
+    shards, found = find_shards('site/', 4)
+    assert shards == []
+    assert sorted(found) == sorted(keys)
+    assert listed_keys('site/', 4) == collections.Counter(keys)
+
+
+def test_empty_prefix_lists_nothing(fake_aws):
+    store(fake_aws, ['other/index.html'])
+    assert listed_keys('site/', 4) == collections.Counter()
+
+
+@pytest.mark.parametrize('failing_listing', [
+    # Listing a shard.
+    lambda query: query.get('prefix') == 'site/x/c/',
+    # Searching for the shards.
+    lambda query: query.get('prefix') == 'site/a/' and 'delimiter' in query,
+])
+def test_listing_errors_reach_the_caller(fake_aws, monkeypatch, failing_listing):
+    store(fake_aws, nested_keys('site/'))
+    list_objects = fake_aws._s3_ListObjectsV2
+
+    def list_or_deny(bucket_name, key, query, headers, body):
+        if failing_listing(query):
+            return fake._error(403, 'AccessDenied', 'Access Denied')
+        return list_objects(bucket_name, key, query, headers, body)
+
+    monkeypatch.setattr(fake_aws, '_s3_ListObjectsV2', list_or_deny)
+    with pytest.raises(ClientError):
+        list(s3bucket.list_objects(BUCKET_NAME, 'site/', 4))
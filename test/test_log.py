@@ -0,0 +1,17 @@
+import logging
+
+from static_deployer.common import log
+
+
+def test_debug_records_are_not_built_below_debug_level(monkeypatch):
+    built = []
+    monkeypatch.setattr(log, '_make_debug_record', lambda message: built.append(message))
+    monkeypatch.setattr(log.logger, 'level', logging.INFO)
+    log.debug('hidden')
+    assert built == []
+
+
+def test_debug_records_are_handled_at_debug_level(caplog):
+    with caplog.at_level(logging.DEBUG, logger=log.logger.name):
+        log.debug('shown')
+    assert [(record.levelno, record.getMessage()) for record in caplog.records] == [(logging.DEBUG, 'shown')]
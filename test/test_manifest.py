@@ -0,0 +1,47 @@
+import fake_aws as fake
+
+from static_deployer.common import manifest, types
+from static_deployer.providers.storage import s3bucket
+
+BUCKET_NAME = 'bucket'
+
+
+def write_manifest(paths):
+    writer = manifest.ManifestWriter()
+    for path in paths:
+        writer.add(types.ManifestEntry(path=path, size=1, etag='e' * 32))
+    return writer
+
+
+def store_file(backend, key: str, modified_at: float = 1000.0):
+    obj = fake._Object(1, 'e' * 32, b'x', {})
+    obj.modified_at = modified_at
+    backend._store(BUCKET_NAME, key, obj)
+
+
+def test_manifest_key_is_outside_the_version():
+    assert s3bucket.manifest_key('site/v2') == 'site/.static-deployer/v2.jsonl.gz'
+    assert s3bucket.manifest_key('/site/v2/') == 'site/.static-deployer/v2.jsonl.gz'
+    assert s3bucket.manifest_key('v2') == '.static-deployer/v2.jsonl.gz'
+
+
+def test_uploaded_manifest_is_not_served_with_the_version(fake_aws):
+    assert s3bucket.upload_manifest(BUCKET_NAME, 'site/v2', write_manifest(['index.html', 'app.js']))
+    assert not any(key.startswith('site/v2/') for (_, key) in fake_aws._objects)
+    assert sorted(s3bucket.index_manifest(BUCKET_NAME, 'site/v2')) == ['app.js', 'index.html']
+    assert s3bucket.index_objects(BUCKET_NAME, 'site/v2') == {}
+
+
+def test_reads_manifests_stored_in_the_version_by_older_releases(fake_aws):
+    fileobj = write_manifest(['index.html']).close()
+    fake_aws._store(BUCKET_NAME, f'site/v1/{manifest.MANIFEST_NAME}', fake._Object(0, 'e' * 32, fileobj.read(), {}))
+    assert sorted(s3bucket.index_manifest(BUCKET_NAME, 'site/v1')) == ['index.html']
+
+
+def test_manifest_folder_is_not_a_version(fake_aws):
+    store_file(fake_aws, 'site/v1/index.html')
+    store_file(fake_aws, 'site/v2/index.html')
+    assert s3bucket.upload_manifest(BUCKET_NAME, 'site/v1', write_manifest(['index.html']))
+    assert sorted(s3bucket.list_versions(BUCKET_NAME, 'site/')) == ['v1', 'v2']
+    assert list(s3bucket.iter_version_keys(BUCKET_NAME, ['site/v1'])) == [
+        'site/.static-deployer/v1.jsonl.gz', f'site/v1/{manifest.MANIFEST_NAME}', 'site/v1/index.html']
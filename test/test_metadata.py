@@ -0,0 +1,41 @@
+import mimetypes
+
+from static_deployer.common import types
+from static_deployer.providers.storage import s3bucket
+
+
+def make_policy(*rules, cache_maxage=None):
+    return s3bucket.MetadataPolicy(types.UploadOptions(cache_maxage=cache_maxage, metadata_rules=list(rules)))
+
+
+def test_rules_after_patterns_with_many_wildcards_are_found():
+    policy = make_policy(
+        types.MetadataRule(pattern='docs/*/[a-c]*-v?.pdf', content_disposition='attachment'),
+        types.MetadataRule(pattern='*.[jt]s', cache_control='no-store'),
+        types.MetadataRule(pattern='*.html', cache_control='no-cache'),
+    )
+    assert policy.lookup('docs/guides/b-intro-v2.pdf') == {'ContentType': 'application/pdf',
+                                                           'ContentDisposition': 'attachment'}
+    assert policy.lookup('app.js')['CacheControl'] == 'no-store'
+    assert policy.lookup('docs/index.html') == {'CacheControl': 'no-cache', 'ContentType': 'text/html'}
+    # `*` also matches '/'.
+    assert policy.lookup('deep/er/index.html')['CacheControl'] == 'no-cache'
+
+
+def test_first_matching_rule_wins():
+    policy = make_policy(
+        types.MetadataRule(pattern='assets/*.css', cache_control='max-age=60', content_type='text/css; charset=utf-8'),
+        types.MetadataRule(pattern='assets/*', cache_control='immutable', metadata={'team': 'web'}),
+    )
+    assert policy.lookup('assets/site.css') == {'CacheControl': 'max-age=60', 'ContentType': 'text/css; charset=utf-8'}
+    assert policy.lookup('assets/logo.png') == {'CacheControl': 'immutable', 'ContentType': 'image/png',
+                                                'Metadata': {'team': 'web'}}
+
+
+def test_defaults_apply_when_no_rule_matches():
+    policy = make_policy(types.MetadataRule(pattern='*.html', cache_control='no-cache'), cache_maxage=3600)
+    assert policy.lookup('app.js', 'gzip') == {'CacheControl': 'public, max-age=3600', 'ContentType': mimetypes.guess_type('app.js')[0],
+                                               'ContentEncoding': 'gzip'}
+    assert make_policy().lookup('data.unknownext') == {}
+    assert make_policy(cache_maxage=60).lookup('index.html') == {'CacheControl': 'public, max-age=60',
+                                                                 'ContentType': 'text/html'}
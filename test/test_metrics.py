@@ -0,0 +1,31 @@
+import pytest
+
+from static_deployer.common import metrics
+
+
+def test_empty_histogram_has_no_quantile():
+    assert metrics.Histogram().quantile(0.5) is None
+
+
+def test_quantiles_are_interpolated_inside_their_bucket():
+    histogram = metrics.Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in (1.2, 1.4, 1.6, 1.8):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(1.8)
+
+
+def test_quantiles_skip_empty_buckets():
+    histogram = metrics.Histogram(buckets=(1.0, 2.0, 4.0))
+    histogram.observe(0.5)
+    histogram.observe(3.0)
+    assert histogram.quantile(0.25) == pytest.approx(0.5)
+    assert histogram.quantile(0.75) == pytest.approx(3.0)
+
+
+def test_quantiles_above_every_bucket_stop_at_the_max():
+    histogram = metrics.Histogram(buckets=(1.0,))
+    for value in (10.0, 20.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(10.5)
+    assert histogram.quantile(0.99) <= 20.0
@@ -0,0 +1,43 @@
+import fake_aws as fake
+
+import cli
+from static_deployer.common import types
+from static_deployer.providers.cdn import cloudfront
+
+BUCKET_NAME = 'bucket'
+DISTRIBUTION_ID = 'ETEST'
+ORIGIN_NAME = 'website'
+
+
+def store_versions(backend, parent_prefix: str, versions):
+    """Store a file for each version, the first one being the oldest."""
+    for index, version in enumerate(versions):
+        obj = fake._Object(1, 'e' * 32, b'x', {})
+        obj.modified_at = 1000.0 + index
+        backend._store(BUCKET_NAME, f'{parent_prefix}{version}/index.html', obj)
+
+
+def remaining_versions(backend, parent_prefix: str):
+    return sorted({key[len(parent_prefix):].split('/')[0] for (_, key) in backend._objects if key.startswith(parent_prefix)})
+
+
+def prune(bucket_prefix: str, keep: int, force: bool = False) -> bool:
+    spec = types.PruneSpec(storage=types.StorageDetails(name=BUCKET_NAME, prefix=bucket_prefix),
+                           cdns=[types.CdnDetails(distribution_id=DISTRIBUTION_ID, origin_name=ORIGIN_NAME)])
+    return cli.run_prune(spec, types.PruneOptions(keep=keep, force=force))
+
+
+def test_keeps_live_version_with_trailing_slash_in_prefix(fake_aws):
+    store_versions(fake_aws, 'site/', ['v1', 'v2', 'v3', 'v4'])
+    assert cloudfront.submit_distribution_update(DISTRIBUTION_ID, ORIGIN_NAME, 'site/v2')
+    assert prune('site/{{version}}/', keep=1)
+    assert remaining_versions(fake_aws, 'site/') == ['v2', 'v4']
+
+
+def test_refuses_versions_at_bucket_root_unless_forced(fake_aws):
+    store_versions(fake_aws, '', ['v1', 'v2', 'v3'])
+    assert cloudfront.submit_distribution_update(DISTRIBUTION_ID, ORIGIN_NAME, 'v3')
+    assert not prune('{{version}}', keep=1)
+    assert remaining_versions(fake_aws, '') == ['v1', 'v2', 'v3']
+    assert prune('{{version}}', keep=1, force=True)
+    assert remaining_versions(fake_aws, '') == ['v3']
@@ -0,0 +1,68 @@
+import time
+
+# Few of the files change, so they are invalidated one by one rather than all at once.
+V1_FILES = {'index.html': b'<p>v1</p>', 'app.js': b'v1()', **{f'page{i}.html': f'<p>{i}</p>'.encode() for i in range(8)}}
+V2_FILES = {'index.html': b'<p>v2</p>', 'app.js': b'v2()'}
+
+
+def deploy_versions(site) -> None:
+    site.write(V1_FILES)
+    assert site.deploy('v1')
+    site.write(V2_FILES)
+    assert site.deploy('v2')
+
+
+def invalidated_paths(fake_aws, site):
+    return [sorted(paths) for _, _, paths in fake_aws._distributions[site.distribution_id].invalidations.values()]
+
+
+def test_rollback_to_the_live_version_does_nothing(site, fake_aws):
+    deploy_versions(site)
+    fake_aws.reset_counts()
+    num_invalidations = len(invalidated_paths(fake_aws, site))
+
+    assert site.rollback('v2')
+    requests = fake_aws.reset_counts()
+    assert 'UpdateDistribution' not in requests
+    assert 'CreateInvalidation' not in requests
+    assert len(invalidated_paths(fake_aws, site)) == num_invalidations
+    assert site.live_version() == 'site/v2'
+
+
+def test_rollback_only_invalidates_the_files_that_differ(site, fake_aws):
+    deploy_versions(site)
+    fake_aws.reset_counts()
+
+    assert site.rollback('v1')
+    requests = fake_aws.reset_counts()
+    assert requests['UpdateDistribution'] == 1
+    assert requests['CreateInvalidation'] == 1
+    # The index is also served as the directory.
+    assert invalidated_paths(fake_aws, site)[-1] == ['/', '/app.js', '/index.html']
+    assert site.live_version() == 'site/v1'
+
+
+def test_rollback_without_waiting_does_not_poll(site, fake_aws):
+    deploy_versions(site)
+    fake_aws.deploy_seconds = 60
+    fake_aws.invalidation_seconds = 60
+    fake_aws.reset_counts()
+
+    started_at = time.monotonic()
+    assert site.rollback('v1', wait=False)
+    assert time.monotonic() - started_at < 10
+    requests = fake_aws.reset_counts()
+    assert requests['UpdateDistribution'] == 1
+    assert requests['CreateInvalidation'] == 1
+    assert 'GetInvalidation' not in requests
+    assert site.live_version() == 'site/v1'
+    assert fake_aws._distributions[site.distribution_id].status() == 'InProgress'
+
+
+def test_rollback_to_a_missing_version_fails(site, fake_aws):
+    deploy_versions(site)
+    fake_aws.reset_counts()
+
+    assert not site.rollback('v3')
+    assert 'UpdateDistribution' not in fake_aws.reset_counts()
+    assert site.live_version() == 'site/v2'
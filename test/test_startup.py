@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+# Modules only imported when a command uses them.
+LAZY_MODULES = ('boto3', 'botocore', 'toml')
+
+
+def test_cli_import_leaves_heavy_dependencies_out():
+    code = (f'import sys; sys.path.insert(0, {SRC_DIR!r}); import cli;'
+            f' print(",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    assert output.strip() == ''
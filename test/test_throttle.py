@@ -0,0 +1,65 @@
+import threading
+import time
+
+from static_deployer.common import throttle
+
+
+def start_acquire(budget: throttle.ConcurrencyBudget, slots: int):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('slots', budget.acquire(slots)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_acquire_caps_slots_to_total():
+    budget = throttle.ConcurrencyBudget(4)
+    assert budget.acquire(10) == 4
+    budget.release(4)
+    assert budget.acquire(2) == 2
+
+
+def test_waiters_are_served_in_order():
+    budget = throttle.ConcurrencyBudget(4)
+    budget.acquire(3)
+    large, large_result = start_acquire(budget, 4)
+    time.sleep(0.05)
+    small, small_result = start_acquire(budget, 1)
+    time.sleep(0.05)
+    # A slot is free, but the small request is queued behind the large one.
+    assert 'slots' not in large_result and 'slots' not in small_result
+    budget.release(3)
+    large.join(1)
+    assert large_result == {'slots': 4}
+    assert 'slots' not in small_result
+    budget.release(4)
+    small.join(1)
+    assert small_result == {'slots': 1}
+
+
+def test_shrink_while_waiting():
+    budget = throttle.ConcurrencyBudget(32)
+    budget.acquire(30)
+    multipart, multipart_result = start_acquire(budget, 10)
+    time.sleep(0.05)
+    later, later_result = start_acquire(budget, 1)
+    time.sleep(0.05)
+    assert 'slots' not in multipart_result
+    # Throttled: the limiter shrinks the budget below the size of the waiting request.
+    budget.resize(1)
+    budget.release(30)
+    multipart.join(1)
+    assert multipart_result == {'slots': 1}
+    budget.release(1)
+    later.join(1)
+    assert later_result == {'slots': 1}
+
+
+def test_grow_wakes_waiters():
+    budget = throttle.ConcurrencyBudget(1)
+    budget.acquire(1)
+    waiter, result = start_acquire(budget, 1)
+    time.sleep(0.05)
+    assert 'slots' not in result
+    budget.resize(2)
+    waiter.join(1)
+    assert result == {'slots': 1}
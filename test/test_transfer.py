@@ -0,0 +1,64 @@
+from s3transfer.utils import ChunksizeAdjuster
+
+from static_deployer.common import types
+from static_deployer.providers.storage import s3bucket
+
+MIB = 1024 * 1024
+BUCKET_NAME = 'bucket'
+
+
+def make_policy(**kwargs):
+    options = types.UploadOptions(transfer_rules=[
+        types.TransferRule(pattern='*.mp4', multipart_chunksize=64 * MIB, max_concurrency=4),
+        types.TransferRule(pattern='video/*', multipart_threshold=16 * MIB),
+        types.TransferRule(pattern='*.wasm', max_concurrency=1),
+    ], **kwargs)
+    return s3bucket.TransferPolicy(options)
+
+
+def test_first_matching_rule_wins_and_falls_back_to_the_defaults():
+    policy = make_policy()
+    settings, config = policy.lookup('video/intro.mp4')
+    assert settings == types.TransferSettings(multipart_chunksize=64 * MIB, max_concurrency=4)
+    assert (config.multipart_chunksize, config.max_concurrency, config.use_threads) == (64 * MIB, 4, True)
+    # fnmatch's `*` also matches '/'.
+    assert policy.lookup('video/raw/intro.webm')[0].multipart_threshold == 16 * MIB
+    settings, config = policy.lookup('app.wasm')
+    assert settings.max_concurrency == 1 and not config.use_threads
+    assert policy.lookup('index.html')[0] == types.TransferSettings()
+
+
+def test_part_size():
+    policy = make_policy(small_file_threshold=10 * MIB)
+    settings = types.TransferSettings(multipart_threshold=8 * MIB, multipart_chunksize=8 * MIB)
+    # Below the small file threshold, even above the multipart threshold.
+    assert policy.part_size(settings, 9 * MIB) == 0
+    assert policy.part_size(settings, 10 * MIB) == 8 * MIB
+    # S3 allows at most 10000 parts, so the parts of huge files are larger.
+    huge = 100000 * MIB
+    assert policy.part_size(settings, huge) == ChunksizeAdjuster().adjust_chunksize(8 * MIB, huge) > 8 * MIB
+
+
+def test_limit_caps_the_part_threads():
+    policy = make_policy()
+    settings, config = policy.lookup('index.html')
+    assert policy.limit(settings, config, 32) is config
+    limited = policy.limit(settings, config, 4)
+    assert (limited.max_concurrency, limited.multipart_chunksize) == (4, config.multipart_chunksize)
+    assert not policy.limit(settings, config, 1).use_threads
+
+
+def test_multipart_uploads_run_no_more_part_threads_than_the_concurrency(fake_aws, tmp_path, monkeypatch):
+    (tmp_path / 'large.bin').write_bytes(b'x' * 2 * MIB)
+    part_threads = []
+
+    def upload_file(*args, transfer_config=None, part_size=0, **kwargs):
+        part_threads.append((transfer_config.max_concurrency, part_size))
+        return 'e' * 32
+
+    monkeypatch.setattr(s3bucket, 'upload_file', upload_file)
+    options = types.UploadOptions(concurrency=4, small_file_threshold=MIB,
+                                  transfer=types.TransferSettings(multipart_threshold=MIB, max_concurrency=10))
+    file_mapping = types.FileMapping(local_path='large.bin', remote_path='v1/large.bin', size=2 * MIB)
+    assert s3bucket.upload_files(str(tmp_path), BUCKET_NAME, [file_mapping], options)
+    assert part_threads == [(4, 8 * MIB)]
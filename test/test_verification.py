@@ -0,0 +1,112 @@
+import hashlib
+
+import pytest
+
+import cli
+from static_deployer.common import manifest, types
+
+BUCKET_NAME = 'bucket'
+PREFIX = 'site/v1'
+FILES = {'index.html': b'<html></html>', 'docs/guide.html': b'<p>guide</p>', 'app.js': b'run()'}
+
+
+def store(backend, files, prefix: str = PREFIX):
+    import fake_aws as fake
+    for path, content in files.items():
+        backend._store(BUCKET_NAME, f'{prefix}/{path}', fake._Object(len(content), hashlib.md5(content).hexdigest(), content, {}))
+
+
+def entries(files):
+    return [types.ManifestEntry(path=path, size=len(content), etag=hashlib.md5(content).hexdigest())
+            for path, content in files.items()]
+
+
+def remove(backend, key: str):
+    del backend._objects[(BUCKET_NAME, key)]
+    backend._sorted_keys[BUCKET_NAME].remove(key)
+
+
+def test_matching_version_passes(fake_aws):
+    store(fake_aws, FILES)
+    assert cli.verify_version(BUCKET_NAME, PREFIX, entries(FILES), num_local_files=len(FILES))
+
+
+def test_objects_outside_the_version_are_only_reported(fake_aws):
+    store(fake_aws, {**FILES, 'leftover.html': b'old'})
+    store(fake_aws, {'index.html': b'other version'}, prefix='site/v10')
+    assert cli.verify_version(BUCKET_NAME, PREFIX, entries(FILES), num_local_files=len(FILES))
+
+
+def test_missing_object_fails(fake_aws):
+    store(fake_aws, FILES)
+    remove(fake_aws, f'{PREFIX}/docs/guide.html')
+    assert not cli.verify_version(BUCKET_NAME, PREFIX, entries(FILES))
+
+
+@pytest.mark.parametrize('attribute, value', [('size', 1), ('etag', '0' * 32)])
+def test_different_object_fails(fake_aws, attribute, value):
+    store(fake_aws, FILES)
+    setattr(fake_aws._objects[(BUCKET_NAME, f'{PREFIX}/app.js')], attribute, value)
+    assert not cli.verify_version(BUCKET_NAME, PREFIX, entries(FILES))
+
+
+def test_local_file_without_entry_fails(fake_aws):
+    store(fake_aws, FILES)
+    assert not cli.verify_version(BUCKET_NAME, PREFIX, entries(FILES), num_local_files=len(FILES) + 1)
+
+
+def corrupt_uploads(backend, monkeypatch, corrupt):
+    """Have the stand-in accept the uploads of `app.js`, then `corrupt` the object."""
+    put_object = backend._s3_PutObject
+
+    def put_and_corrupt(bucket_name, key, query, headers, body):
+        response = put_object(bucket_name, key, query, headers, body)
+        if key.endswith('/app.js'):
+            corrupt(key)
+        return response
+
+    monkeypatch.setattr(backend, '_s3_PutObject', put_and_corrupt)
+
+
+@pytest.mark.parametrize('corruption', ['dropped', 'size', 'etag'])
+def test_deploy_fails_before_switching_the_cdn_when_an_upload_is_lost(site, fake_aws, monkeypatch, corruption):
+    def corrupt(key):
+        if corruption == 'dropped':
+            remove(fake_aws, key)
+        else:
+            setattr(fake_aws._objects[(BUCKET_NAME, key)], corruption, {'size': 1, 'etag': '0' * 32}[corruption])
+
+    site.write(FILES)
+    corrupt_uploads(fake_aws, monkeypatch, corrupt)
+    assert not site.deploy('v1')
+    assert site.live_version() == ''
+    assert fake_aws.requests.get('UpdateDistribution', 0) == 0
+
+
+def test_deploy_fails_when_a_local_file_is_not_uploaded(site, fake_aws, monkeypatch):
+    add = manifest.ManifestWriter.add
+
+    def add_all_but_app_js(self, entry):
+        if entry.path != 'app.js':
+            add(self, entry)
+
+    site.write(FILES)
+    monkeypatch.setattr(manifest.ManifestWriter, 'add', add_all_but_app_js)
+    assert not site.deploy('v1')
+    assert site.live_version() == ''
+
+
+def test_deploy_switches_the_cdn_once_verified(site, fake_aws):
+    site.write(FILES)
+    assert site.deploy('v1')
+    assert site.live_version() == PREFIX
+
+
+def test_fast_timestamp_parser_is_kept_to_s3_clients(fake_aws):
+    import boto3
+
+    from static_deployer.providers.storage import s3bucket
+    s3_client = s3bucket.create_client()
+    cloudfront_client = boto3.client('cloudfront')
+    assert s3_client._endpoint._response_parser_factory is not cloudfront_client._endpoint._response_parser_factory
+    assert 'timestamp_parser' not in cloudfront_client._endpoint._response_parser_factory._defaults
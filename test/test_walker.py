@@ -0,0 +1,35 @@
+import os
+
+from static_deployer.common import walker
+
+
+def walk(root_dir: str, patterns, exclude_patterns=None):
+    matcher = walker.PatternMatcher(patterns, exclude_patterns)
+    return sorted(os.path.relpath(entry.path, root_dir).replace(os.sep, '/') for entry in walker.walk(root_dir, matcher))
+
+
+def write(path, content: str = 'x'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_patterns(tmp_path):
+    for name in ['index.html', 'css/site.css', 'js/app.js', 'js/vendor/lib.js', '.hidden/secret.js', 'node_modules/x/y.js']:
+        write(tmp_path / name)
+    assert walk(str(tmp_path), ['**/*.js'], ['node_modules/**']) == ['js/app.js', 'js/vendor/lib.js']
+    assert walk(str(tmp_path), ['*.html', 'css/*']) == ['css/site.css', 'index.html']
+
+
+def test_follows_links_to_directories_found_elsewhere(tmp_path):
+    write(tmp_path / 'shared/logo.png')
+    os.symlink(tmp_path / 'shared', tmp_path / 'images')
+    assert walk(str(tmp_path), ['**/*']) == ['images/logo.png', 'shared/logo.png']
+
+
+def test_skips_links_to_ancestors(tmp_path):
+    write(tmp_path / 'docs/index.html')
+    os.symlink(tmp_path, tmp_path / 'docs/root')
+    os.symlink(tmp_path / 'docs', tmp_path / 'docs/self')
+    os.symlink(tmp_path / 'docs', tmp_path / 'alias')
+    # `alias/root` and `alias/self` loop back to `alias` or the root, unlike `alias` itself.
+    assert walk(str(tmp_path), ['**/*']) == ['alias/index.html', 'docs/index.html']
@@ -0,0 +1,31 @@
+from static_deployer.common import types
+from static_deployer.providers.cdn import warmup
+
+
+def entry(path: str, size: int = 1, content_type=None):
+    return types.ManifestEntry(path=path, size=size, etag='e' * 32, content_type=content_type)
+
+
+ENTRIES = [
+    entry('assets/app.js', 5000),
+    entry('docs/guide/intro.html', 300),
+    entry('assets/logo.png', 20000),
+    entry('docs/index.html', 200),
+    entry('about', 100, content_type='text/html; charset=utf-8'),
+    entry('index.html', 400),
+    entry('assets/small.css', 10),
+]
+
+
+def test_pages_come_first_from_the_shallowest_then_the_largest_assets():
+    assert warmup.plan_warmup(lambda: ENTRIES, 10) == [
+        '/', '/about', '/docs/', '/docs/guide/intro.html', '/assets/logo.png', '/assets/app.js', '/assets/small.css']
+
+
+def test_max_files_caps_pages_then_assets():
+    assert warmup.plan_warmup(lambda: ENTRIES, 5) == ['/', '/about', '/docs/', '/docs/guide/intro.html', '/assets/logo.png']
+    assert warmup.plan_warmup(lambda: ENTRIES, 2) == ['/', '/about']
+
+
+def test_url_paths_are_quoted():
+    assert warmup.plan_warmup(lambda: [entry('a b/c.js')], 1) == ['/a%20b/c.js']